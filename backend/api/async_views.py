@@ -0,0 +1,72 @@
+import asyncio
+import contextvars
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import nullcontext
+from functools import partial, wraps
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import close_old_connections
+from django.urls import URLPattern
+
+from backend.db.health import check_connections
+
+# Async-обёртки синхронных вьюх DRF для запуска под ASGI. В Django 3.2
+# нет async ORM, а синхронные вьюхи под ASGI выполняются в одном общем
+# потоке процесса (thread_sensitive) — по одной за раз. pooled() отдаёт
+# безопасные запросы ограниченному пулу потоков: чтения идут параллельно,
+# а соединений с БД у процесса не больше ASYNC_READ_WORKERS.
+SAFE_METHODS = ('GET', 'HEAD', 'OPTIONS')
+# имена маршрутов роутера, чтение которых идёт через пул
+READ_ROUTES = frozenset((
+    'recipes-list', 'recipes-detail',
+    'tags-list', 'tags-detail',
+    'ingredients-list', 'ingredients-detail',
+))
+
+executor = ThreadPoolExecutor(
+    max_workers=settings.ASYNC_READ_WORKERS,
+    thread_name_prefix='async-read')
+
+
+def run_view(view, request, *args, **kwargs):
+    """ Вьюха вместе с рендерингом ответа, в потоке пула. Соединение
+    потока проверяется и закрывается, как по request_started и
+    request_finished в синхронном режиме. """
+    metrics = getattr(request, '_metrics', None)
+    check_connections()
+    try:
+        with metrics.collect() if metrics else nullcontext():
+            response = view(request, *args, **kwargs)
+            if callable(getattr(response, 'render', None)):
+                request._metrics_view_finished = time.perf_counter()
+                response.render()
+        return response
+    finally:
+        close_old_connections()
+
+
+def pooled(view):
+    """ Безопасные методы — в пуле потоков, параллельно; остальные —
+    как обычная синхронная вьюха под ASGI. """
+    @wraps(view)
+    async def async_view(request, *args, **kwargs):
+        call = partial(run_view, view, request, *args, **kwargs)
+        if request.method in SAFE_METHODS:
+            # run_in_executor не переносит contextvars (реплику для
+            # чтения из ReplicaRoutingMiddleware), в отличие от
+            # sync_to_async
+            return await asyncio.get_running_loop().run_in_executor(
+                executor, partial(contextvars.copy_context().run, call))
+        return await sync_to_async(call)()
+    return async_view
+
+
+def pooled_patterns(patterns, names=READ_ROUTES):
+    """ Маршруты роутера, в которых вьюхи из names обёрнуты pooled(). """
+    return [
+        URLPattern(pattern.pattern, pooled(pattern.callback),
+                   pattern.default_args, pattern.name)
+        if pattern.name in names else pattern
+        for pattern in patterns]
@@ -0,0 +1,153 @@
+import hashlib
+import threading
+import time
+from urllib.parse import urlencode
+
+from django.conf import settings
+from django.core.cache import cache
+from rest_framework.response import Response
+
+from backend.db.routers import primary_reads
+
+FEED_PREFIX = 'recipe_feed'
+FEED_VERSION_KEY = f'{FEED_PREFIX}:version'
+FEED_HITS_KEY = f'{FEED_PREFIX}:hits'
+FEED_MISSES_KEY = f'{FEED_PREFIX}:misses'
+TABLE_PREFIX = 'table'
+
+
+def incr_counter(key, initial=0):
+    """ Атомарный счётчик в кеше (для Redis/Memcached — без гонок). """
+    cache.add(key, initial, None)
+    try:
+        return cache.incr(key)
+    except ValueError:
+        # ключ успел вытесниться между add и incr
+        cache.set(key, initial + 1, None)
+        return initial + 1
+
+
+def initial_version():
+    # микросекунды: меньше 2**53, incr в django-redis (скрипт Lua,
+    # числа double) возвращает их без потери точности
+    return time.time_ns() // 1000
+
+
+def get_version(key):
+    """ Версия набора закешированных данных. Начальное значение — время,
+    чтобы вытесненный из кеша счётчик не совпал ни с одной старой версией.
+    """
+    return cache.get_or_set(key, initial_version, None)
+
+
+def bump_version(key):
+    return incr_counter(key, initial=initial_version())
+
+
+def table_states(*tables):
+    """ {таблица: (версия, время изменения)} одним обращением к кешу.
+    Из них строятся ETag и Last-Modified ответов (api.conditional). """
+    keys = {table: (f'{TABLE_PREFIX}:{table}:version',
+                    f'{TABLE_PREFIX}:{table}:modified') for table in tables}
+    found = cache.get_many([key for pair in keys.values() for key in pair])
+    states = {}
+    for table, (version_key, modified_key) in keys.items():
+        version = found.get(version_key)
+        if version is None:
+            version = get_version(version_key)
+        modified = found.get(modified_key)
+        if modified is None:
+            # время неизвестно — считаем, что таблица изменилась сейчас
+            modified = cache.get_or_set(modified_key, time.time, None)
+        states[table] = (version, modified)
+    return states
+
+
+def touch_tables(*tables):
+    """ Таблицы изменились: новые ETag и Last-Modified у их ответов. """
+    now = time.time()
+    cache.set_many(
+        {f'{TABLE_PREFIX}:{table}:modified': now for table in tables}, None)
+    for table in tables:
+        bump_version(f'{TABLE_PREFIX}:{table}:version')
+
+
+class ProcessLocalSnapshot:
+    """ Данные в памяти процесса, собранные из БД методом build().
+
+    Версия лежит в общем кеше: invalidate() в одном процессе заставляет
+    все процессы лениво пересобрать свою копию при следующем обращении.
+    """
+    version_key = None
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._version = None
+
+    def build(self):
+        raise NotImplementedError
+
+    def ensure_fresh(self):
+        version = get_version(self.version_key)
+        if version != self._version:
+            with self._lock:
+                if version != self._version:
+                    with primary_reads():
+                        self.build()
+                    self._version = version
+
+    @classmethod
+    def invalidate(cls):
+        bump_version(cls.version_key)
+
+
+def feed_version():
+    return get_version(FEED_VERSION_KEY)
+
+
+def invalidate_recipe_feed():
+    """ Сбрасывает все страницы ленты разом: меняется версия в ключах,
+    старые записи просто доживают свой timeout. """
+    bump_version(FEED_VERSION_KEY)
+
+
+def feed_cache_key(request):
+    """ Ключ по нормализованным query params: порядок параметров
+    и повторяющихся значений (?tags=a&tags=b) не важен. Адрес хешируется:
+    длинные фильтры не должны выводить ключ за 250 символов Memcached. """
+    params = sorted(
+        (key, value)
+        for key in request.query_params
+        for value in request.query_params.getlist(key)
+        if value != ''
+    )
+    url = f'{request.get_host()}{request.path}?{urlencode(params)}'
+    digest = hashlib.sha256(url.encode()).hexdigest()
+    return f'{FEED_PREFIX}:v{feed_version()}:{digest}'
+
+
+def feed_cache_stats():
+    return {
+        'hits': cache.get(FEED_HITS_KEY, 0),
+        'misses': cache.get(FEED_MISSES_KEY, 0),
+    }
+
+
+class AnonymousFeedCacheMixin:
+    """ Кеширует list() для анонимов: у них нет флагов избранного,
+    корзины и подписок, поэтому ответ одинаков для всех. """
+    def list(self, request, *args, **kwargs):
+        if request.user.is_authenticated:
+            return super().list(request, *args, **kwargs)
+        key = feed_cache_key(request)
+        data = cache.get(key)
+        if data is not None:
+            incr_counter(FEED_HITS_KEY)
+            return Response(data, headers={'X-Cache': 'HIT'})
+        incr_counter(FEED_MISSES_KEY)
+        with primary_reads():
+            response = super().list(request, *args, **kwargs)
+        if response.status_code == 200:
+            cache.set(key, response.data, settings.RECIPE_FEED_CACHE_TIMEOUT)
+        response['X-Cache'] = 'MISS'
+        return response
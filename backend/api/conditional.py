@@ -0,0 +1,58 @@
+import hashlib
+
+from django.utils.cache import (get_conditional_response, patch_cache_control,
+                                patch_vary_headers)
+from django.utils.http import http_date, quote_etag
+
+
+class ConditionalGetMixin:
+    """ ETag и Last-Modified для GET/HEAD.
+
+    Валидаторы считаются в initial(), когда пользователь и формат ответа
+    уже известны. При совпадении с If-None-Match / If-Modified-Since
+    обработчик действия не вызывается: ни выборки, ни сериализации.
+    """
+    cache_control = {}
+    vary_headers = ('Accept',)
+
+    def get_validators(self, request, *args, **kwargs):
+        """ (части ETag, Last-Modified в секундах или None) либо None,
+        если ответ действия не кешируется. """
+        return None
+
+    def initial(self, request, *args, **kwargs):
+        super().initial(request, *args, **kwargs)
+        self.conditional = None
+        if request.method not in ('GET', 'HEAD'):
+            return
+        validators = self.get_validators(request, *args, **kwargs)
+        if validators is None:
+            return
+        parts, last_modified = validators
+        source = '|'.join(map(str, (
+            request.get_full_path(), request.accepted_media_type, *parts)))
+        etag = quote_etag(hashlib.md5(source.encode()).hexdigest())
+        self.conditional = (etag, last_modified)
+        not_modified = get_conditional_response(
+            request, etag=etag,
+            last_modified=last_modified and int(last_modified))
+        if not_modified is not None:
+            # dispatch() вызовет вместо действия готовый ответ 304
+            setattr(self, request.method.lower(),
+                    lambda *args, **kwargs: not_modified)
+
+    def get_cache_control(self, request):
+        return self.cache_control
+
+    def finalize_response(self, request, response, *args, **kwargs):
+        response = super().finalize_response(
+            request, response, *args, **kwargs)
+        conditional = getattr(self, 'conditional', None)
+        if conditional and response.status_code in (200, 304):
+            etag, last_modified = conditional
+            response['ETag'] = etag
+            if last_modified:
+                response['Last-Modified'] = http_date(last_modified)
+            patch_cache_control(response, **self.get_cache_control(request))
+            patch_vary_headers(response, self.vary_headers)
+        return response
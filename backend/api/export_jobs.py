@@ -0,0 +1,136 @@
+# isort: skip_file
+import logging
+import multiprocessing
+import time
+import uuid
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.files.base import ContentFile
+from django.db import connection, transaction
+from django.utils import timezone
+
+from api.exporters import pdf_cache_key, shopping_list_queryset
+from api.pdf import render_pdf_bytes, shopping_list_digest
+from recipes.models import ExportJob
+
+logger = logging.getLogger(__name__)
+
+ACTIVE = (ExportJob.PENDING, ExportJob.RUNNING)
+# шаг опроса БД при long-poll статуса, сек.
+POLL_INTERVAL = 0.25
+
+_threads = None
+_processes = None
+
+
+def process_pool(workers):
+    """ spawn, а не fork: дочерним процессам не достаются открытые
+    соединения с БД и потоки веб-воркера. """
+    return ProcessPoolExecutor(
+        max_workers=workers, mp_context=multiprocessing.get_context('spawn'))
+
+
+def _pools():
+    """ Потоки ставят задачу на выполнение и пишут результат в БД,
+    процессы рендерят: ReportLab не отпускает GIL. """
+    global _threads, _processes
+    if _threads is None:
+        _processes = process_pool(settings.EXPORT_JOB_WORKERS)
+        _threads = ThreadPoolExecutor(
+            max_workers=settings.EXPORT_JOB_WORKERS,
+            thread_name_prefix='export-jobs')
+    return _threads, _processes
+
+
+def purge_expired_jobs(jobs=None):
+    """ Удаляет задачи старше EXPORT_JOB_TTL вместе с файлами. """
+    if jobs is None:
+        jobs = ExportJob.objects.all()
+    expired = jobs.filter(created_at__lt=timezone.now() - timedelta(
+        seconds=settings.EXPORT_JOB_TTL))
+    for job in expired:
+        if job.file:
+            job.file.delete(save=False)
+    return expired.delete()[0]
+
+
+def requeue_stale_jobs(age):
+    """ Возвращает в очередь задачи, которые выполняются дольше age
+    секунд: их исполнитель, скорее всего, перезапущен. """
+    return ExportJob.objects.filter(
+        status=ExportJob.RUNNING,
+        started_at__lt=timezone.now() - timedelta(seconds=age),
+    ).update(status=ExportJob.PENDING, started_at=None)
+
+
+def start_pdf_export(user, shopping_list):
+    """ Задача для длинного списка, PDF которого ещё нет в кеше;
+    None — список короткий или готов, его быстрее отдать сразу.
+    Тот же список того же пользователя не рендерится дважды. """
+    if shopping_list.count() <= settings.SHOPPING_LIST_PDF_JOB_THRESHOLD:
+        return None
+    digest = shopping_list_digest(shopping_list)
+    if cache.get(pdf_cache_key(digest)) is not None:
+        return None
+    purge_expired_jobs(user.export_jobs.all())
+    job = user.export_jobs.filter(digest=digest).exclude(
+        status=ExportJob.FAILED).first()
+    if job is not None:
+        return job
+    job = ExportJob.objects.create(user=user, digest=digest)
+    if settings.EXPORT_JOB_RUNNER == 'pool':
+        threads, processes = _pools()
+        transaction.on_commit(
+            lambda: threads.submit(run_export_job, job.pk, processes))
+    return job
+
+
+def run_export_job(job_id, processes=None):
+    """ Берёт задачу из очереди и рендерит PDF — в пуле процессов,
+    если он передан, иначе здесь же. False, если задачу уже взял
+    другой исполнитель или она завершилась ошибкой. """
+    claimed = ExportJob.objects.filter(
+        pk=job_id, status=ExportJob.PENDING,
+    ).update(status=ExportJob.RUNNING, started_at=timezone.now())
+    if not claimed:
+        return False
+    try:
+        job = ExportJob.objects.get(pk=job_id)
+        # список читается заново: корзина могла измениться в очереди
+        rows = list(shopping_list_queryset(job.user_id))
+        if processes is None:
+            content = render_pdf_bytes(rows)
+        else:
+            content = processes.submit(render_pdf_bytes, rows).result()
+        job.file.save(f'{uuid.uuid4().hex}.pdf', ContentFile(content),
+                      save=False)
+        job.digest = shopping_list_digest(rows)
+        job.status = ExportJob.DONE
+        job.finished_at = timezone.now()
+        job.save(update_fields=('file', 'digest', 'status', 'finished_at'))
+        return True
+    except Exception:
+        # любая ошибка рендера или записи должна попасть в статус,
+        # иначе клиент будет ждать задачу вечно
+        logger.exception('Не удалось выполнить выгрузку %s', job_id)
+        ExportJob.objects.filter(pk=job_id).update(
+            status=ExportJob.FAILED, error='Не удалось сформировать PDF.',
+            finished_at=timezone.now())
+        return False
+    finally:
+        # у каждого потока пула своё соединение с БД
+        connection.close()
+
+
+def wait_for_job(job, timeout):
+    """ Long-poll: перечитывает задачу, пока она не завершится
+    или не выйдет timeout секунд. """
+    deadline = time.monotonic() + timeout
+    while job.status in ACTIVE and time.monotonic() < deadline:
+        time.sleep(POLL_INTERVAL)
+        job.refresh_from_db(fields=('status', 'file', 'error',
+                                    'finished_at'))
+    return job
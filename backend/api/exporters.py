@@ -0,0 +1,105 @@
+import csv
+import io
+import json
+
+from django.conf import settings
+from django.core.cache import cache
+from django.http import FileResponse, StreamingHttpResponse
+
+from api.pdf import render_shopping_list_pdf, shopping_list_digest
+from recipes.models import ShoppingListItem
+
+FILENAME = 'shopping_list'
+CSV_HEADER = ('name', 'measurement_unit', 'amount')
+
+
+def shopping_list_queryset(user):
+    """ Готовая сводка из ShoppingListItem, общая для всех форматов. """
+    return ShoppingListItem.objects.filter(user=user).values_list(
+        *CSV_HEADER).order_by('name', 'measurement_unit')
+
+
+def _rows(shopping_list):
+    return shopping_list.iterator()
+
+
+def _attachment(content, content_type, extension):
+    response = StreamingHttpResponse(content, content_type=content_type)
+    response['Content-Disposition'] = (
+        f'attachment; filename="{FILENAME}.{extension}"')
+    return response
+
+
+def pdf_cache_key(digest):
+    return f'shopping_list_pdf:{digest}'
+
+
+def export_pdf(shopping_list):
+    shopping_list = list(shopping_list)
+    cache_key = pdf_cache_key(shopping_list_digest(shopping_list))
+    content = cache.get(cache_key)
+    if content is not None:
+        return FileResponse(io.BytesIO(content), as_attachment=True,
+                            filename=f'{FILENAME}.pdf')
+    pdf_file = render_shopping_list_pdf(shopping_list)
+    pdf_file.seek(0, io.SEEK_END)
+    size = pdf_file.tell()
+    pdf_file.seek(0)
+    # в память читается только файл, который уйдёт в кеш;
+    # крупный отдаётся потоком из временного файла
+    if size <= settings.SHOPPING_LIST_PDF_CACHE_MAX_SIZE:
+        cache.set(cache_key, pdf_file.read(),
+                  settings.SHOPPING_LIST_PDF_CACHE_TIMEOUT)
+        pdf_file.seek(0)
+    response = FileResponse(
+        pdf_file, as_attachment=True, filename=f'{FILENAME}.pdf')
+    # у SpooledTemporaryFile нет имени на диске, длину FileResponse
+    # сам не определит
+    response['Content-Length'] = size
+    return response
+
+
+def export_txt(shopping_list):
+    def lines():
+        yield 'Список покупок:\n\n'
+        for number, (name, unit, amount) in enumerate(
+                _rows(shopping_list), start=1):
+            yield f'{number}.  {name} - {amount} {unit}\n'
+    return _attachment(lines(), 'text/plain; charset=utf-8', 'txt')
+
+
+class _Echo:
+    """ Файлоподобный объект для csv.writer: возвращает строку,
+    а не пишет её, чтобы строки можно было отдавать потоком. """
+    def write(self, value):
+        return value
+
+
+def export_csv(shopping_list):
+    writer = csv.writer(_Echo())
+
+    def lines():
+        yield writer.writerow(CSV_HEADER)
+        for row in _rows(shopping_list):
+            yield writer.writerow(row)
+    return _attachment(lines(), 'text/csv; charset=utf-8', 'csv')
+
+
+def export_json(shopping_list):
+    def chunks():
+        separator = ''
+        yield '['
+        for row in _rows(shopping_list):
+            yield separator + json.dumps(
+                dict(zip(CSV_HEADER, row)), ensure_ascii=False)
+            separator = ','
+        yield ']'
+    return _attachment(chunks(), 'application/json', 'json')
+
+
+EXPORTERS = {
+    'pdf': export_pdf,
+    'txt': export_txt,
+    'csv': export_csv,
+    'json': export_json,
+}
@@ -0,0 +1,40 @@
+from django.conf import settings
+from drf_extra_fields.fields import Base64ImageField
+from PIL import Image
+from rest_framework import serializers
+
+
+class RecipeImageField(Base64ImageField):
+    """ Base64-фото рецепта с пределами размера: слишком длинная строка
+    отсекается до декодирования, слишком большое изображение — по
+    заголовку, до того как Pillow распакует пиксели. """
+    default_error_messages = {
+        'too_large': 'Файл больше {max_bytes} байт.',
+        'too_many_pixels': 'Изображение больше {max_pixels} пикселей.',
+    }
+
+    def to_internal_value(self, base64_data):
+        max_bytes = settings.RECIPE_IMAGE_MAX_BYTES
+        if isinstance(base64_data, str) and (
+                len(base64_data) * 3 // 4 > max_bytes):
+            self.fail('too_large', max_bytes=max_bytes)
+        image_file = super().to_internal_value(base64_data)
+        if image_file is None:
+            return image_file
+        image_file.seek(0)
+        width, height = Image.open(image_file).size
+        image_file.seek(0)
+        max_pixels = settings.RECIPE_IMAGE_MAX_PIXELS
+        if width * height > max_pixels:
+            self.fail('too_many_pixels', max_pixels=max_pixels)
+        return image_file
+
+
+class RenditionField(serializers.ImageField):
+    """ URL уменьшенной копии фото, а пока её нет — оригинала. """
+    def __init__(self, **kwargs):
+        kwargs['read_only'] = True
+        super().__init__(**kwargs)
+
+    def get_attribute(self, instance):
+        return super().get_attribute(instance) or instance.image
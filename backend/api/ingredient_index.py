@@ -0,0 +1,50 @@
+from bisect import bisect_left
+
+from api.cache import ProcessLocalSnapshot
+from recipes.models import Ingredient
+
+
+class IngredientPrefixIndex(ProcessLocalSnapshot):
+    """ Отсортированный по casefold-имени массив ингредиентов в памяти
+    процесса. Поиск по префиксу — bisect, без обращений к БД.
+
+    Версия индекса лежит в общем кеше, поэтому изменение ингредиентов
+    в одном процессе пересобирает индекс и во всех остальных.
+    """
+    version_key = 'ingredient_index:version'
+
+    def __init__(self, fields):
+        super().__init__()
+        self.fields = fields
+        # (ключи, строки) публикуются одним присваиванием: поиск
+        # без блокировки не увидит новые ключи со старыми строками
+        self._snapshot = ((), ())
+
+    def build(self):
+        rows = tuple(sorted(
+            Ingredient.objects.order_by().values(*self.fields),
+            key=lambda row: (row['name'].casefold(), row['id'])))
+        keys = tuple(row['name'].casefold() for row in rows)
+        self._snapshot = (keys, rows)
+
+    def all(self):
+        self.ensure_fresh()
+        return self._snapshot[1]
+
+    def search(self, prefix, limit):
+        """ Не больше limit ингредиентов, имя которых начинается
+        с prefix (без учёта регистра). """
+        self.ensure_fresh()
+        prefix = prefix.casefold()
+        keys, rows = self._snapshot
+        result = []
+        position = bisect_left(keys, prefix)
+        while (position < len(keys) and len(result) < limit
+               and keys[position].startswith(prefix)):
+            result.append(rows[position])
+            position += 1
+        return result
+
+
+def invalidate_ingredient_index():
+    IngredientPrefixIndex.invalidate()
@@ -0,0 +1,37 @@
+from django.core.management.base import BaseCommand
+
+from api.metrics import FIELDS, collected_samples, percentile, reset_samples
+
+PERCENTILES = (0.5, 0.95, 0.99)
+
+
+class Command(BaseCommand):
+    help = ('Prints per-endpoint p50/p95/p99 of wall time, SQL time, query '
+            'count, view time without SQL and render time collected by '
+            'QueryTimingMiddleware (needs a cache shared between workers).')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--field', choices=FIELDS, nargs='+', default=FIELDS,
+            help='Metrics to print')
+        parser.add_argument(
+            '--reset', action='store_true',
+            help='Drop collected samples after printing')
+
+    def handle(self, *args, **options):
+        samples = collected_samples()
+        if not samples:
+            self.stdout.write('Замеров пока нет.')
+        for endpoint in sorted(samples):
+            rows = samples[endpoint]
+            self.stdout.write(self.style.MIGRATE_HEADING(
+                f'{endpoint}  ({len(rows)} запросов)'))
+            for field in options['field']:
+                values = sorted(row[field] for row in rows)
+                stats = '  '.join(
+                    f'p{round(fraction * 100)}='
+                    f'{percentile(values, fraction):.1f}'
+                    for fraction in PERCENTILES)
+                self.stdout.write(f'  {field:<8} {stats}')
+        if options['reset']:
+            reset_samples()
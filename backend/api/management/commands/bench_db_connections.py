@@ -0,0 +1,146 @@
+# isort: skip_file
+import json
+import statistics
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.handlers.wsgi import WSGIHandler
+from django.core.management.base import BaseCommand
+from django.db import connections
+from django.db.backends.signals import connection_created
+from django.test import RequestFactory
+
+from api.metrics import percentile
+from backend.db.pooled_postgresql.base import _pools
+
+# адрес не из INTERNAL_IPS, чтобы не включался debug_toolbar
+CLIENT_ADDR = '192.0.2.1'
+PERCENTILES = (0.5, 0.95, 0.99)
+
+
+class Command(BaseCommand):
+    help = ('Sends requests through the real WSGI handler from one or more '
+            'threads and reports latency and how many DB connections were '
+            'opened, to compare DB_CONN_MAX_AGE, DB_POOL_SIZE and '
+            'DB_REPLICAS settings')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--paths', nargs='+', default=['/api/tags/'],
+            help='Request paths, taken in turn')
+        parser.add_argument(
+            '--requests', type=int, default=500,
+            help='Requests per thread')
+        parser.add_argument(
+            '--threads', type=int, default=1,
+            help='Threads sending requests, like a threaded worker')
+        parser.add_argument('--save', help='Write results to this JSON file')
+        parser.add_argument(
+            '--baseline', help='Print the comparison with this JSON file')
+
+    def handle(self, *args, **options):
+        # тестовый клиент Django не закрывает соединения после запроса,
+        # поэтому запросы идут через WSGIHandler, как у gunicorn
+        self.handler = WSGIHandler()
+        self.factory = RequestFactory(REMOTE_ADDR=CLIENT_ADDR)
+        self.opened = 0
+        self.lock = threading.Lock()
+        connection_created.connect(self.count_connection)
+        paths = options['paths']
+        # прогрев: кеши процесса, индекс ингредиентов
+        for path in paths:
+            self.request(path)
+        self.opened = 0
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=options['threads']) as threads:
+            runs = list(threads.map(
+                lambda _: self.run(paths, options['requests']),
+                range(options['threads'])))
+        elapsed = time.perf_counter() - started
+        latencies = sorted(value for run in runs for value, _ in run)
+        statuses = {}
+        for _, status in (item for run in runs for item in run):
+            statuses[str(status)] = statuses.get(str(status), 0) + 1
+        result = {
+            'database': self.describe_database(),
+            'threads': options['threads'],
+            'requests': len(latencies),
+            'rps': len(latencies) / elapsed,
+            'statuses': statuses,
+            'connections_created': self.opened,
+            'pool_connections': sum(
+                pool.opened for pool in _pools.values()),
+            'ms': {
+                'mean': statistics.mean(latencies),
+                **{f'p{round(fraction * 100)}': percentile(
+                    latencies, fraction) for fraction in PERCENTILES},
+            },
+        }
+        self.print_result(result)
+        if options['save']:
+            with open(options['save'], 'w', encoding='utf-8') as file:
+                json.dump(result, file, indent=2, sort_keys=True)
+        if options['baseline']:
+            with open(options['baseline'], encoding='utf-8') as file:
+                self.compare(result, json.load(file))
+
+    def count_connection(self, **kwargs):
+        with self.lock:
+            self.opened += 1
+
+    def describe_database(self):
+        default = settings.DATABASES['default']
+        return {
+            'engine': default['ENGINE'],
+            'conn_max_age': default['CONN_MAX_AGE'],
+            'health_checks': settings.DB_CONN_HEALTH_CHECKS,
+            'pool_size': default.get('POOL_SIZE', 0),
+            'replicas': len(settings.DATABASE_REPLICAS),
+        }
+
+    def request(self, path):
+        environ = self.factory.get(path).environ
+        started = time.perf_counter()
+        response = self.handler(environ, lambda status, headers: None)
+        for _ in response:
+            pass
+        # close() шлёт request_finished: соединение закрывается
+        # или остаётся открытым по CONN_MAX_AGE
+        response.close()
+        return (time.perf_counter() - started) * 1000, response.status_code
+
+    def run(self, paths, count):
+        try:
+            return [self.request(paths[number % len(paths)])
+                    for number in range(count)]
+        finally:
+            connections.close_all()
+
+    def print_result(self, result):
+        database = result['database']
+        self.stdout.write(
+            f'{database["engine"]} CONN_MAX_AGE={database["conn_max_age"]} '
+            f'health_checks={database["health_checks"]} '
+            f'pool={database["pool_size"]} '
+            f'replicas={database["replicas"]}, '
+            f'потоков {result["threads"]}')
+        self.stdout.write(
+            f'{result["requests"]} запросов, {result["rps"]:.0f} rps; '
+            + ' '.join(f'{key}={value:.2f}ms'
+                       for key, value in result['ms'].items())
+            + f'; статусы {result["statuses"]}; соединений открыто '
+            f'{result["connections_created"]}'
+            + (f' (новых в пуле {result["pool_connections"]})'
+               if database['pool_size'] else ''))
+
+    def compare(self, result, baseline):
+        self.stdout.write('Относительно baseline:')
+        for key, value in (('rps', result['rps']), *result['ms'].items()):
+            before = baseline['ms'].get(key) if key != 'rps' else (
+                baseline['rps'])
+            if before:
+                self.stdout.write(
+                    f'  {key}: {before:.2f} -> {value:.2f} '
+                    f'({value / before:.2f}x)')
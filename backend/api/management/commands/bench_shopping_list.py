@@ -0,0 +1,119 @@
+# isort: skip_file
+import os
+import statistics
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.test.utils import override_settings
+from reportlab.pdfbase import pdfmetrics
+from reportlab.pdfbase.ttfonts import TTFont
+from rest_framework.test import APIClient
+
+from api.pdf import FONT_FILES
+from recipes.cart_summary import cart_changed
+from recipes.models import Cart, Ingredient, ReciIngredi, Recipe
+from users.models import User
+
+URL = '/api/recipes/download_shopping_cart/'
+# адрес не из INTERNAL_IPS, чтобы не включался debug_toolbar
+CLIENT_ADDR = '192.0.2.1'
+STREAMING_FORMATS = ('txt', 'csv', 'json')
+
+
+# отдельный кеш, чтобы cache.clear() не задел рабочий
+BENCH_CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'bench_shopping_list',
+    }
+}
+
+
+class Rollback(Exception):
+    pass
+
+
+class Command(BaseCommand):
+    help = ('Benchmarks shopping list export: PDF cold (fonts registered '
+            'per request, as before), warm (fonts ready) and cached, '
+            'then the streaming txt/csv/json formats.')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--sizes', type=int, nargs='+', default=(10, 100, 1000),
+            help='Cart sizes (ingredient lines) to benchmark')
+        parser.add_argument(
+            '--repeat', type=int, default=5,
+            help='Requests per measurement')
+
+    def handle(self, *args, **options):
+        self.stdout.write(
+            f'{"lines":>6} {"pdf cold":>9} {"pdf warm":>9} '
+            f'{"pdf cached":>11} {"pdf KB":>7} '
+            + ' '.join(f'{fmt:>7}' for fmt in STREAMING_FORMATS)
+            + '   (median, ms)')
+        for size in options['sizes']:
+            try:
+                with transaction.atomic(), override_settings(
+                        CACHES=BENCH_CACHES):
+                    self.bench(size, options['repeat'])
+                    raise Rollback
+            except Rollback:
+                pass
+
+    def make_cart(self, size):
+        user = User.objects.create(
+            username='bench_cart', email='bench_cart@example.com',
+            first_name='bench', last_name='bench')
+        ingredients = Ingredient.objects.bulk_create(
+            Ingredient(name=f'bench ингредиент {number}',
+                       measurement_unit='г')
+            for number in range(size))
+        ingredients = Ingredient.objects.filter(
+            name__startswith='bench ингредиент ')
+        recipe = Recipe.objects.create(
+            author=user, name='bench', text='bench', cooking_time=1,
+            image='recipes/bench.png')
+        ReciIngredi.objects.bulk_create(
+            ReciIngredi(recipe=recipe, ingredient=ingredient, amount=1)
+            for ingredient in ingredients)
+        Cart.objects.create(user=user, recipe=recipe)
+        cart_changed(user.pk, (recipe.pk,), 1)
+        client = APIClient(REMOTE_ADDR=CLIENT_ADDR)
+        client.force_authenticate(user)
+        return client
+
+    def measure(self, client, repeat, before=None, export_format='pdf'):
+        timings = []
+        for _ in range(repeat):
+            if before:
+                before()
+            started = time.perf_counter()
+            response = client.get(URL, {'format': export_format})
+            content = b''.join(response.streaming_content)
+            timings.append((time.perf_counter() - started) * 1000)
+        return statistics.median(timings), len(content)
+
+    def bench(self, size, repeat):
+        client = self.make_cart(size)
+
+        def reregister_fonts():
+            cache.clear()
+            for name, filename in FONT_FILES.items():
+                pdfmetrics.registerFont(TTFont(
+                    name, os.path.join(settings.BASE_DIR, filename),
+                    'UTF-8'))
+
+        cold, _ = self.measure(client, repeat, reregister_fonts)
+        warm, length = self.measure(client, repeat, cache.clear)
+        cached, _ = self.measure(client, repeat)
+        streaming = (
+            self.measure(client, repeat, export_format=export_format)[0]
+            for export_format in STREAMING_FORMATS)
+        self.stdout.write(
+            f'{size:>6} {cold:>9.1f} {warm:>9.1f} {cached:>11.1f} '
+            f'{length / 1024:>7.1f} '
+            + ' '.join(f'{timing:>7.1f}' for timing in streaming))
@@ -0,0 +1,220 @@
+# isort: skip_file
+import json
+import statistics
+import time
+import tracemalloc
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.db.models import Count
+from django.test import Client
+from django.test.utils import CaptureQueriesContext
+from rest_framework.authtoken.models import Token
+from rest_framework.pagination import Cursor
+
+from api.cache import invalidate_recipe_feed
+from api.metrics import percentile
+from api.pagination import FeedCursorPagination
+from recipes.models import Ingredient, Recipe, Tag
+from users.models import User
+
+# адрес не из INTERNAL_IPS, чтобы не включался debug_toolbar
+CLIENT_ADDR = '192.0.2.1'
+PERCENTILES = (0.5, 0.95, 0.99)
+# сценарии, перед каждым замером которых сбрасывается кеш ленты анонимов:
+# иначе после прогрева мерились бы только попадания в кеш
+COLD_FEED_SCENARIOS = ('recipes_list_anonymous',)
+
+
+class Command(BaseCommand):
+    help = ('Runs the hot API endpoints through the Django test client and '
+            'reports query counts, latency percentiles and memory peaks; '
+            'optionally compares them with a saved baseline JSON')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--repeat', type=int, default=20)
+        parser.add_argument(
+            '--deep-page', type=int, default=100,
+            help='Page number (2 or more) for the deep OFFSET / cursor '
+                 'scenarios')
+        parser.add_argument(
+            '--user', type=int,
+            help='User id for authenticated scenarios '
+                 '(default: the user with most favorites)')
+        parser.add_argument(
+            '--only', nargs='+', help='Run only these scenarios')
+        parser.add_argument('--save', help='Write results to this JSON file')
+        parser.add_argument(
+            '--baseline', help='Compare results with this JSON file')
+        parser.add_argument(
+            '--tolerance', type=float, default=0.2,
+            help='Allowed p95 latency growth against the baseline')
+
+    def handle(self, *args, **options):
+        if options['deep_page'] < 2:
+            raise CommandError('--deep-page должен быть не меньше 2.')
+        user = self.get_user(options['user'])
+        token, _ = Token.objects.get_or_create(user=user)
+        self.anonymous = Client(REMOTE_ADDR=CLIENT_ADDR)
+        self.authorized = Client(
+            REMOTE_ADDR=CLIENT_ADDR,
+            HTTP_AUTHORIZATION=f'Token {token.key}')
+        scenarios = self.scenarios(options['deep_page'])
+        if options['only']:
+            scenarios = {name: scenarios[name] for name in options['only']}
+        results = {}
+        for name, (client, url) in scenarios.items():
+            before = (invalidate_recipe_feed
+                      if name in COLD_FEED_SCENARIOS else None)
+            results[name] = self.run(
+                client, url, options['repeat'], before)
+            self.print_result(name, results[name])
+        if options['save']:
+            with open(options['save'], 'w', encoding='utf-8') as file:
+                json.dump(results, file, indent=2, sort_keys=True)
+        if options['baseline']:
+            self.compare(results, options['baseline'], options['tolerance'])
+
+    def get_user(self, user_id):
+        if user_id is not None:
+            return User.objects.get(pk=user_id)
+        user = User.objects.annotate(
+            faved=Count('favorite')).order_by('-faved').first()
+        if user is None:
+            raise CommandError(
+                'В базе нет пользователей, запустите generate_data.')
+        return user
+
+    def deep_cursor_url(self, page, limit):
+        """ Ссылка курсорного режима на ту же глубину, что ?page=page. """
+        ordering = ('-pub_date', '-id')
+        # последний рецепт предыдущей страницы
+        recipe = Recipe.objects.order_by(*ordering).only(
+            'pub_date')[(page - 1) * limit - 1:(page - 1) * limit].first()
+        if recipe is None:
+            raise CommandError(
+                f'В базе нет {page} страниц по {limit} рецептов, '
+                'уменьшите --deep-page.')
+        paginator = FeedCursorPagination(ordering)
+        paginator.base_url = (
+            f'/api/recipes/?limit={limit}&pagination=cursor')
+        return paginator.encode_cursor(Cursor(
+            offset=0, reverse=False,
+            position=paginator._get_position_from_instance(
+                recipe, ordering)))
+
+    def scenarios(self, deep_page):
+        recipe = Recipe.objects.order_by('-pub_date').first()
+        if recipe is None:
+            raise CommandError('В базе нет рецептов, запустите generate_data.')
+        tags = '&'.join(
+            f'tags={slug}' for slug in Tag.objects.values_list(
+                'slug', flat=True)[:2])
+        ingredient = Ingredient.objects.order_by('?').first()
+        prefix = ingredient.name[:2] if ingredient else 'а'
+        # слово из названия и слово из ингредиента — для поиска
+        words = (recipe.name.split()[0],
+                 ingredient.name.split()[0] if ingredient else 'соль')
+        return {
+            'recipes_list_anonymous': (
+                self.anonymous, '/api/recipes/?limit=6'),
+            'recipes_list_anonymous_cached': (
+                self.anonymous, '/api/recipes/?limit=6'),
+            'recipes_list': (self.authorized, '/api/recipes/?limit=6'),
+            'recipes_list_deep_page': (
+                self.authorized, f'/api/recipes/?limit=6&page={deep_page}'),
+            'recipes_list_cursor': (
+                self.authorized, '/api/recipes/?limit=6&pagination=cursor'),
+            'recipes_list_cursor_deep': (
+                self.authorized, self.deep_cursor_url(deep_page, 6)),
+            'recipe_detail': (
+                self.authorized, f'/api/recipes/{recipe.pk}/'),
+            'recipes_by_tags': (
+                self.authorized, f'/api/recipes/?limit=6&{tags}'),
+            'recipes_favorited': (
+                self.authorized, '/api/recipes/?limit=6&is_favorited=1'),
+            'subscriptions': (
+                self.authorized,
+                '/api/users/subscriptions/?limit=6&recipes_limit=3'),
+            'download_shopping_cart': (
+                self.authorized, '/api/recipes/download_shopping_cart/'),
+            'recipes_search': (
+                self.authorized, f'/api/recipes/?limit=6&search={words[0]}'),
+            'recipes_search_two_words': (
+                self.authorized,
+                f'/api/recipes/?limit=6&search={words[0]}+{words[1]}'),
+            'ingredient_search': (
+                self.authorized, f'/api/ingredients/?name={prefix}'),
+        }
+
+    def request(self, client, url):
+        response = client.get(url)
+        if response.streaming:
+            b''.join(response.streaming_content)
+        return response
+
+    def run(self, client, url, repeat, before=None):
+        """ before вызывается перед каждым замером вне отсчёта времени. """
+        timings = []
+        queries = 0
+        status = None
+        # прогрев: кеши процесса, индекс ингредиентов, шрифты
+        self.request(client, url)
+        for _ in range(repeat):
+            if before is not None:
+                before()
+            with CaptureQueriesContext(connection) as captured:
+                started = time.perf_counter()
+                status = self.request(client, url).status_code
+                timings.append((time.perf_counter() - started) * 1000)
+            queries = max(queries, len(captured.captured_queries))
+        # tracemalloc сильно замедляет код, память меряется отдельно
+        if before is not None:
+            before()
+        tracemalloc.start()
+        self.request(client, url)
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+        result = {
+            'url': url,
+            'status': status,
+            'queries': queries,
+            'mean_ms': statistics.mean(timings),
+            'peak_kb': peak / 1024,
+        }
+        timings.sort()
+        for fraction in PERCENTILES:
+            result[f'p{round(fraction * 100)}_ms'] = percentile(
+                timings, fraction)
+        return result
+
+    def print_result(self, name, result):
+        self.stdout.write(
+            f'{name:<30} {result["status"]:>3} '
+            f'queries={result["queries"]:<3} '
+            f'p50={result["p50_ms"]:>7.1f} p95={result["p95_ms"]:>7.1f} '
+            f'p99={result["p99_ms"]:>7.1f} ms  '
+            f'peak={result["peak_kb"]:>8.0f} KB')
+
+    def compare(self, results, path, tolerance):
+        with open(path, encoding='utf-8') as file:
+            baseline = json.load(file)
+        regressions = []
+        for name, result in results.items():
+            before = baseline.get(name)
+            if before is None:
+                continue
+            if result['queries'] > before['queries']:
+                regressions.append(
+                    f'{name}: запросов {before["queries"]} → '
+                    f'{result["queries"]}')
+            if result['p95_ms'] > before['p95_ms'] * (1 + tolerance):
+                regressions.append(
+                    f'{name}: p95 {before["p95_ms"]:.1f} → '
+                    f'{result["p95_ms"]:.1f} мс')
+        if regressions:
+            raise CommandError(
+                'Регрессии относительно базовой линии:\n'
+                + '\n'.join(regressions))
+        self.stdout.write(self.style.SUCCESS(
+            'Регрессий относительно базовой линии нет.'))
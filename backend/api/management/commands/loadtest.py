@@ -0,0 +1,203 @@
+# isort: skip_file
+import asyncio
+import json
+import statistics
+import time
+from itertools import cycle
+from urllib.parse import quote, urlsplit
+
+from django.core.management.base import BaseCommand, CommandError
+from rest_framework.authtoken.models import Token
+
+from api.metrics import percentile
+from recipes.models import Recipe
+from users.models import User
+
+PERCENTILES = (0.5, 0.95, 0.99)
+
+
+class Command(BaseCommand):
+    help = ('Opens many simultaneous HTTP connections to a running server '
+            '(gunicorn sync or uvicorn workers) and reports throughput, '
+            'latency percentiles and errors for the read endpoints')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--url', default='http://127.0.0.1:8000')
+        parser.add_argument(
+            '--connections', type=int, default=200,
+            help='Simultaneous connections (one request in flight each)')
+        parser.add_argument('--duration', type=float, default=20.0)
+        parser.add_argument('--timeout', type=float, default=30.0)
+        parser.add_argument(
+            '--paths', nargs='+',
+            help='Request paths, taken in turn '
+                 '(default: tags, ingredients, recipe list and detail)')
+        parser.add_argument('--token', help='Auth token for the requests')
+        parser.add_argument(
+            '--slow-uploads', type=int, default=0,
+            help='Extra connections that keep POSTing a request body '
+                 'slowly, like a large photo over a poor network')
+        parser.add_argument(
+            '--upload-size', type=int, default=256 * 1024,
+            help='Body size of one slow upload, bytes')
+        parser.add_argument(
+            '--upload-rate', type=int, default=64 * 1024,
+            help='Speed of one slow upload, bytes per second')
+        parser.add_argument('--save', help='Write results to this JSON file')
+        parser.add_argument(
+            '--baseline', help='Print the comparison with this JSON file')
+
+    def handle(self, *args, **options):
+        url = urlsplit(options['url'])
+        if url.scheme != 'http' or not url.hostname:
+            raise CommandError('Нужен адрес вида http://host:port.')
+        self.host, self.port = url.hostname, url.port or 80
+        self.headers = (f'Host: {url.netloc}\r\nAccept: application/json\r\n'
+                        'Connection: close\r\n')
+        if options['token']:
+            self.headers += f'Authorization: Token {options["token"]}\r\n'
+        # строка запроса — только ASCII, иначе h11 (uvicorn) ответит 400
+        paths = [quote(path, safe='/?=&%')
+                 for path in options['paths'] or self.default_paths()]
+        uploads = options['slow_uploads']
+        if uploads:
+            # тело читает только парсер DRF, а он нужен вошедшему
+            self.upload_headers = self.headers + (
+                f'Authorization: Token {self.upload_token(options)}\r\n'
+                'Content-Type: application/json\r\n')
+        result = asyncio.run(self.load(
+            paths, options['connections'], options['duration'],
+            options['timeout'], uploads, options['upload_size'],
+            options['upload_rate']))
+        self.print_result(result)
+        if options['save']:
+            with open(options['save'], 'w', encoding='utf-8') as file:
+                json.dump(result, file, indent=2, sort_keys=True)
+        if options['baseline']:
+            with open(options['baseline'], encoding='utf-8') as file:
+                self.compare(result, json.load(file))
+
+    def default_paths(self):
+        recipe = Recipe.objects.values_list('pk', flat=True).first()
+        if recipe is None:
+            raise CommandError(
+                'В базе нет рецептов, запустите generate_data.')
+        return ['/api/tags/', '/api/ingredients/?name=а', '/api/recipes/',
+                f'/api/recipes/{recipe}/']
+
+    def upload_token(self, options):
+        if options['token']:
+            return options['token']
+        user = User.objects.order_by('pk').first()
+        if user is None:
+            raise CommandError(
+                'В базе нет пользователей, запустите generate_data.')
+        return Token.objects.get_or_create(user=user)[0].key
+
+    async def load(self, paths, connections, duration, timeout,
+                   uploads=0, upload_size=0, upload_rate=1):
+        """ connections сопрограмм, каждая шлёт запрос за запросом
+        по новому соединению, пока не выйдет время. Ещё uploads
+        сопрограмм всё это время медленно отправляют тела POST. """
+        latencies, statuses, errors = [], {}, {}
+        uploaded = []
+        turns = cycle(paths)
+        deadline = time.perf_counter() + duration
+
+        async def worker():
+            while time.perf_counter() < deadline:
+                path = next(turns)
+                started = time.perf_counter()
+                try:
+                    status = await asyncio.wait_for(
+                        self.request(path), timeout)
+                except (OSError, asyncio.TimeoutError, ValueError,
+                        IndexError) as error:
+                    name = type(error).__name__
+                    errors[name] = errors.get(name, 0) + 1
+                    continue
+                latencies.append((time.perf_counter() - started) * 1000)
+                statuses[status] = statuses.get(status, 0) + 1
+
+        async def uploader():
+            while time.perf_counter() < deadline:
+                try:
+                    await self.slow_upload(upload_size, upload_rate)
+                except (OSError, ValueError, IndexError):
+                    continue
+                uploaded.append(upload_size)
+
+        started = time.perf_counter()
+        await asyncio.gather(
+            *(worker() for _ in range(connections)),
+            *(uploader() for _ in range(uploads)))
+        elapsed = time.perf_counter() - started
+        latencies.sort()
+        return {
+            'connections': connections,
+            'slow_uploads': uploads,
+            'uploads_finished': len(uploaded),
+            'requests': len(latencies),
+            'rps': len(latencies) / elapsed,
+            'statuses': {str(key): value for key, value in statuses.items()},
+            'errors': errors,
+            'ms': {
+                'mean': statistics.mean(latencies) if latencies else 0,
+                **{f'p{int(fraction * 100)}': percentile(latencies, fraction)
+                   for fraction in PERCENTILES if latencies},
+            },
+        }
+
+    async def request(self, path):
+        reader, writer = await asyncio.open_connection(self.host, self.port)
+        try:
+            writer.write(
+                f'GET {path} HTTP/1.1\r\n{self.headers}\r\n'.encode())
+            await writer.drain()
+            status_line = await reader.readline()
+            # тело дочитывается до закрытия соединения сервером
+            while await reader.read(64 * 1024):
+                pass
+        finally:
+            writer.close()
+        return int(status_line.split()[1])
+
+    async def slow_upload(self, size, rate, chunk=4096):
+        """ POST /api/recipes/ с телом, которое приходит по chunk байт
+        со скоростью rate байт/с. """
+        reader, writer = await asyncio.open_connection(self.host, self.port)
+        try:
+            writer.write(
+                f'POST /api/recipes/ HTTP/1.1\r\n{self.upload_headers}'
+                f'Content-Length: {size}\r\n\r\n'.encode())
+            for offset in range(0, size, chunk):
+                writer.write(b' ' * min(chunk, size - offset))
+                await writer.drain()
+                await asyncio.sleep(chunk / rate)
+            status_line = await reader.readline()
+            while await reader.read(64 * 1024):
+                pass
+        finally:
+            writer.close()
+        return int(status_line.split()[1])
+
+    def print_result(self, result):
+        ms = result['ms']
+        self.stdout.write(
+            f'{result["connections"]} соединений: {result["requests"]} '
+            f'запросов, {result["rps"]:.0f} rps; '
+            + ' '.join(f'{key}={value:.0f}ms' for key, value in ms.items())
+            + f'; статусы {result["statuses"]}; ошибки {result["errors"]}'
+            + (f'; медленных загрузок {result["slow_uploads"]}, '
+               f'завершено {result["uploads_finished"]}'
+               if result['slow_uploads'] else ''))
+
+    def compare(self, result, baseline):
+        self.stdout.write('Относительно baseline:')
+        for key, value in (('rps', result['rps']), *result['ms'].items()):
+            before = baseline['ms'].get(key) if key != 'rps' else (
+                baseline['rps'])
+            if before:
+                self.stdout.write(
+                    f'  {key}: {before:.0f} -> {value:.0f} '
+                    f'({value / before:.2f}x)')
@@ -0,0 +1,58 @@
+# isort: skip_file
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from api.export_jobs import (process_pool, purge_expired_jobs,
+                             requeue_stale_jobs, run_export_job)
+from recipes.models import ExportJob
+
+
+class Command(BaseCommand):
+    help = ('Runs queued shopping list PDF exports (EXPORT_JOB_RUNNER='
+            'command), requeues stuck jobs and removes expired files')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--once', action='store_true',
+            help='Drain the queue and exit instead of polling it')
+        parser.add_argument(
+            '--interval', type=float, default=1.0,
+            help='Seconds between queue polls')
+        parser.add_argument(
+            '--workers', type=int, default=settings.EXPORT_JOB_WORKERS,
+            help='Render processes (1 renders in this process)')
+        parser.add_argument(
+            '--stale-after', type=int, default=10 * 60,
+            help='Seconds after which a running job is considered lost')
+
+    def handle(self, *args, **options):
+        workers = options['workers']
+        processes = process_pool(workers) if workers > 1 else None
+        try:
+            with ThreadPoolExecutor(max_workers=workers) as threads:
+                while True:
+                    done = self.drain(threads, processes, options)
+                    if options['once']:
+                        break
+                    if not done:
+                        time.sleep(options['interval'])
+        finally:
+            if processes is not None:
+                processes.shutdown()
+
+    def drain(self, threads, processes, options):
+        requeued = requeue_stale_jobs(options['stale_after'])
+        purged = purge_expired_jobs()
+        job_ids = list(ExportJob.objects.filter(
+            status=ExportJob.PENDING).order_by('created_at').values_list(
+            'pk', flat=True))
+        results = list(threads.map(
+            lambda job_id: run_export_job(job_id, processes), job_ids))
+        if job_ids or requeued or purged:
+            self.stdout.write(
+                f'Выполнено задач: {sum(results)} из {len(job_ids)}, '
+                f'возвращено в очередь: {requeued}, удалено: {purged}.')
+        return len(job_ids)
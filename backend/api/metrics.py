@@ -0,0 +1,142 @@
+import os
+import threading
+import time
+from collections import defaultdict, deque
+from contextlib import ExitStack, contextmanager
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connections
+
+PIDS_KEY = 'api_metrics:pids'
+PIDS_LOCK_KEY = 'api_metrics:pids:lock'
+PIDS_LOCK_TIMEOUT = 5
+PIDS_LOCK_ATTEMPTS = 20
+PIDS_LOCK_DELAY = 0.01
+SNAPSHOT_KEY = 'api_metrics:snapshot:{pid}'
+FIELDS = ('total', 'db', 'queries', 'app', 'render')
+
+
+def percentile(values, fraction):
+    """ Перцентиль по ближайшему рангу на уже отсортированном списке. """
+    if not values:
+        return 0
+    index = min(len(values) - 1, max(0, round(fraction * len(values)) - 1))
+    return values[index]
+
+
+class MetricsRegistry:
+    """ Скользящее окно последних замеров по каждому эндпоинту.
+
+    Окно живёт в памяти процесса; раз в API_METRICS_FLUSH_EVERY запросов
+    его снимок уходит в общий кеш, откуда его читает команда api_stats.
+    Снимок живёт API_METRICS_TTL секунд: процесс, перезапущенный
+    gunicorn, перестаёт попадать в статистику.
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._samples = defaultdict(
+            lambda: deque(maxlen=settings.API_METRICS_WINDOW))
+        self._since_flush = 0
+
+    def record(self, endpoint, sample):
+        with self._lock:
+            self._samples[endpoint].append(sample)
+            self._since_flush += 1
+            flush = self._since_flush >= settings.API_METRICS_FLUSH_EVERY
+            if flush:
+                self._since_flush = 0
+                snapshot = self.snapshot()
+        if flush:
+            self.flush(snapshot)
+
+    def snapshot(self):
+        return {endpoint: list(samples)
+                for endpoint, samples in self._samples.items()}
+
+    def flush(self, snapshot):
+        pid = os.getpid()
+        # сначала снимок: pid без снимка collected_samples считает мёртвым
+        cache.set(SNAPSHOT_KEY.format(pid=pid), snapshot,
+                  settings.API_METRICS_TTL)
+        # если блокировка занята, pid добавится при следующем сбросе
+        if pid not in cache.get(PIDS_KEY, set()):
+            update_pids(lambda pids: pids | {pid})
+
+
+registry = MetricsRegistry()
+
+
+def update_pids(change):
+    """ Меняет множество pid под блокировкой в кеше: cache.add атомарен,
+    поэтому одновременные сбросы не затирают pid друг друга. """
+    for _ in range(PIDS_LOCK_ATTEMPTS):
+        if cache.add(PIDS_LOCK_KEY, os.getpid(), PIDS_LOCK_TIMEOUT):
+            try:
+                cache.set(PIDS_KEY, change(cache.get(PIDS_KEY, set())), None)
+            finally:
+                cache.delete(PIDS_LOCK_KEY)
+            return True
+        time.sleep(PIDS_LOCK_DELAY)
+    return False
+
+
+def collected_samples():
+    """ Замеры всех процессов, сброшенные в кеш, плюс текущего.
+    Процессы с истёкшим снимком убираются из списка. """
+    merged = defaultdict(list)
+    keys = {pid: SNAPSHOT_KEY.format(pid=pid)
+            for pid in cache.get(PIDS_KEY, set()) - {os.getpid()}}
+    found = cache.get_many(keys.values())
+    expired = {pid for pid, key in keys.items() if key not in found}
+    if expired:
+        update_pids(lambda pids: pids - expired)
+    snapshots = list(found.values())
+    snapshots.append(registry.snapshot())
+    for snapshot in snapshots:
+        for endpoint, samples in snapshot.items():
+            merged[endpoint].extend(samples)
+    return merged
+
+
+def reset_samples():
+    for pid in cache.get(PIDS_KEY, set()):
+        cache.delete(SNAPSHOT_KEY.format(pid=pid))
+    cache.delete(PIDS_KEY)
+
+
+class RequestMetrics:
+    """ Счётчики одного запроса; sql() подключается через
+    connection.execute_wrapper. """
+    def __init__(self):
+        self.queries = 0
+        self.db = 0.0
+
+    @contextmanager
+    def collect(self):
+        """ Считает SQL текущего потока: соединения у потоков свои. """
+        with ExitStack() as stack:
+            for connection in connections.all():
+                stack.enter_context(connection.execute_wrapper(self.sql))
+            yield
+
+    def sql(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.db += time.perf_counter() - started
+            self.queries += 1
+
+
+def endpoint_name(request):
+    """ Имя вьюхи и action DRF: «RecipeViewSet.list». """
+    match = getattr(request, 'resolver_match', None)
+    if match is None:
+        return 'unresolved'
+    view = getattr(match.func, 'cls', None)
+    if view is None:
+        return match.view_name or match.func.__name__
+    actions = getattr(match.func, 'actions', None) or {}
+    action = actions.get(request.method.lower(), request.method.lower())
+    return f'{view.__name__}.{action}'
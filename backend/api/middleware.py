@@ -0,0 +1,118 @@
+import asyncio
+import time
+
+from django.conf import settings
+
+from api.metrics import RequestMetrics, endpoint_name, registry
+from api.replicas import SAFE_METHODS, pin_to_primary, read_alias_for
+from backend.db.routers import read_alias
+
+
+class QueryTimingMiddleware:
+    """ Для каждого запроса считает число SQL-запросов и их время,
+    время вьюхи без SQL (сериализаторы), рендеринга и общее.
+    Отдаёт их в Server-Timing и копит в гистограмме api.metrics.
+
+    Под ASGI вьюха выполняется в другом потоке, поэтому SQL там считает
+    обёртка из api.async_views через request._metrics.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if asyncio.iscoroutinefunction(get_response):
+            # как в MiddlewareMixin: Django будет ждать __call__
+            self._is_coroutine = asyncio.coroutines._is_coroutine
+
+    def __call__(self, request):
+        if getattr(self, '_is_coroutine', None):
+            return self.__acall__(request)
+        metrics, started = self.start(request)
+        with metrics.collect():
+            response = self.get_response(request)
+        return self.finish(request, response, metrics, started)
+
+    async def __acall__(self, request):
+        metrics, started = self.start(request)
+        response = await self.get_response(request)
+        return self.finish(request, response, metrics, started)
+
+    def start(self, request):
+        request._metrics = RequestMetrics()
+        request._metrics_view_started = request._metrics_view_finished = None
+        return request._metrics, time.perf_counter()
+
+    def finish(self, request, response, metrics, started):
+        finished = time.perf_counter()
+        view_started = request._metrics_view_started or started
+        view_finished = request._metrics_view_finished or finished
+        sample = {
+            'total': (finished - started) * 1000,
+            'db': metrics.db * 1000,
+            'queries': metrics.queries,
+            'app': max(0.0, (view_finished - view_started - metrics.db)
+                       * 1000),
+            'render': (finished - view_finished) * 1000,
+        }
+        registry.record(endpoint_name(request), sample)
+        response['Server-Timing'] = ', '.join((
+            f'db;dur={sample["db"]:.2f};desc="{sample["queries"]} queries"',
+            f'app;dur={sample["app"]:.2f};desc="view without SQL"',
+            f'render;dur={sample["render"]:.2f}',
+            f'total;dur={sample["total"]:.2f}',
+        ))
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        request._metrics_view_started = time.perf_counter()
+
+    def process_template_response(self, request, response):
+        # DRF Response ещё не отрендерен: данные уже сериализованы.
+        # api.async_views рендерит в пуле и отмечает это время сам
+        if request._metrics_view_finished is None:
+            request._metrics_view_finished = time.perf_counter()
+        return response
+
+
+class ReplicaRoutingMiddleware:
+    """ Безопасные запросы читают с реплики (backend.db.routers),
+    остальные — из default. После успешной записи клиент ещё
+    REPLICA_STICKY_SECONDS читает из default и видит свои изменения,
+    даже если реплика отстаёт.
+
+    Под ASGI вьюхи из api.async_views получают копию контекста,
+    а с ней и выбранную здесь реплику.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if asyncio.iscoroutinefunction(get_response):
+            self._is_coroutine = asyncio.coroutines._is_coroutine
+
+    def __call__(self, request):
+        if getattr(self, '_is_coroutine', None):
+            return self.__acall__(request)
+        token = read_alias.set(read_alias_for(request))
+        try:
+            response = self.get_response(request)
+        finally:
+            read_alias.reset(token)
+        return self.finish(request, response)
+
+    async def __acall__(self, request):
+        token = read_alias.set(read_alias_for(request))
+        try:
+            response = await self.get_response(request)
+        finally:
+            read_alias.reset(token)
+        return self.finish(request, response)
+
+    def finish(self, request, response):
+        if (request.method not in SAFE_METHODS
+                and response.status_code < 400
+                and settings.DATABASE_REPLICAS):
+            pin_to_primary(request, response)
+        return response
@@ -1,7 +1,139 @@
+import json
+
 from django.conf import settings
-from rest_framework.pagination import PageNumberPagination
+from django.core.exceptions import ValidationError
+from django.db.models import Q
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import CursorPagination, PageNumberPagination
+
+
+def _reverse(ordering):
+    return tuple(field[1:] if field.startswith('-') else f'-{field}'
+                 for field in ordering)
+
+
+class FeedCursorPagination(CursorPagination):
+    """ Keyset-пагинация без OFFSET и COUNT(*). Порядок задаёт вьюха
+    через cursor_ordering или фильтр сортировки; последнее поле порядка
+    должно делать ключ уникальным (id).
+
+    CursorPagination из DRF сравнивает с позицией только первое поле,
+    а строки с равным значением пропускает через OFFSET. Здесь позиция —
+    значения всех полей порядка, и следующая страница начинается строго
+    после неё: (pub_date, id) < (p, i) как
+    pub_date <= p AND (pub_date < p OR (pub_date = p AND id < i)).
+    """
+    page_size = settings.REST_FRAMEWORK['PAGE_SIZE']
+    page_size_query_param = 'limit'
+
+    def __init__(self, ordering):
+        self.ordering = ordering
+
+    def paginate_queryset(self, queryset, request, view=None):
+        # CursorPagination.paginate_queryset, но с фильтром по кортежу
+        self.page_size = self.get_page_size(request)
+        if not self.page_size:
+            return None
+
+        self.base_url = request.build_absolute_uri()
+        self.ordering = self.get_ordering(request, queryset, view)
+
+        self.cursor = self.decode_cursor(request)
+        if self.cursor is None:
+            (offset, reverse, current_position) = (0, False, None)
+        else:
+            (offset, reverse, current_position) = self.cursor
+
+        ordering = _reverse(self.ordering) if reverse else self.ordering
+        queryset = queryset.order_by(*ordering)
+        if current_position is not None:
+            queryset = self.after_position(
+                queryset, ordering, current_position)
+
+        results = list(queryset[offset:offset + self.page_size + 1])
+        self.page = list(results[:self.page_size])
+        following_position = None
+        if len(results) > len(self.page):
+            following_position = self._get_position_from_instance(
+                results[-1], self.ordering)
+        if reverse:
+            self.page = list(reversed(self.page))
+        self.set_neighbours(offset, reverse, current_position,
+                            following_position)
+        if (self.has_previous or self.has_next) and self.template is not None:
+            self.display_page_controls = True
+        return self.page
+
+    def set_neighbours(self, offset, reverse, current_position,
+                       following_position):
+        """ Есть ли страницы до и после текущей и их позиции. """
+        has_current = current_position is not None or offset > 0
+        has_following = following_position is not None
+        if reverse:
+            self.has_next, self.has_previous = has_current, has_following
+            self.next_position = current_position
+            self.previous_position = following_position
+        else:
+            self.has_next, self.has_previous = has_following, has_current
+            self.next_position = following_position
+            self.previous_position = current_position
+
+    def after_position(self, queryset, ordering, position):
+        """ Строки, идущие в порядке ordering строго после position. """
+        try:
+            values = json.loads(position)
+        except ValueError:
+            raise NotFound(self.invalid_cursor_message)
+        if not isinstance(values, list) or len(values) != len(ordering):
+            raise NotFound(self.invalid_cursor_message)
+        names = [field.lstrip('-') for field in ordering]
+        lookups = ['lt' if field.startswith('-') else 'gt'
+                   for field in ordering]
+        after = Q()
+        for index, (name, lookup) in enumerate(zip(names, lookups)):
+            after |= Q(**dict(zip(names[:index], values[:index])),
+                       **{f'{name}__{lookup}': values[index]})
+        # отдельное условие на первое поле база берёт границей индекса
+        bound = Q(**{f'{names[0]}__{lookups[0]}e': values[0]})
+        try:
+            return queryset.filter(bound, after)
+        except (ValueError, ValidationError):
+            raise NotFound(self.invalid_cursor_message)
+
+    def _get_position_from_instance(self, instance, ordering):
+        values = []
+        for field in ordering:
+            name = field.lstrip('-')
+            value = (instance[name] if isinstance(instance, dict)
+                     else getattr(instance, name))
+            values.append(str(value))
+        return json.dumps(values)
 
 
 class AdjustablePagination(PageNumberPagination):
+    """ Постраничный вывод ?page=&limit=. Если вьюха задаёт
+    cursor_ordering, по ?pagination=cursor (или при наличии ?cursor=)
+    включается курсорный режим. """
     page_size = settings.REST_FRAMEWORK['PAGE_SIZE']
     page_size_query_param = 'limit'
+    mode_query_param = 'pagination'
+    cursor_paginator = None
+
+    def use_cursor(self, request, view):
+        return getattr(view, 'cursor_ordering', None) and (
+            request.query_params.get(self.mode_query_param) == 'cursor'
+            or FeedCursorPagination.cursor_query_param
+            in request.query_params)
+
+    def paginate_queryset(self, queryset, request, view=None):
+        if self.use_cursor(request, view):
+            self.cursor_paginator = FeedCursorPagination(view.cursor_ordering)
+            return self.cursor_paginator.paginate_queryset(
+                queryset, request, view)
+        self.cursor_paginator = None
+        return super().paginate_queryset(queryset, request, view)
+
+    def get_paginated_response(self, data):
+        if self.cursor_paginator is not None:
+            return self.cursor_paginator.get_paginated_response(data)
+        return super().get_paginated_response(data)
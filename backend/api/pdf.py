@@ -0,0 +1,76 @@
+import hashlib
+import json
+import os
+import tempfile
+
+from django.conf import settings
+from reportlab.pdfbase import pdfmetrics
+from reportlab.pdfbase.ttfonts import TTFont
+from reportlab.pdfgen import canvas
+
+FONT = 'PTSansRegular'
+BOLD_FONT = 'PTSansBold'
+FONT_FILES = {
+    FONT: 'PTSans-Regular.ttf',
+    BOLD_FONT: 'PTSans-Bold.ttf',
+}
+HEADER = 'СЕРВИС РЕЦЕПТОВ FOODGRAM'
+# файлы крупнее этого размера рендерятся на диск, а не в память
+SPOOL_MAX_SIZE = 1024 * 1024
+
+
+def register_fonts():
+    """ Регистрирует шрифты один раз на процесс (вызывается из ready()). """
+    registered = pdfmetrics.getRegisteredFontNames()
+    for name, filename in FONT_FILES.items():
+        if name not in registered:
+            pdfmetrics.registerFont(TTFont(
+                name, os.path.join(settings.BASE_DIR, filename), 'UTF-8'))
+
+
+def shopping_list_digest(shopping_list):
+    """ Хеш содержимого списка покупок — ключ кеша готовых PDF. """
+    payload = json.dumps(
+        list(shopping_list), ensure_ascii=False, separators=(',', ':'))
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+
+def _page_header(pdf_file):
+    pdf_file.setFont(FONT, 10)
+    pdf_file.drawString(230, 810, HEADER)
+
+
+def render_shopping_list_pdf(shopping_list):
+    """ Рисует список покупок и возвращает файл, открытый на чтение.
+    Большие списки сбрасываются на диск и отдаются потоком. """
+    output = tempfile.SpooledTemporaryFile(max_size=SPOOL_MAX_SIZE)
+    pdf_file = canvas.Canvas(output)
+    _page_header(pdf_file)
+    pdf_file.setFont(BOLD_FONT, 26)
+    pdf_file.drawString(200, 750, 'Список покупок:')
+    pdf_file.setFont(FONT, 14)
+    from_bottom = 700
+    for number, (name, unit, amount) in enumerate(shopping_list, start=1):
+        pdf_file.drawString(
+            60,
+            from_bottom,
+            f'{number}.  {name} - {amount} {unit}'
+        )
+        from_bottom -= 30
+        if from_bottom <= 50:
+            from_bottom = 700
+            pdf_file.showPage()
+            _page_header(pdf_file)
+            pdf_file.setFont(FONT, 14)
+    pdf_file.showPage()
+    pdf_file.save()
+    output.seek(0)
+    return output
+
+
+def render_pdf_bytes(shopping_list):
+    """ Точка входа для дочернего процесса (api.export_jobs): Django там
+    не настроен, нужны только settings и шрифты. """
+    register_fonts()
+    with render_shopping_list_pdf(shopping_list) as pdf_file:
+        return pdf_file.read()
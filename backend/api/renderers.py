@@ -0,0 +1,30 @@
+import json
+
+from rest_framework import renderers
+
+
+class PassthroughRenderer(renderers.BaseRenderer):
+    """ Рендерер только для выбора формата: тело ответа собирают
+    экспортёры, а сюда попадают лишь ответы с ошибками. """
+    charset = 'utf-8'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+        return json.dumps(data, ensure_ascii=False).encode('utf-8')
+
+
+class PDFRenderer(PassthroughRenderer):
+    media_type = 'application/pdf'
+    format = 'pdf'
+    charset = None
+
+
+class PlainTextRenderer(PassthroughRenderer):
+    media_type = 'text/plain'
+    format = 'txt'
+
+
+class CSVRenderer(PassthroughRenderer):
+    media_type = 'text/csv'
+    format = 'csv'
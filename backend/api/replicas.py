@@ -0,0 +1,72 @@
+import hashlib
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from rest_framework.authentication import TokenAuthentication
+from rest_framework.exceptions import AuthenticationFailed
+
+from backend.db.routers import pick_replica, primary_reads, read_alias
+
+SAFE_METHODS = ('GET', 'HEAD', 'OPTIONS')
+# до какого времени (unix) клиент читает из основной БД
+PIN_COOKIE = 'db_primary_until'
+
+
+def pin_key(request):
+    """ Клиент — по токену или сессии, аноним — по адресу. """
+    credential = (request.META.get('HTTP_AUTHORIZATION')
+                  or request.COOKIES.get(settings.SESSION_COOKIE_NAME)
+                  or request.META.get('REMOTE_ADDR', ''))
+    return 'db_primary:' + hashlib.sha256(credential.encode()).hexdigest()
+
+
+def pinned_to_primary(request):
+    """ Писал ли клиент в последние REPLICA_STICKY_SECONDS. Браузеру
+    хватает cookie; клиенту без cookie — отметки в общем кеше. """
+    try:
+        if float(request.COOKIES.get(PIN_COOKIE, 0)) > time.time():
+            return True
+    except ValueError:
+        pass
+    return cache.get(pin_key(request)) is not None
+
+
+def pin_to_primary(request, response):
+    seconds = settings.REPLICA_STICKY_SECONDS
+    response.set_cookie(PIN_COOKIE, str(int(time.time()) + seconds),
+                        max_age=seconds, httponly=True, samesite='Lax')
+    cache.set(pin_key(request), 1, seconds)
+
+
+def read_alias_for(request):
+    """ Реплика для безопасного запроса клиента, который давно не писал;
+    None — читать из default. """
+    if (not settings.DATABASE_REPLICAS
+            or request.method not in SAFE_METHODS
+            or pinned_to_primary(request)):
+        return None
+    return pick_replica()
+
+
+class PrimaryReadMixin:
+    """ Вьюха читает только из default, даже на GET: например, статус
+    задачи, которую только что создал этот же клиент. """
+
+    def dispatch(self, request, *args, **kwargs):
+        with primary_reads():
+            return super().dispatch(request, *args, **kwargs)
+
+
+class ReplicaTokenAuthentication(TokenAuthentication):
+    """ Токен, выданный только что при входе, может ещё не дойти
+    до реплики: при промахе он ищется в default. """
+
+    def authenticate_credentials(self, key):
+        try:
+            return super().authenticate_credentials(key)
+        except AuthenticationFailed:
+            if read_alias.get() is None:
+                raise
+        with primary_reads():
+            return super().authenticate_credentials(key)
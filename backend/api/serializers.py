@@ -1,9 +1,17 @@
 # isort: skip_file
 from django.core.exceptions import ValidationError
+from django.db import transaction
 from drf_extra_fields.fields import Base64ImageField
 from rest_framework import serializers
 
-from recipes.models import Ingredient, ReciIngredi, Recipe, Tag
+from api.fields import RecipeImageField, RenditionField
+from api.user_state import get_user_state
+from recipes.cart_summary import (carting_users, lines_totals,
+                                  recipe_ingredients_changed)
+from recipes.images import schedule_renditions
+from recipes.models import (ExportJob, Ingredient, ReciIngredi, Recipe,
+                            ShoppingListItem, Tag)
+from recipes.search import update_search_index
 from users.models import Follow
 from users.serializers import UserReadSerializer
 
@@ -35,21 +43,22 @@ class ReciIngrediReadSerializer(serializers.ModelSerializer):
         fields = ('id', 'name', 'measurement_unit', 'amount')
 
 
-class ReciIngrediWriteSerializer(serializers.ModelSerializer):
-    """ Сериализатор для create/update рецептов, мини-формат. """
-    recipe = serializers.PrimaryKeyRelatedField(read_only=True)
-    amount = serializers.IntegerField(write_only=True, min_value=1)
-    id = serializers.PrimaryKeyRelatedField(
-        source='ingredient',
-        queryset=Ingredient.objects.all())
-
-    class Meta:
-        model = ReciIngredi
-        fields = ('id', 'amount', 'recipe')
+class ReciIngrediWriteSerializer(serializers.Serializer):
+    """ Сериализатор для create/update рецептов, мини-формат.
+    Существование id проверяет RecipeWriteSerializer одним запросом
+    на весь список. """
+    id = serializers.IntegerField(min_value=1)
+    amount = serializers.IntegerField(
+        write_only=True, min_value=1, max_value=32767)
 
 
 class SubscriptionsSerializer(serializers.ModelSerializer):
-    """ Сериализатор для вывода страницы «Мои подписки». """
+    """ Сериализатор для вывода страницы «Мои подписки».
+
+    Страница подписок заранее кладёт в Follow аннотацию recipes_count
+    и список recent_recipes (см. api.utils.attach_recent_recipes),
+    тогда на строку не выполняется ни одного запроса.
+    """
     id = serializers.ReadOnlyField(source='following.id')
     email = serializers.ReadOnlyField(source='following.email')
     username = serializers.ReadOnlyField(source='following.username')
@@ -57,7 +66,7 @@ class SubscriptionsSerializer(serializers.ModelSerializer):
     last_name = serializers.ReadOnlyField(source='following.last_name')
     is_subscribed = serializers.SerializerMethodField()
     recipes = serializers.SerializerMethodField()
-    recipes_count = serializers.ReadOnlyField(source='following.recipes.count')
+    recipes_count = serializers.SerializerMethodField()
 
     class Meta:
         model = Follow
@@ -65,28 +74,73 @@ class SubscriptionsSerializer(serializers.ModelSerializer):
                   'is_subscribed', 'recipes', 'recipes_count')
 
     def get_is_subscribed(self, obj):
-        """ Возвращает True, если есть подписка. """
-        return Follow.objects.filter(
-            user=obj.user, following=obj.following).exists()
+        """ Сериализуется только существующая подписка. """
+        return True
 
     def get_recipes(self, obj):
         """ Выводит заданное число рецептов автора в его карточке. """
-        request = self.context['request']
-        rec_limit = request.GET.get('recipes_limit')
-        queryset = Recipe.objects.filter(
-            author=obj.following).order_by('-pub_date')
-        if rec_limit:
-            queryset = queryset[:int(rec_limit)]
-        return RecipeMiniSerializer(queryset, many=True).data
+        if hasattr(obj, 'recent_recipes'):
+            recipes = obj.recent_recipes
+        else:
+            rec_limit = recipes_limit(self.context['request'])
+            recipes = Recipe.objects.filter(
+                author=obj.following_id).order_by('-pub_date')
+            if rec_limit is not None:
+                recipes = recipes[:rec_limit]
+        return RecipeMiniSerializer(recipes, many=True).data
+
+    def get_recipes_count(self, obj):
+        if hasattr(obj, 'recipes_count'):
+            return obj.recipes_count
+        return obj.following.recipes.count()
+
+
+def recipes_limit(request):
+    """ ?recipes_limit= для карточек подписок; None — без ограничения. """
+    value = request.query_params.get('recipes_limit')
+    if not value:
+        return None
+    try:
+        value = int(value)
+    except ValueError:
+        raise serializers.ValidationError(
+            {'recipes_limit': 'Ожидается целое число.'})
+    if value < 0:
+        raise serializers.ValidationError(
+            {'recipes_limit': 'Не может быть отрицательным.'})
+    return value
+
+
+class RecipeIdsSerializer(serializers.Serializer):
+    """ Список id рецептов для массового добавления/удаления. """
+    recipes = serializers.ListField(
+        child=serializers.IntegerField(min_value=1),
+        allow_empty=False, max_length=100)
+
+
+class ShoppingListItemSerializer(serializers.ModelSerializer):
+    """ Строка сводки списка покупок. """
+    class Meta:
+        model = ShoppingListItem
+        fields = ('name', 'measurement_unit', 'amount')
+
+
+class ExportJobSerializer(serializers.ModelSerializer):
+    """ Статус фоновой выгрузки; file — ссылка на готовый PDF. """
+    class Meta:
+        model = ExportJob
+        fields = ('id', 'status', 'file', 'error', 'created_at',
+                  'finished_at')
 
 
 class RecipeMiniSerializer(serializers.ModelSerializer):
     """ Сериализатор миниформата рецепта (для Favs и Cart). """
     image = Base64ImageField()
+    image_thumb = RenditionField()
 
     class Meta:
         model = Recipe
-        fields = ['name', 'image', 'cooking_time']
+        fields = ['name', 'image', 'image_thumb', 'cooking_time']
 
 
 class RecipeReadSerializer(serializers.ModelSerializer):
@@ -95,6 +149,8 @@ class RecipeReadSerializer(serializers.ModelSerializer):
     author = UserReadSerializer(read_only=True)
     ingredients = serializers.SerializerMethodField()
     image = Base64ImageField(max_length=None, use_url=True)
+    image_card = RenditionField()
+    image_thumb = RenditionField()
     is_favorited = serializers.SerializerMethodField()
     is_in_shopping_cart = serializers.SerializerMethodField()
 
@@ -102,22 +158,23 @@ class RecipeReadSerializer(serializers.ModelSerializer):
         model = Recipe
         fields = (
             'id', 'tags', 'author', 'ingredients', 'name', 'image',
-            'text', 'cooking_time', 'is_favorited', 'is_in_shopping_cart')
+            'image_card', 'image_thumb', 'text', 'cooking_time',
+            'is_favorited', 'is_in_shopping_cart')
         read_only_fields = ('id', 'author',)
 
     def get_is_favorited(self, obj):
-        """ Возвращает True, если рецепт в списке покупок. """
-        user = self.context['request'].user
-        return user.pk and obj.faved_by.filter(id=user.pk).exists()
+        """ Возвращает True, если рецепт в избранном. """
+        return obj.pk in get_user_state(
+            self.context.get('request')).favorites
 
     def get_is_in_shopping_cart(self, obj):
         """ Возвращает True, если рецепт в списке покупок. """
-        user = self.context['request'].user
-        return user.pk and obj.in_cart_for.filter(id=user.pk).exists()
+        return obj.pk in get_user_state(self.context.get('request')).cart
 
     def get_ingredients(self, obj):
-        rec_ings = ReciIngredi.objects.filter(recipe=obj)
-        return ReciIngrediReadSerializer(rec_ings, many=True).data
+        """ Берёт ингредиенты из prefetch_related, если он был. """
+        return ReciIngrediReadSerializer(
+            obj.reciingredi_set.all(), many=True).data
 
     def validate_cooking_time(self, value):
         """ Время приготовления не более ~2 суток (некоторые супы). """
@@ -127,30 +184,51 @@ class RecipeReadSerializer(serializers.ModelSerializer):
 
 
 class RecipeWriteSerializer(serializers.ModelSerializer):
-    """ Сериализатор для POST/PATCH-запросов рецептов. """
-    tags = serializers.PrimaryKeyRelatedField(
-        many=True, queryset=Tag.objects.all())
+    """ Сериализатор для POST/PATCH-запросов рецептов.
+
+    Число запросов не зависит от числа ингредиентов и тегов: id
+    проверяются одним id__in на список, состав обновляется разницей
+    (bulk_create / bulk_update / delete), а ответ собирается из тех же
+    объектов в памяти.
+    """
+    tags = serializers.ListField(child=serializers.IntegerField(min_value=1))
     ingredients = ReciIngrediWriteSerializer(many=True)
-    image = Base64ImageField(max_length=None, use_url=True)
+    image = RecipeImageField(max_length=None, use_url=True)
     author = UserReadSerializer(read_only=True)
 
     class Meta:
         model = Recipe
         fields = ('id', 'ingredients', 'tags', 'image',
                   'name', 'text', 'cooking_time', 'author')
-        read_only_fields = ('id', 'author', 'tags')
+        read_only_fields = ('id', 'author')
+
+    def validate_tags(self, value):
+        """ id тегов -> объекты Tag, одним запросом. """
+        tags = list(Tag.objects.filter(id__in=value))
+        missing = set(value) - {tag.pk for tag in tags}
+        if missing:
+            raise serializers.ValidationError(
+                f'Тегов не существует: {sorted(missing)}')
+        return tags
 
-    def validate(self, data):
-        ingredients = self.initial_data.get('ingredients')
-        ingredients_list = [ingredient['id'] for ingredient in ingredients]
-        if len(ingredients_list) != len(set(ingredients_list)):
+    def validate_ingredients(self, value):
+        """ id ингредиентов -> объекты Ingredient, одним запросом. """
+        ids = [item['id'] for item in value]
+        if len(ids) != len(set(ids)):
             raise serializers.ValidationError(
                 'Проверьте, какой-то ингредиент был выбран более 1 раза'
             )
-        return data
+        ingredients = Ingredient.objects.in_bulk(ids)
+        missing = set(ids) - ingredients.keys()
+        if missing:
+            raise serializers.ValidationError(
+                f'Ингредиентов не существует: {sorted(missing)}')
+        return [{'ingredient': ingredients[item['id']],
+                 'amount': item['amount']} for item in value]
 
+    @transaction.atomic
     def create(self, validated_data):
-        """ Создаёт вложенные сериализаторы tag и ingredient. """
+        """ Создаёт рецепт вместе с тегами и ингредиентами. """
         current_user = self.context['request'].user
         if not current_user.pk:
             raise serializers.ValidationError('Пользователя не существует.')
@@ -158,35 +236,110 @@ class RecipeWriteSerializer(serializers.ModelSerializer):
         tags_data = validated_data.pop('tags')
         recipe = Recipe.objects.create(author=current_user, **validated_data)
         recipe.tags.set(tags_data)
-        ing_bulk_data = (
+        lines = [
             ReciIngredi(ingredient=ing['ingredient'],
                         recipe=recipe,
                         amount=ing['amount'])
-            for ing in ingredients_data)
-        ReciIngredi.objects.bulk_create(ing_bulk_data)
+            for ing in ingredients_data]
+        ReciIngredi.objects.bulk_create(lines)
+        update_search_index((recipe.pk,))
+        schedule_renditions(recipe)
+        self.remember_relations(recipe, tags_data, lines)
         return recipe
 
+    @transaction.atomic
     def update(self, instance, validated_data):
-        """ Переписывает целиком вложенные сериализаторы tag и ingredient. """
-        ingredients_data = validated_data.pop('ingredients')
-        tags_data = validated_data.pop('tags')
-        instance.tags.set(tags_data)
-        current_ings = ReciIngredi.objects.filter(recipe=instance.id)
-        current_ings.delete()
-        ing_bulk_data = (
-            ReciIngredi(ingredient=ing['ingredient'],
-                        recipe=instance,
-                        amount=ing['amount'])
-            for ing in ingredients_data)
-        ReciIngredi.objects.bulk_create(ing_bulk_data)
-        return super().update(instance, validated_data)
+        """ Переписывает теги и применяет к ингредиентам разницу
+        со старым составом. Без tags/ingredients в PATCH они остаются
+        прежними. """
+        ingredients_data = validated_data.pop('ingredients', None)
+        tags_data = validated_data.pop('tags', None)
+        if tags_data is not None:
+            instance.tags.set(tags_data)
+        else:
+            tags_data = list(instance.tags.all())
+        current = self.current_lines(instance)
+        if ingredients_data is not None:
+            lines = self.apply_ingredients(
+                instance, current, ingredients_data)
+        else:
+            lines = current
+        if 'image' in validated_data:
+            # копии старого фото больше не подходят
+            instance.image_card = instance.image_thumb = ''
+        instance = super().update(instance, validated_data)
+        if ingredients_data is not None:
+            # название и описание обновил post_save, состав — здесь
+            update_search_index((instance.pk,))
+        if 'image' in validated_data:
+            schedule_renditions(instance)
+        self.remember_relations(instance, tags_data, lines)
+        return instance
+
+    def apply_ingredients(self, recipe, current, ingredients_data):
+        """ Пишет в базу только изменившиеся строки состава и
+        сдвигает сводки корзин с этим рецептом. Возвращает новый
+        состав в порядке запроса. """
+        before = lines_totals(self.line_rows(current))
+        existing = {line.ingredient_id: line for line in current}
+        lines, to_create, to_update = [], [], []
+        for ing in ingredients_data:
+            line = existing.pop(ing['ingredient'].pk, None)
+            if line is None:
+                line = ReciIngredi(ingredient=ing['ingredient'],
+                                   recipe=recipe, amount=ing['amount'])
+                to_create.append(line)
+            elif line.amount != ing['amount']:
+                line.amount = ing['amount']
+                to_update.append(line)
+            line.ingredient = ing['ingredient']
+            lines.append(line)
+        to_delete = list(existing.values())
+        if not (to_create or to_update or to_delete):
+            return lines
+        if to_delete:
+            ReciIngredi.objects.filter(
+                pk__in=[line.pk for line in to_delete]).delete()
+        if to_update:
+            ReciIngredi.objects.bulk_update(to_update, ('amount',))
+        if to_create:
+            ReciIngredi.objects.bulk_create(to_create)
+        # сводки корзин с этим рецептом сдвигаются на разницу составов
+        users = carting_users(recipe.pk)
+        if users:
+            recipe_ingredients_changed(
+                users, before, lines_totals(self.line_rows(lines)))
+        return lines
+
+    @staticmethod
+    def current_lines(recipe):
+        """ Текущий состав: из prefetch_related вьюсета, если он был,
+        иначе одним запросом. """
+        if 'reciingredi_set' in getattr(
+                recipe, '_prefetched_objects_cache', {}):
+            return list(recipe.reciingredi_set.all())
+        return list(recipe.reciingredi_set.select_related('ingredient'))
+
+    @staticmethod
+    def line_rows(lines):
+        return ((line.ingredient.name, line.ingredient.measurement_unit,
+                 line.amount) for line in lines)
+
+    @staticmethod
+    def remember_relations(recipe, tags, lines):
+        """ Оставляет записанные теги и состав на объекте: ответ
+        строится без повторного чтения из базы. Кэш prefetch_related
+        не годится — UpdateModelMixin очищает его после сохранения. """
+        recipe.written_relations = (tags, lines)
 
     def to_representation(self, instance):
         self.fields.pop('ingredients')
         self.fields.pop('tags')
         representation = super().to_representation(instance)
+        tags, lines = getattr(instance, 'written_relations', (None, None))
+        if tags is None:
+            tags, lines = instance.tags.all(), self.current_lines(instance)
         representation['ingredients'] = ReciIngrediReadSerializer(
-            ReciIngredi.objects.filter(recipe=instance), many=True
-        ).data
-        representation['tags'] = TagSerializer(instance.tags, many=True).data
+            lines, many=True).data
+        representation['tags'] = TagSerializer(tags, many=True).data
         return representation
@@ -0,0 +1,87 @@
+from django.db.models.signals import (m2m_changed, post_delete, post_save,
+                                      pre_delete, pre_save)
+from django.dispatch import receiver
+
+from api.cache import invalidate_recipe_feed, touch_tables
+from api.ingredient_index import invalidate_ingredient_index
+from api.tag_map import invalidate_tag_map
+from recipes.cart_summary import recipe_deleted
+from recipes.models import Ingredient, ReciIngredi, Recipe, Tag
+from recipes.scores import create_recipe_score
+from recipes.search import SEARCH_FIELDS, update_search_index
+from users.models import User
+
+
+@receiver(post_save, sender=Recipe)
+@receiver(post_delete, sender=Recipe)
+@receiver(post_save, sender=ReciIngredi)
+@receiver(post_delete, sender=ReciIngredi)
+@receiver(post_save, sender=Tag)
+@receiver(post_delete, sender=Tag)
+@receiver(post_save, sender=Ingredient)
+@receiver(post_delete, sender=Ingredient)
+def recipe_feed_changed(**kwargs):
+    """ Любое изменение данных ленты сбрасывает её кеш. """
+    invalidate_recipe_feed()
+
+
+@receiver(pre_save, sender=Recipe)
+def recipe_search_fields_changed(instance, update_fields=None, **kwargs):
+    """ Меняются ли название или описание: сохранение рецепта из админки
+    или кода, а не из сериализатора, тоже должно обновить поиск. """
+    if update_fields is not None and not set(SEARCH_FIELDS) & set(
+            update_fields):
+        instance._search_changed = False
+        return
+    saved = Recipe.objects.filter(pk=instance.pk).values_list(
+        *SEARCH_FIELDS).first() if instance.pk else None
+    instance._search_changed = saved != tuple(
+        getattr(instance, field) for field in SEARCH_FIELDS)
+
+
+@receiver(post_save, sender=Recipe)
+def recipe_search_refresh(instance, **kwargs):
+    if getattr(instance, '_search_changed', True):
+        update_search_index((instance.pk,))
+
+
+@receiver(post_save, sender=Recipe)
+def recipe_score_created(instance, created, raw=False, **kwargs):
+    """ Ленты по рейтингу соединяются с RecipeScore: рецепт из админки
+    или shell без своей строки выпал бы из них до rebuild_scores. """
+    if created and not raw:
+        create_recipe_score(instance)
+
+
+@receiver(m2m_changed, sender=Recipe.tags.through)
+def recipe_tags_changed(action, **kwargs):
+    if action.startswith('post_'):
+        invalidate_recipe_feed()
+
+
+@receiver(post_save, sender=Ingredient)
+@receiver(post_delete, sender=Ingredient)
+def ingredients_changed(**kwargs):
+    invalidate_ingredient_index()
+    touch_tables('ingredients')
+
+
+@receiver(post_save, sender=Tag)
+@receiver(post_delete, sender=Tag)
+def tags_changed(**kwargs):
+    invalidate_tag_map()
+    touch_tables('tags')
+
+
+@receiver(post_save, sender=User)
+@receiver(post_delete, sender=User)
+def users_changed(**kwargs):
+    """ Профиль автора входит в карточку рецепта. """
+    touch_tables('users')
+
+
+@receiver(pre_delete, sender=Recipe)
+def recipe_leaves_carts(instance, **kwargs):
+    """ Строки Cart удалятся каскадом, до этого вычитаем рецепт
+    из сводок списков покупок. """
+    recipe_deleted(instance.pk)
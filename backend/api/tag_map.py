@@ -0,0 +1,36 @@
+from api.cache import ProcessLocalSnapshot
+from recipes.models import Tag
+
+
+class TagSlugMap(ProcessLocalSnapshot):
+    """ slug → id всех тегов в памяти процесса: фильтр рецептов
+    проверяет и переводит слаги без запроса к таблице тегов. """
+    version_key = 'tag_map:version'
+
+    def __init__(self):
+        super().__init__()
+        self._ids = {}
+
+    def build(self):
+        self._ids = dict(Tag.objects.values_list('slug', 'id'))
+
+    def choices(self):
+        self.ensure_fresh()
+        return [(slug, slug) for slug in self._ids]
+
+    def ids(self, slugs):
+        self.ensure_fresh()
+        return [self._ids[slug] for slug in slugs if slug in self._ids]
+
+
+tag_map = TagSlugMap()
+
+
+def tag_choices():
+    """ Отдельная функция, а не метод: фильтры django-filter копируются
+    через deepcopy, а блокировку внутри tag_map скопировать нельзя. """
+    return tag_map.choices()
+
+
+def invalidate_tag_map():
+    TagSlugMap.invalidate()
@@ -0,0 +1,847 @@
+# isort: skip_file
+import base64
+import importlib
+import io
+import os
+import shutil
+import sys
+import tempfile
+import threading
+import time
+import warnings
+from unittest import mock
+
+from asgiref.sync import async_to_sync
+from django.conf import settings
+from django.core.cache import cache
+from django.core.cache.backends.base import CacheKeyWarning
+from django.core.exceptions import ImproperlyConfigured
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.core.signals import request_started
+from django.db import OperationalError, connection
+from django.http import HttpResponse
+from django.test import RequestFactory, SimpleTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from PIL import Image
+from psycopg2.extensions import (TRANSACTION_STATUS_IDLE,
+                                 TRANSACTION_STATUS_INTRANS)
+from rest_framework.authtoken.models import Token
+from rest_framework.decorators import api_view, permission_classes
+from rest_framework.permissions import AllowAny
+from rest_framework.response import Response
+from rest_framework.test import APITestCase
+
+from api.async_views import pooled
+from api.export_jobs import run_export_job
+from api.middleware import ReplicaRoutingMiddleware
+from api.metrics import (PIDS_KEY, SNAPSHOT_KEY, collected_samples,
+                         registry)
+from api.replicas import PIN_COOKIE
+from backend.db.pooled_postgresql.base import ConnectionPool
+from backend.db.routers import ReplicaRouter, primary_reads, read_alias
+from recipes.models import (Cart, ExportJob, Favorite, Ingredient,
+                            ReciIngredi, Recipe, RecipeScore, Tag)
+from users.models import Follow, User
+
+
+class RecipeDataMixin:
+    """ Пользователи, теги, ингредиенты и рецепты для тестов API. """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = cls.make_user('author')
+        cls.reader = cls.make_user('reader')
+        cls.tags = [
+            Tag.objects.create(name=slug, color='#FF0000', slug=slug)
+            for slug in ('breakfast', 'lunch', 'dinner')]
+        cls.ingredients = [
+            Ingredient.objects.create(name=f'ингредиент {i}',
+                                      measurement_unit='г')
+            for i in range(3)]
+
+    @staticmethod
+    def make_user(username):
+        return User.objects.create_user(
+            username=username, email=f'{username}@example.com',
+            password='password', first_name=username, last_name=username)
+
+    def make_recipes(self, count, tags=None):
+        recipes = []
+        for _ in range(count):
+            recipe = Recipe.objects.create(
+                author=self.author, name=f'рецепт {Recipe.objects.count()}',
+                image='recipes/test.png', text='текст', cooking_time=10)
+            recipe.tags.set(self.tags if tags is None else tags)
+            ReciIngredi.objects.bulk_create(
+                ReciIngredi(recipe=recipe, ingredient=ingredient, amount=1)
+                for ingredient in self.ingredients)
+            recipes.append(recipe)
+        return recipes
+
+    def setUp(self):
+        # лента, справочники и флаги пользователя кешируются
+        cache.clear()
+
+    def login(self, user):
+        token, _ = Token.objects.get_or_create(user=user)
+        self.client.credentials(HTTP_AUTHORIZATION=f'Token {token.key}')
+
+
+class RecipeListQueriesTest(RecipeDataMixin, APITestCase):
+    """ Число запросов страницы рецептов не зависит от её размера. """
+    url = '/api/recipes/?limit=10'
+    # COUNT(*), рецепты с авторами, теги, ингредиенты
+    anonymous_queries = 4
+    # и ещё токен, избранное, корзина и подписки пользователя
+    authenticated_queries = 8
+
+    def assert_list_queries(self, number):
+        for count in (1, 7):
+            self.make_recipes(count)
+            cache.clear()
+            with self.assertNumQueries(number):
+                response = self.client.get(self.url)
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(len(response.data['results']),
+                             Recipe.objects.count())
+
+    def test_anonymous(self):
+        self.assert_list_queries(self.anonymous_queries)
+
+    def test_authenticated(self):
+        recipe = self.make_recipes(1)[0]
+        Favorite.objects.create(user=self.reader, recipe=recipe)
+        Cart.objects.create(user=self.reader, recipe=recipe)
+        Follow.objects.create(user=self.reader, following=self.author)
+        self.login(self.reader)
+        self.assert_list_queries(self.authenticated_queries)
+        results = self.client.get(self.url).data['results']
+        flags = {item['id']: (item['is_favorited'],
+                              item['is_in_shopping_cart'])
+                 for item in results}
+        self.assertEqual(flags.pop(recipe.pk), (True, True))
+        self.assertEqual(set(flags.values()), {(False, False)})
+        self.assertTrue(results[0]['author']['is_subscribed'])
+
+
+class CursorPaginationTest(RecipeDataMixin, APITestCase):
+    """ Курсор идёт по (pub_date, id) или по (рейтинг, id): рецепты
+    с одинаковым ключом не теряются и не повторяются на границах
+    страниц. """
+
+    def walk(self, url):
+        ids = []
+        while url:
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+            ids += [item['id'] for item in response.data['results']]
+            url = response.data['next']
+        return ids
+
+    def test_equal_pub_dates(self):
+        recipes = self.make_recipes(7)
+        Recipe.objects.filter(pk__in=[recipe.pk for recipe in recipes[1:6]]
+                              ).update(pub_date=recipes[0].pub_date)
+        expected = list(Recipe.objects.order_by(
+            '-pub_date', '-id').values_list('id', flat=True))
+        self.assertEqual(
+            self.walk('/api/recipes/?pagination=cursor&limit=2'), expected)
+
+    def test_score_feed(self):
+        recipes = self.make_recipes(7)
+        # рейтинг не совпадает с порядком дат, часть значений равна
+        for recipe, popular in zip(recipes, (2, 5, 2, 9, 5, 2, 1)):
+            RecipeScore.objects.update_or_create(
+                recipe=recipe, defaults={'popular': popular})
+        expected = list(RecipeScore.objects.order_by(
+            '-popular', '-recipe_id').values_list('recipe_id', flat=True))
+        self.assertEqual(self.walk(
+            '/api/recipes/?pagination=cursor&limit=2&ordering=popular'),
+            expected)
+
+    def test_score_feed_without_rebuild(self):
+        # рецепты из админки и shell тоже попадают в ленты по рейтингу
+        recipes = self.make_recipes(3)
+        for feed in ('popular', 'trending'):
+            self.assertEqual(
+                self.walk(f'/api/recipes/?pagination=cursor&ordering={feed}'),
+                [recipe.pk for recipe in reversed(recipes)])
+
+    def test_empty_subscriptions(self):
+        self.login(self.reader)
+        for query in ('', '?pagination=cursor'):
+            response = self.client.get(f'/api/users/subscriptions/{query}')
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(response.data['results'], [])
+
+
+class TagFilterTest(RecipeDataMixin, APITestCase):
+    """ ?tags= с любым из тегов и ?tags_mode=all — со всеми. """
+
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        breakfast, lunch, dinner = cls.tags
+        cls.recipes = {
+            'breakfast': cls.make_recipe([breakfast]),
+            'breakfast_lunch': cls.make_recipe([breakfast, lunch]),
+            'dinner': cls.make_recipe([dinner]),
+        }
+
+    @classmethod
+    def make_recipe(cls, tags):
+        recipe = Recipe.objects.create(
+            author=cls.author, name=' '.join(tag.slug for tag in tags),
+            image='recipes/test.png', text='текст', cooking_time=10)
+        recipe.tags.set(tags)
+        return recipe
+
+    def names(self, query):
+        response = self.client.get(f'/api/recipes/?{query}')
+        self.assertEqual(response.status_code, 200)
+        ids = {item['id'] for item in response.data['results']}
+        return {name for name, recipe in self.recipes.items()
+                if recipe.pk in ids}
+
+    def recipe_queries(self, query):
+        """ SQL запросов к рецептам по уже прогретой карте тегов. """
+        self.names('tags=dinner')
+        with CaptureQueriesContext(connection) as queries:
+            with self.assertNumQueries(
+                    RecipeListQueriesTest.anonymous_queries):
+                self.names(query)
+        sqls = [query['sql'] for query in queries.captured_queries]
+        for sql in sqls:
+            self.assertNotIn('DISTINCT', sql)
+        # слаги переводит tag_map; теги читает только prefetch карточек
+        self.assertEqual([
+            sql for sql in sqls if 'FROM "recipes_tag"' in sql
+            and '_prefetch_related_val' not in sql], [])
+        recipe_sqls = [sql for sql in sqls if 'FROM "recipes_recipe" ' in sql]
+        self.assertEqual(len(recipe_sqls), 2)
+        for sql in recipe_sqls:
+            self.assertNotIn('JOIN "recipes_recipe_tags"', sql)
+        return recipe_sqls
+
+    def test_any(self):
+        self.assertEqual(self.names('tags=breakfast'),
+                         {'breakfast', 'breakfast_lunch'})
+        self.assertEqual(self.names('tags=lunch&tags=dinner'),
+                         {'breakfast_lunch', 'dinner'})
+
+    def test_any_plan(self):
+        for sql in self.recipe_queries('tags=breakfast&tags=lunch'):
+            self.assertIn('EXISTS', sql)
+            self.assertNotIn('GROUP BY', sql)
+
+    def test_all(self):
+        self.assertEqual(
+            self.names('tags=breakfast&tags=lunch&tags_mode=all'),
+            {'breakfast_lunch'})
+        self.assertEqual(
+            self.names('tags=lunch&tags=dinner&tags_mode=all'), set())
+
+    def test_all_plan(self):
+        for sql in self.recipe_queries(
+                'tags=breakfast&tags=lunch&tags_mode=all'):
+            self.assertIn('GROUP BY', sql)
+            self.assertIn('HAVING COUNT', sql)
+
+    def test_all_with_repeated_slug(self):
+        self.assertEqual(
+            self.names('tags=breakfast&tags=breakfast&tags_mode=all'),
+            {'breakfast', 'breakfast_lunch'})
+
+    def test_unknown_slug(self):
+        response = self.client.get('/api/recipes/?tags=brunch')
+        self.assertEqual(response.status_code, 400)
+
+
+class SearchIndexTest(RecipeDataMixin, APITestCase):
+    """ Правка названия мимо сериализатора (админка, shell) сразу
+    видна в поиске. """
+
+    def found(self, text):
+        response = self.client.get('/api/recipes/', {'search': text})
+        return [item['id'] for item in response.data['results']]
+
+    def test_name_change_outside_serializer(self):
+        recipe = self.make_recipes(1)[0]
+        self.assertEqual(self.found('рецепт'), [recipe.pk])
+        recipe.name = 'окрошка'
+        recipe.save()
+        cache.clear()
+        self.assertEqual(self.found('окрошка'), [recipe.pk])
+        self.assertEqual(self.found('рецепт'), [])
+
+    def test_unrelated_update_skips_index(self):
+        recipe = self.make_recipes(1)[0]
+        recipe.cooking_time = 20
+        with self.assertNumQueries(1):
+            recipe.save(update_fields=('cooking_time',))
+
+
+class CartSummaryTest(RecipeDataMixin, APITestCase):
+    """ Сводка списка покупок сдвигается ровно на добавленные
+    и убранные рецепты, килограммы переводятся в граммы. """
+    url = '/api/recipes/shopping_cart_summary/'
+
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        grams = Ingredient.objects.create(name='мука', measurement_unit='г')
+        kilograms = Ingredient.objects.create(name='мука',
+                                              measurement_unit='кг')
+        cls.recipes = []
+        for ingredient, amount in ((grams, 500), (kilograms, 2),
+                                   (grams, 100)):
+            recipe = Recipe.objects.create(
+                author=cls.author, name=f'хлеб {amount}',
+                image='recipes/test.png', text='текст', cooking_time=10)
+            ReciIngredi.objects.create(recipe=recipe, ingredient=ingredient,
+                                       amount=amount)
+            cls.recipes.append(recipe)
+
+    def setUp(self):
+        super().setUp()
+        self.login(self.reader)
+
+    def summary(self):
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 200)
+        return [(item['name'], item['measurement_unit'], item['amount'])
+                for item in response.data]
+
+    def bulk(self, method, recipes):
+        return getattr(self.client, method)(
+            '/api/recipes/shopping_cart/',
+            {'recipes': [recipe.pk for recipe in recipes]}, format='json')
+
+    def test_add_and_remove(self):
+        first, second, third = self.recipes
+        response = self.client.post(
+            f'/api/recipes/{first.pk}/shopping_cart/')
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(self.summary(), [('мука', 'г', 500)])
+        # рецепт, уже лежащий в корзине, второй раз не считается
+        self.assertEqual(self.bulk('post', self.recipes).status_code, 201)
+        self.assertEqual(self.summary(), [('мука', 'г', 2600)])
+        first.refresh_from_db()
+        self.assertEqual(first.carts_count, 1)
+        self.assertEqual(self.bulk('delete', (second, third)).status_code,
+                         204)
+        self.assertEqual(self.summary(), [('мука', 'г', 500)])
+        response = self.client.delete(
+            f'/api/recipes/{first.pk}/shopping_cart/')
+        self.assertEqual(response.status_code, 204)
+        self.assertEqual(self.summary(), [])
+        self.assertEqual(
+            set(Recipe.objects.values_list('carts_count', flat=True)), {0})
+
+
+class MetricsTest(APITestCase):
+    """ Снимки замеров процессов в общем кеше. """
+
+    def setUp(self):
+        cache.clear()
+
+    def test_dead_process_forgotten(self):
+        cache.set(PIDS_KEY, {-1, -2}, None)
+        cache.set(SNAPSHOT_KEY.format(pid=-1), {'Test.list': [{'total': 1}]})
+        self.assertEqual(collected_samples()['Test.list'], [{'total': 1}])
+        # у -2 снимка нет: процесс перезапущен, снимок истёк
+        self.assertEqual(cache.get(PIDS_KEY), {-1})
+
+    def test_flush_registers_pid_with_ttl(self):
+        registry.flush({'Test.list': [{'total': 1}]})
+        self.assertIn(os.getpid(), cache.get(PIDS_KEY))
+        cache.delete(SNAPSHOT_KEY.format(pid=os.getpid()))
+        with self.settings(API_METRICS_TTL=-1):
+            # снимок с истёкшим сроком сразу недоступен
+            registry.flush({'Test.list': [{'total': 1}]})
+        self.assertIsNone(cache.get(SNAPSHOT_KEY.format(pid=os.getpid())))
+
+
+class FeedCacheTest(RecipeDataMixin, APITestCase):
+    """ Лента для анонимов кешируется по нормализованному адресу. """
+
+    def test_long_query(self):
+        self.make_recipes(2)
+        params = [('author', self.author.pk), ('search', 'рецепт' * 50)]
+        with warnings.catch_warnings():
+            warnings.simplefilter('error', CacheKeyWarning)
+            first = self.client.get('/api/recipes/', params)
+            # тот же запрос с другим порядком параметров — из кеша
+            with self.assertNumQueries(0):
+                second = self.client.get('/api/recipes/', params[::-1])
+        self.assertEqual(first.status_code, 200)
+        self.assertEqual(second.data, first.data)
+
+
+class LoadIngredientsTest(APITestCase):
+    """ Загрузка ингредиентов из CSV. """
+
+    def load(self, text):
+        with tempfile.NamedTemporaryFile(
+                'w', suffix='.csv', encoding='utf-8') as file:
+            file.write(text)
+            file.flush()
+            call_command('load_ingredients', file=file.name,
+                         stdout=io.StringIO())
+
+    def test_load(self):
+        self.load('name,measurement_unit\nсоль,г\nсоль,г\nмука,кг\n')
+        self.assertEqual(
+            set(Ingredient.objects.values_list('name', 'measurement_unit')),
+            {('соль', 'г'), ('мука', 'кг')})
+
+    def test_malformed_row(self):
+        with self.assertRaisesMessage(CommandError, 'Строка 3'):
+            self.load('name,measurement_unit\nсоль,г\nперец\n')
+        self.assertFalse(Ingredient.objects.exists())
+
+
+class FlagToggleTest(RecipeDataMixin, APITestCase):
+    """ Избранное по одному рецепту и списком: повторы не дают 500,
+    счётчик рецепта совпадает с числом строк. """
+
+    def setUp(self):
+        super().setUp()
+        self.login(self.reader)
+
+    def favorites_counts(self, recipes):
+        return [Recipe.objects.get(pk=recipe.pk).favorites_count
+                for recipe in recipes]
+
+    def test_single(self):
+        recipe = self.make_recipes(1)[0]
+        url = f'/api/recipes/{recipe.pk}/favorite/'
+        self.assertEqual(self.client.post(url).status_code, 201)
+        self.assertEqual(self.client.post(url).status_code, 400)
+        self.assertEqual(self.favorites_counts([recipe]), [1])
+        self.assertEqual(self.client.delete(url).status_code, 204)
+        self.assertEqual(self.client.delete(url).status_code, 400)
+        self.assertEqual(self.favorites_counts([recipe]), [0])
+        self.assertEqual(
+            self.client.post('/api/recipes/0/favorite/').status_code, 404)
+
+    def test_bulk(self):
+        recipes = self.make_recipes(3)
+        for user in (self.author, self.reader):
+            self.login(user)
+            self.client.post(f'/api/recipes/{recipes[0].pk}/favorite/')
+        url = '/api/recipes/favorite/'
+        ids = [recipe.pk for recipe in recipes]
+        response = self.client.post(url, {'recipes': ids}, format='json')
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(self.favorites_counts(recipes), [2, 1, 1])
+        self.assertEqual(Favorite.objects.filter(user=self.reader).count(), 3)
+        response = self.client.post(url, {'recipes': [*ids, max(ids) + 1]},
+                                    format='json')
+        self.assertEqual(response.status_code, 404)
+        response = self.client.delete(url, {'recipes': ids[:2]},
+                                      format='json')
+        self.assertEqual(response.status_code, 204)
+        self.assertEqual(self.favorites_counts(recipes), [1, 0, 1])
+
+
+class CombinedFilterTest(RecipeDataMixin, APITestCase):
+    """ ?is_favorited, ?is_in_shopping_cart, ?author и ?tags
+    сочетаются в одном запросе. """
+
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        cls.other = cls.make_user('other')
+        breakfast, lunch, _ = cls.tags
+        cls.recipes = {}
+        for name, author, tags in (('fav', cls.author, [breakfast]),
+                                   ('fav_cart', cls.author, [lunch]),
+                                   ('cart_other', cls.other, [breakfast]),
+                                   ('plain', cls.author, [breakfast])):
+            recipe = Recipe.objects.create(
+                author=author, name=name, image='recipes/test.png',
+                text='текст', cooking_time=10)
+            recipe.tags.set(tags)
+            cls.recipes[name] = recipe
+        for name in ('fav', 'fav_cart'):
+            Favorite.objects.create(user=cls.reader, recipe=cls.recipes[name])
+        for name in ('fav_cart', 'cart_other'):
+            Cart.objects.create(user=cls.reader, recipe=cls.recipes[name])
+
+    def names(self, query):
+        response = self.client.get(f'/api/recipes/?{query}')
+        self.assertEqual(response.status_code, 200)
+        return {item['name'] for item in response.data['results']}
+
+    def test_combinations(self):
+        self.login(self.reader)
+        self.assertEqual(self.names('is_favorited=1'), {'fav', 'fav_cart'})
+        self.assertEqual(self.names('is_favorited=1&is_in_shopping_cart=1'),
+                         {'fav_cart'})
+        self.assertEqual(self.names('is_in_shopping_cart=true&tags=breakfast'),
+                         {'cart_other'})
+        self.assertEqual(
+            self.names(f'is_favorited=1&author={self.author.pk}'
+                       '&tags=breakfast'), {'fav'})
+        self.assertEqual(self.names('is_favorited=0'), set(self.recipes))
+
+    def test_anonymous_and_bad_input(self):
+        self.assertEqual(self.names('is_favorited=1'), set())
+        # нераспознанное значение флага фильтр не применяет, а не роняет
+        self.login(self.reader)
+        self.assertEqual(self.names('is_favorited=maybe'), set(self.recipes))
+        response = self.client.get('/api/recipes/?author=abc')
+        self.assertEqual(response.status_code, 400)
+
+
+class UserStateTest(RecipeDataMixin, APITestCase):
+    """ Флаги пользователя берутся из общего кеша и обновляются сразу
+    после изменения избранного, корзины и подписок. """
+    url = '/api/recipes/'
+
+    def flags(self):
+        item = self.client.get(self.url).data['results'][0]
+        return (item['is_favorited'], item['is_in_shopping_cart'],
+                item['author']['is_subscribed'])
+
+    def change(self, method, url):
+        # версия сдвигается в on_commit, а TestCase не коммитит
+        with self.captureOnCommitCallbacks(execute=True):
+            response = getattr(self.client, method)(url)
+        self.assertIn(response.status_code, (201, 204))
+
+    def test_cached_and_invalidated(self):
+        recipe = self.make_recipes(1)[0]
+        self.login(self.reader)
+        self.assertEqual(self.flags(), (False, False, False))
+        # избранное, корзина и подписки уже в кеше: три запроса меньше
+        with self.assertNumQueries(
+                RecipeListQueriesTest.authenticated_queries - 3):
+            self.client.get(self.url)
+        self.change('post', f'/api/recipes/{recipe.pk}/favorite/')
+        self.assertEqual(self.flags(), (True, False, False))
+        self.change('post', f'/api/recipes/{recipe.pk}/shopping_cart/')
+        self.change('post', f'/api/users/{self.author.pk}/subscribe/')
+        self.assertEqual(self.flags(), (True, True, True))
+        self.change('delete', f'/api/recipes/{recipe.pk}/favorite/')
+        self.change('delete', f'/api/users/{self.author.pk}/subscribe/')
+        self.assertEqual(self.flags(), (False, True, False))
+
+
+class RecipeWriteQueriesTest(RecipeDataMixin, APITestCase):
+    """ Создание и правка рецепта — одно и то же число запросов
+    при любом числе ингредиентов. """
+
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        cls.ingredients += [
+            Ingredient.objects.create(name=f'ингредиент {i}',
+                                      measurement_unit='г')
+            for i in range(3, 6)]
+
+    def setUp(self):
+        super().setUp()
+        media = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media, ignore_errors=True)
+        media_root = override_settings(MEDIA_ROOT=media)
+        media_root.enable()
+        self.addCleanup(media_root.disable)
+        self.login(self.author)
+        # флаги пользователя читаются для карточек, в кеш — до замеров
+        self.make_recipes(1)
+        self.client.get('/api/recipes/')
+
+    @staticmethod
+    def image():
+        buffer = io.BytesIO()
+        Image.new('RGB', (2, 2)).save(buffer, 'PNG')
+        return ('data:image/png;base64,'
+                + base64.b64encode(buffer.getvalue()).decode())
+
+    def payload(self, count, amount=10):
+        return {
+            'name': f'суп {count}', 'text': 'текст', 'cooking_time': 10,
+            'image': self.image(),
+            'tags': [tag.pk for tag in self.tags[:count % 3 + 1]],
+            'ingredients': [{'id': ingredient.pk, 'amount': amount}
+                            for ingredient in self.ingredients[:count]],
+        }
+
+    def write(self, method, url, data):
+        with CaptureQueriesContext(connection) as queries:
+            response = getattr(self.client, method)(url, data, format='json')
+        self.assertIn(response.status_code, (200, 201), response.data)
+        return response, len(queries.captured_queries)
+
+    def test_create(self):
+        counts = set()
+        for count in (1, 6):
+            response, queries = self.write(
+                'post', '/api/recipes/', self.payload(count))
+            counts.add(queries)
+            self.assertEqual(len(response.data['ingredients']), count)
+        self.assertEqual(len(counts), 1)
+
+    def test_update(self):
+        counts = set()
+        for count in (1, 6):
+            recipe_id = self.write(
+                'post', '/api/recipes/', self.payload(count))[0].data['id']
+            data = self.payload(count, amount=20)
+            del data['image']
+            response, queries = self.write(
+                'patch', f'/api/recipes/{recipe_id}/', data)
+            counts.add(queries)
+            self.assertEqual(
+                {item['amount'] for item in response.data['ingredients']},
+                {20})
+        self.assertEqual(len(counts), 1)
+
+    def test_unknown_ingredient(self):
+        data = self.payload(1)
+        data['ingredients'].append(
+            {'id': self.ingredients[-1].pk + 100, 'amount': 1})
+        response = self.client.post('/api/recipes/', data, format='json')
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(Recipe.objects.filter(name=data['name']).exists())
+
+
+class ConditionalGetTest(RecipeDataMixin, APITestCase):
+    """ ETag справочников и карточки рецепта: совпавший If-None-Match
+    даёт 304 без запросов к базе, правка данных меняет ETag. """
+
+    def assert_not_modified(self, url, queries=0):
+        etag = self.client.get(url)['ETag']
+        with self.assertNumQueries(queries):
+            response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response['ETag'], etag)
+        self.assertIn('max-age', response['Cache-Control'])
+        return etag
+
+    def test_tags(self):
+        etag = self.assert_not_modified('/api/tags/')
+        Tag.objects.create(name='brunch', color='#00FF00', slug='brunch')
+        response = self.client.get('/api/tags/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.data), 4)
+
+    def test_recipe_detail(self):
+        recipe = self.make_recipes(1)[0]
+        url = f'/api/recipes/{recipe.pk}/'
+        # updated_at рецепта читается одним запросом
+        etag = self.assert_not_modified(url, queries=1)
+        recipe.cooking_time = 20
+        recipe.save()
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['cooking_time'], 20)
+        self.assertNotEqual(response['ETag'], etag)
+
+
+@override_settings(SHOPPING_LIST_PDF_JOB_THRESHOLD=0,
+                   EXPORT_JOB_RUNNER='command')
+class ExportJobTest(RecipeDataMixin, APITestCase):
+    """ Длинный список покупок рендерится фоновой задачей, статус
+    опрашивается с ожиданием не дольше EXPORT_JOB_MAX_WAIT. """
+    url = '/api/recipes/download_shopping_cart/'
+
+    def setUp(self):
+        super().setUp()
+        media = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media, ignore_errors=True)
+        media_root = override_settings(MEDIA_ROOT=media)
+        media_root.enable()
+        self.addCleanup(media_root.disable)
+        self.login(self.reader)
+        recipe = self.make_recipes(1)[0]
+        self.client.post(f'/api/recipes/{recipe.pk}/shopping_cart/')
+
+    def test_wait_is_capped(self):
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 202)
+        location = response['Location']
+        with mock.patch('api.utils.wait_for_job',
+                        side_effect=lambda job, timeout: job) as wait:
+            for value, timeout in (('100', settings.EXPORT_JOB_MAX_WAIT),
+                                   ('1.5', 1.5), ('-1', 0)):
+                response = self.client.get(location, {'wait': value})
+                self.assertEqual(response.status_code, 200)
+                self.assertEqual(response.data['status'], ExportJob.PENDING)
+                self.assertEqual(wait.call_args[0][1], timeout)
+        response = self.client.get(location, {'wait': 'soon'})
+        self.assertEqual(response.status_code, 400)
+
+    def test_done(self):
+        location = self.client.get(self.url)['Location']
+        job = ExportJob.objects.get()
+        # поток пула закрывает своё соединение, здесь оно общее с тестом
+        with mock.patch('api.export_jobs.connection'):
+            self.assertTrue(run_export_job(job.pk))
+        response = self.client.get(location)
+        self.assertEqual(response.data['status'], ExportJob.DONE)
+        self.assertTrue(response.data['file'].endswith('.pdf'))
+        # тот же список — сразу ссылка на готовый файл
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 303)
+        self.assertEqual(response['Location'], response.data['file'])
+
+
+@override_settings(DATABASE_REPLICAS=['replica_1'])
+class ReplicaRoutingTest(APITestCase):
+    """ Безопасные запросы читают с реплики, после записи клиент
+    REPLICA_STICKY_SECONDS читает из основной базы. """
+
+    def setUp(self):
+        cache.clear()
+        self.factory = RequestFactory()
+        self.aliases = []
+
+        def view(request):
+            self.aliases.append(ReplicaRouter().db_for_read(Recipe))
+            with primary_reads():
+                self.aliases.append(ReplicaRouter().db_for_read(Recipe))
+            return HttpResponse(status=request.status)
+        self.middleware = ReplicaRoutingMiddleware(view)
+
+    def request(self, method, status=200, token='a', cookies=None):
+        request = getattr(self.factory, method)(
+            '/api/recipes/', HTTP_AUTHORIZATION=f'Token {token}')
+        request.COOKIES.update(cookies or {})
+        request.status = status
+        self.aliases.clear()
+        return self.middleware(request), self.aliases[0]
+
+    def test_reads_go_to_replica(self):
+        self.assertEqual(self.request('get')[1], 'replica_1')
+        # primary_reads() внутри запроса возвращает чтение в default
+        self.assertIsNone(self.aliases[1])
+        self.assertEqual(self.request('post')[1], None)
+        self.assertEqual(
+            ReplicaRouter().db_for_write(Recipe), 'default')
+
+    def test_sticky_after_write(self):
+        self.request('post', status=400)
+        self.assertEqual(self.request('get')[1], 'replica_1')
+        response = self.request('post', status=201)[0]
+        cookie = response.cookies[PIN_COOKIE].value
+        # клиент без cookie — по отметке в кеше, браузер — по cookie
+        self.assertEqual(self.request('get')[1], None)
+        self.assertEqual(
+            self.request('get', token='b', cookies={PIN_COOKIE: cookie})[1],
+            None)
+        self.assertEqual(self.request('get', token='b')[1], 'replica_1')
+        cache.clear()
+        self.assertEqual(self.request('get')[1], 'replica_1')
+
+
+class FakeConnection:
+    """ Соединение psycopg2 для тестов пула: только состояние. """
+
+    def __init__(self, status=TRANSACTION_STATUS_IDLE):
+        self.closed = False
+        self.status = status
+        self.rolled_back = False
+
+    def get_transaction_status(self):
+        return self.status
+
+    def rollback(self):
+        self.rolled_back = True
+        self.status = TRANSACTION_STATUS_IDLE
+
+    def close(self):
+        self.closed = True
+
+
+class ConnectionPoolTest(SimpleTestCase):
+    """ Пул соединений процесса и проверка соединений в начале запроса. """
+
+    def test_reuse_and_replace(self):
+        pool = ConnectionPool(size=2, timeout=1)
+        first = pool.get(FakeConnection)
+        pool.put(first)
+        self.assertIs(pool.get(FakeConnection), first)
+        # незавершённая транзакция откатывается при возврате в пул
+        first.status = TRANSACTION_STATUS_INTRANS
+        pool.put(first)
+        self.assertTrue(first.rolled_back)
+        # разорванное соединение заменяется новым
+        second = pool.get(FakeConnection, is_usable=lambda connection: False)
+        self.assertIsNot(second, first)
+        self.assertTrue(first.closed)
+        self.assertEqual(pool.opened, 2)
+
+    def test_exhausted_and_handoff(self):
+        pool = ConnectionPool(size=1, timeout=0.05)
+        connection = pool.get(FakeConnection)
+        with self.assertRaises(OperationalError):
+            pool.get(FakeConnection)
+        pool.timeout = 5
+        handed = []
+        waiter = threading.Thread(
+            target=lambda: handed.append(pool.get(FakeConnection)))
+        waiter.start()
+        while not pool.waiters:
+            time.sleep(0.001)
+        pool.put(connection)
+        waiter.join()
+        self.assertEqual(handed, [connection])
+        self.assertEqual((pool.in_use, pool.opened), (1, 1))
+
+    def test_health_check(self):
+        broken = mock.Mock(connection=object())
+        broken.is_usable.return_value = False
+        idle = mock.Mock(connection=None)
+        with mock.patch('backend.db.health.connections') as connections:
+            connections.all.return_value = [broken, idle]
+            with self.settings(DB_CONN_HEALTH_CHECKS=False):
+                request_started.send(sender=None)
+            broken.close.assert_not_called()
+            with self.settings(DB_CONN_HEALTH_CHECKS=True):
+                request_started.send(sender=None)
+        broken.close.assert_called_once_with()
+        idle.is_usable.assert_not_called()
+
+
+class AsyncViewsTest(SimpleTestCase):
+    """ Обёртки для ASGI: чтение — в пуле потоков с репликой
+    из контекста запроса, запись — в общем потоке синхронных вьюх. """
+
+    def call(self, method):
+        seen = {}
+
+        @api_view(('GET', 'POST'))
+        @permission_classes((AllowAny,))
+        def view(request):
+            seen['thread'] = threading.current_thread().name
+            seen['alias'] = read_alias.get()
+            return Response({'ok': True})
+
+        request = getattr(RequestFactory(), method)('/api/tags/')
+        token = read_alias.set('replica_1')
+        try:
+            response = async_to_sync(pooled(view))(request)
+        finally:
+            read_alias.reset(token)
+        # ответ отрендерен ещё в потоке пула
+        self.assertEqual(response.content, b'{"ok":true}')
+        return seen
+
+    def test_reads_in_pool(self):
+        seen = self.call('get')
+        self.assertTrue(seen['thread'].startswith('async-read'))
+        self.assertEqual(seen['alias'], 'replica_1')
+
+    def test_writes_in_sync_thread(self):
+        self.assertFalse(self.call('post')['thread'].startswith('async-read'))
+
+    def test_asgi_refuses_debug(self):
+        sys.modules.pop('backend.asgi', None)
+        self.addCleanup(sys.modules.pop, 'backend.asgi', None)
+        with mock.patch.dict(os.environ), self.settings(DEBUG=True):
+            with self.assertRaises(ImproperlyConfigured):
+                importlib.import_module('backend.asgi')
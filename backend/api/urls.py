@@ -1,8 +1,10 @@
 # isort: skip_file
+from django.conf import settings
 from django.urls import include, path
 from rest_framework import routers
 
-from api.utils import CartPDFExportView
+from api.async_views import pooled, pooled_patterns
+from api.utils import CartPDFExportView, CartSummaryView, ExportJobView
 from api.views import IngredientViewSet, RecipeViewSet, TagViewSet
 from users.views import UserViewSet
 
@@ -14,10 +16,24 @@ router.register('ingredients', IngredientViewSet, basename='ingredients')
 router.register('users', UserViewSet, basename='users')
 router.register('tags', TagViewSet, basename='tags')
 
+router_urls = router.urls
+pdf_view = CartPDFExportView.as_view()
+export_job_view = ExportJobView.as_view()
+# под ASGI чтение рецептов, тегов, ингредиентов и PDF не занимает
+# общий поток синхронных вьюх (см. api.async_views)
+if settings.ASYNC_READ_VIEWS:
+    router_urls = pooled_patterns(router_urls)
+    pdf_view = pooled(pdf_view)
+    export_job_view = pooled(export_job_view)
+
 urlpatterns = [
-    path('recipes/download_shopping_cart/', CartPDFExportView.as_view(),
+    path('recipes/download_shopping_cart/', pdf_view,
          name='download_shopping_cart'),
-    path('', include(router.urls)),
+    path('recipes/download_shopping_cart/jobs/<uuid:pk>/', export_job_view,
+         name='export_job'),
+    path('recipes/shopping_cart_summary/', CartSummaryView.as_view(),
+         name='shopping_cart_summary'),
+    path('', include(router_urls)),
     path('', include('djoser.urls')),
     path('auth/', include('djoser.urls.authtoken')),
 ]
@@ -0,0 +1,65 @@
+from collections import namedtuple
+
+from django.conf import settings
+from django.core.cache import cache
+
+from api.cache import bump_version, get_version
+from backend.db.routers import primary_reads
+from recipes.models import Cart, Favorite
+from users.models import Follow
+
+# id рецептов в избранном и в корзине, id авторов в подписках
+UserState = namedtuple('UserState', ('favorites', 'cart', 'following'))
+EMPTY_STATE = UserState(frozenset(), frozenset(), frozenset())
+REQUEST_ATTR = '_user_state'
+
+
+def version_key(user_id):
+    return f'user_state:{user_id}:version'
+
+
+def user_state_version(user_id):
+    """ Меняется при каждой invalidate_user_state (для ETag). """
+    return get_version(version_key(user_id))
+
+
+def load_user_state(user_id):
+    """ Три запроса по индексам (user, ...) вместо EXISTS на каждую
+    карточку рецепта и автора. """
+    return UserState(
+        frozenset(Favorite.objects.filter(
+            user_id=user_id).values_list('recipe_id', flat=True)),
+        frozenset(Cart.objects.filter(
+            user_id=user_id).values_list('recipe_id', flat=True)),
+        frozenset(Follow.objects.filter(
+            user_id=user_id).values_list('following_id', flat=True)),
+    )
+
+
+def get_user_state(request):
+    """ Флаги текущего пользователя: один раз на запрос, из общего
+    кеша, пока версия не сдвинута invalidate_user_state. """
+    if request is None or not request.user.is_authenticated:
+        return EMPTY_STATE
+    # DRF Request оборачивает HttpRequest, храним на исходном объекте
+    request = getattr(request, '_request', request)
+    state = getattr(request, REQUEST_ATTR, None)
+    if state is None:
+        user_id = request.user.pk
+        key = f'user_state:{user_id}:{get_version(version_key(user_id))}'
+        state = cache.get(key)
+        if state is None:
+            with primary_reads():
+                state = load_user_state(user_id)
+            cache.set(key, state, settings.USER_STATE_CACHE_TIMEOUT)
+        setattr(request, REQUEST_ATTR, state)
+    return state
+
+
+def invalidate_user_state(request):
+    """ Сдвигает версию после изменения избранного, корзины или
+    подписок; копия на самом запросе тоже сбрасывается. """
+    bump_version(version_key(request.user.pk))
+    request = getattr(request, '_request', request)
+    if hasattr(request, REQUEST_ATTR):
+        delattr(request, REQUEST_ATTR)
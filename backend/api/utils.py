@@ -1,98 +1,222 @@
 # isort: skip_file
-import io
-
-from django.db.models import Sum
-from django.http import FileResponse
-from reportlab.pdfbase import pdfmetrics
-from reportlab.pdfbase.ttfonts import TTFont
-from reportlab.pdfgen import canvas
-from rest_framework import status, views
+from collections import defaultdict
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.db.models import F, Window
+from django.db.models.functions import RowNumber
+from django.urls import reverse
+from rest_framework import generics, status, views
+from rest_framework.exceptions import ValidationError
 from rest_framework.generics import get_object_or_404
+from rest_framework.permissions import IsAuthenticated
+from rest_framework.renderers import JSONRenderer
 from rest_framework.response import Response
 
-from api.serializers import RecipeMiniSerializer
-from recipes.models import ReciIngredi, Recipe
+from api.export_jobs import start_pdf_export, wait_for_job
+from api.exporters import EXPORTERS, shopping_list_queryset
+from api.renderers import CSVRenderer, PDFRenderer, PlainTextRenderer
+from api.replicas import PrimaryReadMixin
+from api.serializers import (ExportJobSerializer, RecipeIdsSerializer,
+                             RecipeMiniSerializer, ShoppingListItemSerializer)
+from api.user_state import invalidate_user_state
+from recipes.cart_summary import cart_changed
+from recipes.counters import change_flag_counter
+from recipes.models import Cart, Recipe, ShoppingListItem
+
+
+def attach_recent_recipes(follows, limit):
+    """ Кладёт в каждую подписку recent_recipes — последние limit
+    рецептов автора. Один запрос на всю страницу:
+    ROW_NUMBER() OVER (PARTITION BY author ORDER BY pub_date DESC). """
+    author_ids = {follow.following_id for follow in follows}
+    if not author_ids:
+        return
+    recipes = Recipe.objects.filter(author_id__in=author_ids)
+    if limit is None:
+        recipes = recipes.order_by('author_id', '-pub_date', '-id')
+    else:
+        ranked = recipes.annotate(row_number=Window(
+            RowNumber(), partition_by=F('author_id'),
+            order_by=(F('pub_date').desc(), F('id').desc())))
+        # в Django 3.2 фильтровать по оконной функции нельзя,
+        # поэтому ограничение накладывается во внешнем запросе
+        sql, params = ranked.query.sql_with_params()
+        recipes = Recipe.objects.raw(
+            f'SELECT * FROM ({sql}) ranked WHERE row_number <= %s '
+            'ORDER BY author_id, row_number', (*params, limit))
+    by_author = defaultdict(list)
+    for recipe in recipes:
+        by_author[recipe.author_id].append(recipe)
+    for follow in follows:
+        follow.recent_recipes = by_author[follow.following_id]
 
 
 def flag_add_delete(request, pk, model):
+    """ Добавляет рецепт в избранное/корзину или убирает оттуда.
+    Повторная вставка ловится уникальным ограничением внутри savepoint,
+    поэтому два одновременных POST не приводят к 500. """
     if not request.user.pk:
         return Response(
             {'errors': 'Недоступно анонимным пользователям.'},
             status=status.HTTP_400_BAD_REQUEST)
     user = request.user
-    recipe = get_object_or_404(Recipe, pk=pk)
-    object = model.objects.filter(user=user, recipe=recipe)
     if request.method == 'POST':
-        if object:
+        recipe = get_object_or_404(Recipe, pk=pk)
+        try:
+            with transaction.atomic():
+                model.objects.create(user=user, recipe=recipe)
+                change_flag_counter(model, (recipe.pk,), 1)
+                if model is Cart:
+                    cart_changed(user.pk, (recipe.pk,), 1)
+                transaction.on_commit(
+                    lambda: invalidate_user_state(request))
+        except IntegrityError:
             return Response({'errors': 'Рецепт уже добавлен.'},
                             status=status.HTTP_400_BAD_REQUEST)
-        model.objects.create(user=user, recipe=recipe)
         serializer = RecipeMiniSerializer(recipe)
         return Response(serializer.data, status=status.HTTP_201_CREATED)
     if request.method == 'DELETE':
-        if not object:
-            return Response({'errors': 'Нельзя удалить, не был добавлен.'},
-                            status=status.HTTP_400_BAD_REQUEST)
-        model.objects.get(user=user, recipe=recipe).delete()
-        return Response(status=status.HTTP_204_NO_CONTENT)
+        with transaction.atomic():
+            deleted, _ = model.objects.filter(
+                user=user, recipe_id=pk).delete()
+            if deleted:
+                change_flag_counter(model, (pk,), -1)
+                if model is Cart:
+                    cart_changed(user.pk, (pk,), -1)
+                transaction.on_commit(
+                    lambda: invalidate_user_state(request))
+        if deleted:
+            return Response(status=status.HTTP_204_NO_CONTENT)
+        get_object_or_404(Recipe, pk=pk)
+        return Response({'errors': 'Нельзя удалить, не был добавлен.'},
+                        status=status.HTTP_400_BAD_REQUEST)
     return Response(
         {'errors': 'Не удалось.'}, status=status.HTTP_400_BAD_REQUEST)
 
 
-class CartPDFExportView(views.APIView):
+def insert_flags(model, user, recipes):
+    """ Вставляет недостающие строки флага и возвращает id рецептов,
+    добавленных именно этим вызовом. Если параллельный POST успел
+    вставить часть строк, savepoint откатывается и список читается
+    заново: счётчики и сводка сдвигаются ровно на вставленное. """
+    while True:
+        existing = set(model.objects.filter(
+            user=user, recipe__in=recipes).values_list('recipe_id', flat=True))
+        added = [recipe for recipe in recipes if recipe.pk not in existing]
+        try:
+            with transaction.atomic():
+                model.objects.bulk_create(
+                    model(user=user, recipe=recipe) for recipe in added)
+        except IntegrityError:
+            continue
+        return [recipe.pk for recipe in added]
+
+
+def delete_flags(model, user, recipe_ids):
+    """ Удаляет строки флага и возвращает id рецептов, убранных именно
+    этим вызовом: строки блокируются до удаления, поэтому параллельный
+    DELETE того же рецепта их уже не посчитает. """
+    rows = dict(model.objects.select_for_update().filter(
+        user=user, recipe__in=recipe_ids).values_list('pk', 'recipe_id'))
+    model.objects.filter(pk__in=rows).delete()
+    return list(rows.values())
+
+
+def flag_bulk_add_delete(request, model):
+    """ То же для списка рецептов {"recipes": [id, ...]}: одна вставка
+    или одно удаление на весь список. Счётчики и сводка списка покупок
+    сдвигаются дельтой, как при одиночном добавлении. """
+    serializer = RecipeIdsSerializer(data=request.data)
+    serializer.is_valid(raise_exception=True)
+    recipe_ids = set(serializer.validated_data['recipes'])
+    user = request.user
+    recipes = list(Recipe.objects.filter(pk__in=recipe_ids))
+    missing = recipe_ids - {recipe.pk for recipe in recipes}
+    if missing:
+        return Response(
+            {'errors': f'Рецепты не найдены: {sorted(missing)}'},
+            status=status.HTTP_404_NOT_FOUND)
+    with transaction.atomic():
+        if request.method == 'POST':
+            changed, sign = insert_flags(model, user, recipes), 1
+        else:
+            changed, sign = delete_flags(model, user, recipe_ids), -1
+        if changed:
+            change_flag_counter(model, changed, sign)
+            if model is Cart:
+                cart_changed(user.pk, changed, sign)
+            transaction.on_commit(lambda: invalidate_user_state(request))
+    if request.method == 'POST':
+        serializer = RecipeMiniSerializer(recipes, many=True)
+        return Response(serializer.data, status=status.HTTP_201_CREATED)
+    return Response(status=status.HTTP_204_NO_CONTENT)
+
+
+class CartPDFExportView(PrimaryReadMixin, views.APIView):
+    """ Выгрузка списка покупок. Формат выбирается по ?format=
+    (pdf, txt, csv, json) или заголовку Accept, по умолчанию PDF.
+    Длинный список в PDF рендерится фоновой задачей: ответ 202 с её
+    статусом, Location — адрес для опроса (ExportJobView). """
+    renderer_classes = (PDFRenderer, PlainTextRenderer, CSVRenderer,
+                        JSONRenderer)
+
     def get(self, request):
         user = request.user
         if not user.is_authenticated:
             return Response(status=status.HTTP_401_UNAUTHORIZED)
-        shopping_list = ReciIngredi.objects.filter(
-            recipe__cart__user=user).values(
-            'ingredient__name',
-            'ingredient__measurement_unit'
-        ).annotate(
-            amount=Sum('amount')
-        ).order_by()
-        pdfmetrics.registerFont(
-            TTFont('PTSansRegular', 'PTSans-Regular.ttf', 'UTF-8'))
-        pdfmetrics.registerFont(
-            TTFont('PTSansBold', 'PTSans-Bold.ttf', 'UTF-8'))
-        font = 'PTSansRegular'
-        boldfont = 'PTSansBold'
-        buffer = io.BytesIO()
-        pdf_file = canvas.Canvas(buffer)
-        pdf_file.setFont(font, 10)
-        pdf_file.drawString(
-            230,
-            810,
-            'СЕРВИС РЕЦЕПТОВ FOODGRAM'
-        )
-        pdf_file.setFont(boldfont, 26)
-        pdf_file.drawString(
-            200,
-            750,
-            'Список покупок:'
-        )
-        pdf_file.setFont(font, 14)
-        from_bottom = 700
-        for number, ingredient in enumerate(shopping_list, start=1):
-            pdf_file.drawString(
-                60,
-                from_bottom,
-                (f'{number}.  {ingredient["ingredient__name"]} - '
-                 f'{ingredient["amount"]} '
-                 f'{ingredient["ingredient__measurement_unit"]}')
-            )
-            from_bottom -= 30
-            if from_bottom <= 50:
-                from_bottom = 700
-                pdf_file.showPage()
-                pdf_file.setFont(font, 10)
-                pdf_file.drawString(
-                    230,
-                    810,
-                    'СЕРВИС РЕЦЕПТОВ FOODGRAM')
-                pdf_file.setFont(font, 14)
-        pdf_file.showPage()
-        pdf_file.save()
-        buffer.seek(0)
-        return FileResponse(
-            buffer, as_attachment=True, filename='shopping_list.pdf')
+        shopping_list = shopping_list_queryset(user)
+        if request.accepted_renderer.format == 'pdf':
+            job = start_pdf_export(user, shopping_list)
+            if job is not None:
+                return self.accepted(request, job)
+        export = EXPORTERS[request.accepted_renderer.format]
+        return export(shopping_list)
+
+    def accepted(self, request, job):
+        """ 202 со статусом задачи; готовый файл — сразу 303 на него. """
+        # статус задачи — JSON, а не тело PDF
+        request.accepted_renderer = JSONRenderer()
+        request.accepted_media_type = JSONRenderer.media_type
+        serializer = ExportJobSerializer(job, context={'request': request})
+        if job.status == job.DONE:
+            return Response(serializer.data, status=status.HTTP_303_SEE_OTHER,
+                            headers={'Location': serializer.data['file']})
+        location = request.build_absolute_uri(
+            reverse('api:export_job', args=(job.pk,)))
+        return Response(serializer.data, status=status.HTTP_202_ACCEPTED,
+                        headers={'Location': location})
+
+
+class ExportJobView(PrimaryReadMixin, generics.RetrieveAPIView):
+    """ Статус фоновой выгрузки. ?wait=N — подождать до N секунд
+    (не больше EXPORT_JOB_MAX_WAIT), пока задача не завершится. """
+    serializer_class = ExportJobSerializer
+    permission_classes = (IsAuthenticated,)
+
+    def get_queryset(self):
+        return self.request.user.export_jobs.all()
+
+    def get_object(self):
+        return wait_for_job(super().get_object(), self.wait_seconds())
+
+    def wait_seconds(self):
+        value = self.request.query_params.get('wait')
+        if not value:
+            return 0
+        try:
+            value = float(value)
+        except ValueError:
+            raise ValidationError({'wait': 'Ожидается число секунд.'})
+        return min(max(value, 0), settings.EXPORT_JOB_MAX_WAIT)
+
+
+class CartSummaryView(generics.ListAPIView):
+    """ Сводка списка покупок в JSON для предпросмотра в интерфейсе —
+    одно чтение из ShoppingListItem по индексу (user, name, unit). """
+    serializer_class = ShoppingListItemSerializer
+    permission_classes = (IsAuthenticated,)
+    pagination_class = None
+
+    def get_queryset(self):
+        return ShoppingListItem.objects.filter(user=self.request.user)
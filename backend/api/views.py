@@ -1,59 +1,203 @@
 # isort: skip_file
+from django.conf import settings
+from django.db.models import Count, Exists, F, OuterRef, Prefetch
+from django.db.models.functions import Lower
 from django_filters import rest_framework as dfilters
 from rest_framework import filters, permissions, viewsets
 from rest_framework.decorators import action
 from rest_framework.generics import get_object_or_404
+from rest_framework.response import Response
 
+from api.cache import AnonymousFeedCacheMixin, table_states
+from api.conditional import ConditionalGetMixin
+from api.ingredient_index import IngredientPrefixIndex
 from api.pagination import AdjustablePagination
 from api.permissions import AuthorAdminOrReadOnly
 from api.serializers import (IngredientPageSerializer, RecipeReadSerializer,
                              RecipeWriteSerializer, TagSerializer)
-from api.utils import flag_add_delete
-from recipes.models import Cart, Favorite, Ingredient, Recipe, Tag
+from api.tag_map import tag_choices, tag_map
+from api.user_state import user_state_version
+from api.utils import flag_add_delete, flag_bulk_add_delete
+from recipes.models import (Cart, Favorite, Ingredient, ReciIngredi, Recipe,
+                            Tag)
+from recipes.search import search_recipes
 from users.models import User
 
+TAGS_ANY = 'any'
+TAGS_ALL = 'all'
+
 
 class RecipeFilter(dfilters.FilterSet):
     """ Фильтр для вывода рецептов по query parameters. """
-    tags = dfilters.ModelMultipleChoiceFilter(
-        field_name='tags__slug', to_field_name='slug',
-        queryset=Tag.objects.all(),)
+    tags = dfilters.MultipleChoiceFilter(
+        choices=tag_choices, method='filter_tags')
+    # ?tags_mode=all — рецепты со всеми тегами, по умолчанию с любым
+    tags_mode = dfilters.ChoiceFilter(
+        choices=((TAGS_ANY, TAGS_ANY), (TAGS_ALL, TAGS_ALL)),
+        method='filter_nothing')
     author = dfilters.ModelChoiceFilter(queryset=User.objects.all())
-    # is_favorited = dfilters.BooleanFilter(field_name='faved_by')
-    # is_in_shopping_cart = dfilters.BooleanFilter(field_name='in_cart_for')
+    is_favorited = dfilters.BooleanFilter(method='filter_flag')
+    is_in_shopping_cart = dfilters.BooleanFilter(method='filter_flag')
+    # полнотекстовый поиск, релевантность — в аннотации search_rank
+    search = dfilters.CharFilter(method='filter_search')
 
     class Meta:
         model = Recipe
-        fields = ('author', 'tags',)
+        fields = ('author', 'tags', 'is_favorited', 'is_in_shopping_cart')
+
+    def filter_search(self, queryset, name, value):
+        return search_recipes(queryset, value)
+
+    flag_models = {'is_favorited': Favorite, 'is_in_shopping_cart': Cart}
+
+    def filter_flag(self, queryset, name, value):
+        """ ?is_favorited=1 (или true) — только рецепты с флагом
+        у текущего пользователя; 0 фильтр не ограничивает, как и раньше.
+        Подзапрос EXISTS обслуживается уникальным индексом (user, recipe). """
+        if not value:
+            return queryset
+        user = self.request.user
+        if not user.is_authenticated:
+            return queryset.none()
+        return queryset.filter(Exists(self.flag_models[name].objects.filter(
+            user=user, recipe=OuterRef('pk'))))
+
+    def filter_nothing(self, queryset, name, value):
+        return queryset
+
+    def filter_tags(self, queryset, name, value):
+        """ Без JOIN по M2M: слаги переводятся в id по кешу тегов,
+        а рецепты отбираются подзапросом к through-таблице, поэтому
+        строки не дублируются и DISTINCT не нужен. """
+        # ?tags=a&tags=a: повтор слага не должен требовать второго тега
+        tag_ids = set(tag_map.ids(value))
+        through = Recipe.tags.through.objects
+        if self.form.cleaned_data.get('tags_mode') == TAGS_ALL:
+            return queryset.filter(pk__in=through.filter(
+                tag_id__in=tag_ids).values('recipe_id').annotate(
+                matched=Count('tag_id')).filter(
+                matched=len(tag_ids)).values('recipe_id'))
+        return queryset.filter(Exists(through.filter(
+            recipe_id=OuterRef('pk'), tag_id__in=tag_ids)))
+
+
+class RecipeOrderingFilter(filters.OrderingFilter):
+    """ ?ordering=-favorites_count и т.п.; при равенстве — свежие
+    рецепты первыми, как в индексе recipe_favorites_count_idx.
+    ?ordering=popular и ?ordering=trending — готовые рейтинги
+    из RecipeScore (recipes.scores). """
+    tiebreaker = ('-pub_date', '-id')
+    # рейтинг выводится в аннотацию score_rank: курсорная пагинация
+    # берёт значения полей порядка из атрибутов рецепта
+    score_feeds = {
+        'popular': F('score__popular'),
+        'trending': F('score__trending'),
+    }
+    score_ordering = ('-score_rank', '-id')
+
+    def score_feed(self, request):
+        feed = request.query_params.get(self.ordering_param)
+        return self.score_feeds.get(feed)
+
+    def filter_queryset(self, request, queryset, view):
+        score = self.score_feed(request)
+        if score is not None:
+            # INNER JOIN: страница читается по индексу recipe_score_*_idx
+            return queryset.filter(score__isnull=False).annotate(
+                score_rank=score).order_by(*self.score_ordering)
+        return super().filter_queryset(request, queryset, view)
+
+    def get_default_ordering(self, view):
+        """ Результаты поиска по умолчанию — по релевантности. """
+        if view.request.query_params.get('search'):
+            return ('-search_rank',)
+        return super().get_default_ordering(view)
+
+    def get_ordering(self, request, queryset, view):
+        if self.score_feed(request) is not None:
+            return self.score_ordering
+        ordering = super().get_ordering(request, queryset, view)
+        if not ordering:
+            return ordering
+        return list(ordering) + [
+            field for field in self.tiebreaker
+            if field.lstrip('-') not in {f.lstrip('-') for f in ordering}]
 
 
 class IngredientFilter(dfilters.FilterSet):
     """ Фильтр для вывода ингредиентов по query parameters. """
-    name = dfilters.CharFilter(field_name='name',
-                               lookup_expr='istartswith')
+    name = dfilters.CharFilter(method='filter_name_prefix')
 
     class Meta:
         model = Ingredient
         fields = ('name', 'measurement_unit')
 
+    def filter_name_prefix(self, queryset, name, value):
+        """ LOWER(name) LIKE 'value%' — попадает в индекс
+        с text_pattern_ops, в отличие от istartswith (UPPER). """
+        return queryset.annotate(name_lower=Lower('name')).filter(
+            name_lower__startswith=value.lower())
+
 
-class RecipeViewSet(viewsets.ModelViewSet):
+class RecipeViewSet(ConditionalGetMixin, AnonymousFeedCacheMixin,
+                    viewsets.ModelViewSet):
     """ Вьюсет для вывода и фильтрации рецептов. """
     queryset = Recipe.objects.all()
     pagination_class = AdjustablePagination
     permission_classes = (permissions.AllowAny,)
-    filter_backends = (dfilters.DjangoFilterBackend,)
+    filter_backends = (dfilters.DjangoFilterBackend, RecipeOrderingFilter)
     filterset_class = RecipeFilter
+    ordering_fields = ('pub_date', 'favorites_count', 'carts_count')
+    ordering = ('-pub_date',)
+    # курсор берёт порядок из RecipeOrderingFilter, это ключ по умолчанию
+    cursor_ordering = ('-pub_date', '-id')
+
+    # карточку рецепта видно и без входа, а флаги в ней — личные
+    vary_headers = ('Accept', 'Authorization')
+
+    def get_validators(self, request, *args, **kwargs):
+        """ Карточка меняется с правкой рецепта (updated_at), тегов,
+        ингредиентов, профилей и, для вошедшего, его избранного,
+        корзины и подписок. Last-Modified — только для анонимов:
+        у личных флагов нет времени изменения. """
+        if self.action != 'retrieve':
+            return None
+        try:
+            updated_at = Recipe.objects.filter(pk=kwargs['pk']).values_list(
+                'updated_at', flat=True).first()
+        except (ValueError, TypeError):
+            return None
+        if updated_at is None:
+            return None
+        states = table_states('tags', 'ingredients', 'users')
+        parts = [updated_at.isoformat()] + [
+            version for version, modified in states.values()]
+        if request.user.is_authenticated:
+            parts += [request.user.pk, user_state_version(request.user.pk)]
+            return parts, None
+        last_modified = max(updated_at.timestamp(), *(
+            modified for version, modified in states.values()))
+        return parts, last_modified
+
+    def get_cache_control(self, request):
+        if request.user.is_authenticated:
+            return {'private': True, 'no_cache': True}
+        return {'public': True, 'max_age': settings.RECIPE_CACHE_MAX_AGE}
 
     def get_queryset(self):
-        is_favorited = self.request.query_params.get('is_favorited')
-        if is_favorited is not None and int(is_favorited) == 1:
-            return Recipe.objects.filter(faved_by=self.request.user.id)
-        is_in_shopping_cart = self.request.query_params.get(
-            'is_in_shopping_cart')
-        if is_in_shopping_cart is not None and int(is_in_shopping_cart) == 1:
-            return Recipe.objects.filter(in_cart_for=self.request.user.id)
-        return Recipe.objects.all()
+        # tsvector нужен только в WHERE, в выдаче он лишний
+        return self.annotate_for_read(
+            Recipe.objects.defer('search_vector'))
+
+    def annotate_for_read(self, queryset):
+        """ Связи рецепта — фиксированным числом запросов на страницу.
+        Флаги пользователя сериализаторы берут из api.user_state. """
+        return queryset.select_related('author').prefetch_related(
+            'tags',
+            Prefetch('reciingredi_set',
+                     queryset=ReciIngredi.objects.select_related(
+                         'ingredient')),
+        )
 
     def get_serializer_class(self):
         if self.action in ('create', 'update', 'partial_update'):
@@ -77,19 +221,71 @@ class RecipeViewSet(viewsets.ModelViewSet):
         """ Добавление в Список покупок и удаление оттуда. """
         return flag_add_delete(request, pk, Cart)
 
+    @action(detail=False, permission_classes=(permissions.IsAuthenticated,),
+            methods=('post', 'delete'), url_path='favorite',
+            url_name='favorite-bulk')
+    def favorite_bulk(self, request):
+        """ Добавление в Избранное и удаление оттуда списком. """
+        return flag_bulk_add_delete(request, Favorite)
+
+    @action(detail=False, permission_classes=(permissions.IsAuthenticated,),
+            methods=('post', 'delete'), url_path='shopping_cart',
+            url_name='shopping-cart-bulk')
+    def shopping_cart_bulk(self, request):
+        """ Добавление в Список покупок и удаление оттуда списком. """
+        return flag_bulk_add_delete(request, Cart)
+
 
-class IngredientViewSet(viewsets.ModelViewSet):
+class ReferenceConditionalMixin(ConditionalGetMixin):
+    """ Справочник меняется только через админку и загрузку данных:
+    валидаторы — версия и время изменения таблицы reference_table. """
+    reference_table = None
+    cache_control = {'public': True,
+                     'max_age': settings.REFERENCE_CACHE_MAX_AGE}
+
+    def get_validators(self, request, *args, **kwargs):
+        if self.action not in ('list', 'retrieve'):
+            return None
+        version, modified = table_states(
+            self.reference_table)[self.reference_table]
+        return (version,), modified
+
+
+class IngredientViewSet(ReferenceConditionalMixin, viewsets.ModelViewSet):
     """ Вьюсет для вывода страницы со списком ингредиентов. """
     queryset = Ingredient.objects.all()
     pagination_class = None
     serializer_class = IngredientPageSerializer
+    reference_table = 'ingredients'
     permission_classes = (permissions.AllowAny,)
-    filterset_class = (IngredientFilter,)
+    filter_backends = (dfilters.DjangoFilterBackend,)
+    filterset_class = IngredientFilter
+    prefix_index = IngredientPrefixIndex(
+        fields=IngredientPageSerializer.Meta.fields)
+
+    def list(self, request, *args, **kwargs):
+        """ Автодополнение: по ?name= отдаёт не больше
+        INGREDIENT_SEARCH_LIMIT совпадений по префиксу. """
+        if (settings.INGREDIENT_SEARCH_BACKEND != 'memory'
+                or 'measurement_unit' in request.query_params):
+            return super().list(request, *args, **kwargs)
+        name = request.query_params.get('name')
+        if name:
+            return Response(self.prefix_index.search(
+                name, settings.INGREDIENT_SEARCH_LIMIT))
+        return Response(self.prefix_index.all())
+
+    def filter_queryset(self, queryset):
+        queryset = super().filter_queryset(queryset)
+        if self.action == 'list' and self.request.query_params.get('name'):
+            return queryset[:settings.INGREDIENT_SEARCH_LIMIT]
+        return queryset
 
 
-class TagViewSet(viewsets.ModelViewSet):
+class TagViewSet(ReferenceConditionalMixin, viewsets.ModelViewSet):
     """ Вьюсет для вывода списка тегов. """
     queryset = Tag.objects.all()
     pagination_class = None
     serializer_class = TagSerializer
+    reference_table = 'tags'
     permission_classes = (permissions.AllowAny,)
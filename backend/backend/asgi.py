@@ -0,0 +1,16 @@
+import os
+
+from django.conf import settings
+from django.core.asgi import get_asgi_application
+from django.core.exceptions import ImproperlyConfigured
+
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'backend.settings')
+# под ASGI чтение идёт через async-обёртки api.async_views
+os.environ.setdefault('ASYNC_READ_VIEWS', 'True')
+
+application = get_asgi_application()
+
+# DEBUG включает debug_toolbar, а он не поддерживает async
+if settings.DEBUG:
+    raise ImproperlyConfigured(
+        'Режим ASGI работает только с DEBUG=False.')
@@ -0,0 +1,14 @@
+from django.apps import AppConfig
+from django.core.signals import request_started
+
+
+class DbConfig(AppConfig):
+    name = 'backend.db'
+    label = 'backend_db'
+
+    def ready(self):
+        from backend.db.health import check_connections
+        # после close_old_connections из django.db: проверяются только
+        # соединения, пережившие прошлый запрос (CONN_MAX_AGE > 0)
+        request_started.connect(
+            check_connections, dispatch_uid='backend_db_check_connections')
@@ -0,0 +1,14 @@
+from django.conf import settings
+from django.db import connections
+
+
+def check_connections(**kwargs):
+    """ Аналог CONN_HEALTH_CHECKS из Django 4.1: постоянное соединение
+    проверяется в начале запроса, и разорванное (перезапуск PostgreSQL,
+    таймаут балансировщика) закрывается до первого запроса к БД,
+    а не роняет его с OperationalError. Включается DB_CONN_HEALTH_CHECKS. """
+    if not settings.DB_CONN_HEALTH_CHECKS:
+        return
+    for connection in connections.all():
+        if connection.connection is not None and not connection.is_usable():
+            connection.close()
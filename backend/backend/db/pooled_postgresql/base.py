@@ -0,0 +1,118 @@
+import threading
+from collections import deque
+
+from django.conf import settings
+from django.db import OperationalError
+from django.db.backends.postgresql import base
+from psycopg2.extensions import (TRANSACTION_STATUS_IDLE,
+                                 TRANSACTION_STATUS_UNKNOWN)
+
+_pools = {}
+_pools_lock = threading.Lock()
+
+
+class ConnectionPool:
+    """ Не больше size соединений psycopg2 на процесс, общие для всех
+    потоков воркера. Освободившееся соединение передаётся самому давнему
+    из ждущих потоков (FIFO), иначе поток, вернувший соединение, тут же
+    забирал бы его снова, а остальные ждали бы сотни миллисекунд. """
+
+    def __init__(self, size, timeout):
+        self.size = size
+        self.timeout = timeout
+        self.in_use = 0
+        self.idle = []
+        self.waiters = deque()
+        self.lock = threading.Lock()
+        self.opened = 0
+
+    def get(self, connect, is_usable=None):
+        with self.lock:
+            if self.in_use < self.size:
+                self.in_use += 1
+                connection = self.idle.pop() if self.idle else None
+                waiter = None
+            else:
+                waiter = [threading.Event(), None]
+                self.waiters.append(waiter)
+        if waiter is not None:
+            handed = waiter[0].wait(self.timeout)
+            with self.lock:
+                if not handed and not waiter[0].is_set():
+                    self.waiters.remove(waiter)
+                    raise OperationalError(
+                        f'Пул соединений исчерпан за {self.timeout} с.')
+            connection = waiter[1]
+        try:
+            if connection is not None and not connection.closed and (
+                    is_usable is None or is_usable(connection)):
+                return connection
+            if connection is not None:
+                connection.close()
+            connection = connect()
+            self.opened += 1
+            return connection
+        except BaseException:
+            self.release(None)
+            raise
+
+    def put(self, connection):
+        try:
+            status = connection.get_transaction_status()
+            if status == TRANSACTION_STATUS_UNKNOWN:
+                connection.close()
+            elif status != TRANSACTION_STATUS_IDLE:
+                connection.rollback()
+        except base.Database.Error:
+            connection.close()
+        self.release(None if connection.closed else connection)
+
+    def release(self, connection):
+        """ Освобождает место в пуле; соединение (если живо) уходит
+        ждущему потоку или в список свободных. """
+        with self.lock:
+            if self.waiters:
+                waiter = self.waiters.popleft()
+                waiter[1] = connection
+                waiter[0].set()
+                return
+            self.in_use -= 1
+            if connection is not None:
+                self.idle.append(connection)
+
+
+def connection_pool(alias, settings_dict):
+    with _pools_lock:
+        if alias not in _pools:
+            _pools[alias] = ConnectionPool(
+                settings_dict['POOL_SIZE'], settings_dict['POOL_TIMEOUT'])
+        return _pools[alias]
+
+
+def ping(connection):
+    try:
+        with connection.cursor() as cursor:
+            cursor.execute('SELECT 1')
+    except base.Database.Error:
+        return False
+    return True
+
+
+class DatabaseWrapper(base.DatabaseWrapper):
+    """ Бэкенд PostgreSQL, который берёт соединения из пула процесса
+    и возвращает их туда вместо закрытия (DB_POOL_SIZE в settings). """
+
+    def get_new_connection(self, conn_params):
+        connection = connection_pool(self.alias, self.settings_dict).get(
+            lambda: super(DatabaseWrapper, self).get_new_connection(
+                conn_params),
+            ping if settings.DB_CONN_HEALTH_CHECKS else None)
+        self.isolation_level = self.settings_dict['OPTIONS'].get(
+            'isolation_level', connection.isolation_level)
+        return connection
+
+    def _close(self):
+        if self.connection is not None:
+            with self.wrap_database_errors:
+                connection_pool(self.alias, self.settings_dict).put(
+                    self.connection)
@@ -0,0 +1,44 @@
+import random
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.conf import settings
+
+# псевдоним реплики, с которой читает текущий запрос; None — основная БД
+read_alias = ContextVar('read_alias', default=None)
+
+
+def pick_replica():
+    """ Реплика для очередного запроса или None, если реплик нет. """
+    if not settings.DATABASE_REPLICAS:
+        return None
+    return random.choice(settings.DATABASE_REPLICAS)
+
+
+@contextmanager
+def primary_reads():
+    """ Чтения внутри блока идут в default — для данных, которые клиент
+    только что записал, и для заполнения общих кешей: отстающая реплика
+    не должна законсервировать в них старое состояние. """
+    token = read_alias.set(None)
+    try:
+        yield
+    finally:
+        read_alias.reset(token)
+
+
+class ReplicaRouter:
+    """ Чтение в контексте read_alias идёт с реплики, всё остальное —
+    с default. Реплики — копии default, миграции только на нём. """
+
+    def db_for_read(self, model, **hints):
+        return read_alias.get()
+
+    def db_for_write(self, model, **hints):
+        return 'default'
+
+    def allow_relation(self, obj1, obj2, **hints):
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return db == 'default'
@@ -8,7 +8,7 @@ load_dotenv()
 
 SECRET_KEY = '@n$ryvt1+(p@w%w4&@w_rf)=9+20^xdekrn4g^l)dia9vyxv-q'
 
-DEBUG = True
+DEBUG = os.getenv('DEBUG', default='True').lower() == 'true'
 
 ALLOWED_HOSTS = [
     'web',
@@ -31,13 +31,15 @@ INSTALLED_APPS = [
     'django_filters',
     'djoser',
     'rest_framework_simplejwt',
-    'debug_toolbar',
     'api.apps.ApiConfig',
     'recipes.apps.RecipesConfig',
-    'users.apps.UsersConfig'
+    'users.apps.UsersConfig',
+    'backend.db.apps.DbConfig',
 ]
 
 MIDDLEWARE = [
+    'api.middleware.QueryTimingMiddleware',
+    'api.middleware.ReplicaRoutingMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -45,9 +47,13 @@ MIDDLEWARE = [
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
-    'debug_toolbar.middleware.DebugToolbarMiddleware',
 ]
 
+# debug_toolbar бесполезен для JSON API и не нужен в продакшене
+if DEBUG:
+    INSTALLED_APPS.append('debug_toolbar')
+    MIDDLEWARE.append('debug_toolbar.middleware.DebugToolbarMiddleware')
+
 ROOT_URLCONF = 'backend.urls'
 
 TEMPLATES = [
@@ -68,6 +74,17 @@ TEMPLATES = [
 
 WSGI_APPLICATION = 'backend.wsgi.application'
 
+# соединения с БД: DB_CONN_MAX_AGE — сколько секунд держать соединение
+# между запросами (0 — новое на каждый запрос), DB_CONN_HEALTH_CHECKS —
+# проверять его в начале запроса (backend.db.health: ключ CONN_HEALTH_CHECKS
+# в DATABASES появился только в Django 4.1), DB_POOL_SIZE > 0 — общий пул
+# соединений PostgreSQL на процесс для потоковых воркеров
+DB_CONN_MAX_AGE = int(os.getenv('DB_CONN_MAX_AGE', default=60))
+DB_CONN_HEALTH_CHECKS = os.getenv(
+    'DB_CONN_HEALTH_CHECKS', default='True').lower() == 'true'
+DB_POOL_SIZE = int(os.getenv('DB_POOL_SIZE', default=0))
+DB_POOL_TIMEOUT = int(os.getenv('DB_POOL_TIMEOUT', default=10))
+
 DATABASES = {
     'default': {
         'ENGINE': os.getenv('DB_ENGINE', default='django.db.backends.postgresql'),
@@ -75,9 +92,34 @@ DATABASES = {
         'USER': os.getenv('POSTGRES_USER',),
         'PASSWORD': os.getenv('POSTGRES_PASSWORD',),
         'HOST': os.getenv('DB_HOST',),
-        'PORT': os.getenv('DB_PORT',)
+        'PORT': os.getenv('DB_PORT',),
+        'CONN_MAX_AGE': DB_CONN_MAX_AGE,
     }
 }
+if DB_POOL_SIZE and DATABASES['default']['ENGINE'].endswith('postgresql'):
+    # соединение возвращается в пул в конце каждого запроса
+    DATABASES['default'].update(
+        ENGINE='backend.db.pooled_postgresql', CONN_MAX_AGE=0,
+        POOL_SIZE=DB_POOL_SIZE, POOL_TIMEOUT=DB_POOL_TIMEOUT)
+
+# реплики для чтения: DB_REPLICAS — адреса через запятую (для SQLite —
+# пути к файлам-копиям); безопасные запросы направляет на них
+# api.middleware.ReplicaRoutingMiddleware
+DATABASE_REPLICAS = []
+for number, address in enumerate(
+        filter(None, os.getenv('DB_REPLICAS', default='').split(',')), 1):
+    alias = f'replica_{number}'
+    DATABASES[alias] = {
+        **DATABASES['default'],
+        'NAME' if 'sqlite3' in DATABASES['default']['ENGINE'] else 'HOST': (
+            address.strip()),
+        'TEST': {'MIRROR': 'default'},
+    }
+    DATABASE_REPLICAS.append(alias)
+DATABASE_ROUTERS = ['backend.db.routers.ReplicaRouter']
+# сколько секунд после записи клиент читает из основной БД
+REPLICA_STICKY_SECONDS = int(
+    os.getenv('REPLICA_STICKY_SECONDS', default=10))
 
 AUTH_PASSWORD_VALIDATORS = [
     {
@@ -125,12 +167,100 @@ REST_FRAMEWORK = {
         'rest_framework.permissions.AllowAny',
     ],
     'DEFAULT_AUTHENTICATION_CLASSES': (
-        'rest_framework.authentication.TokenAuthentication',
+        'api.replicas.ReplicaTokenAuthentication',
     ),
     'DEFAULT_PAGINATION_CLASS': None,
     'PAGE_SIZE': 5,
 }
 
+# версии и счётчики кеша (лента, ETag, флаги пользователя, липкость
+# к основной базе) должны быть общими для всех воркеров: REDIS_URL
+# (redis://redis:6379/1) включает django-redis. LocMemCache по умолчанию
+# живёт в одном процессе и годится только для разработки
+REDIS_URL = os.getenv('REDIS_URL')
+if REDIS_URL:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django_redis.cache.RedisCache',
+            'LOCATION': REDIS_URL,
+            'OPTIONS': {
+                'CLIENT_CLASS': 'django_redis.client.DefaultClient',
+            },
+        }
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': os.getenv(
+                'CACHE_BACKEND',
+                default='django.core.cache.backends.locmem.LocMemCache'),
+            'LOCATION': os.getenv('CACHE_LOCATION', default='foodgram'),
+        }
+    }
+
+# время жизни закешированных страниц ленты рецептов для анонимов, сек.
+RECIPE_FEED_CACHE_TIMEOUT = int(
+    os.getenv('RECIPE_FEED_CACHE_TIMEOUT', default=300))
+
+# поиск ингредиентов по префиксу: 'memory' — индекс в памяти процесса,
+# 'db' — запрос по индексу lower(name) (для PostgreSQL на нескольких нодах)
+INGREDIENT_SEARCH_BACKEND = os.getenv(
+    'INGREDIENT_SEARCH_BACKEND', default='memory')
+INGREDIENT_SEARCH_LIMIT = int(os.getenv('INGREDIENT_SEARCH_LIMIT', default=50))
+
+# готовые PDF списков покупок кешируются по хешу содержимого
+SHOPPING_LIST_PDF_CACHE_TIMEOUT = int(
+    os.getenv('SHOPPING_LIST_PDF_CACHE_TIMEOUT', default=60 * 60))
+SHOPPING_LIST_PDF_CACHE_MAX_SIZE = 2 * 1024 * 1024
+# списки длиннее порога (строк) рендерятся фоновой задачей (api.export_jobs):
+# 'pool' — пул процессов веб-воркера, 'command' — только очередь в БД,
+# её разбирает manage.py run_export_jobs
+SHOPPING_LIST_PDF_JOB_THRESHOLD = int(
+    os.getenv('SHOPPING_LIST_PDF_JOB_THRESHOLD', default=500))
+EXPORT_JOB_RUNNER = os.getenv('EXPORT_JOB_RUNNER', default='pool')
+EXPORT_JOB_WORKERS = int(os.getenv('EXPORT_JOB_WORKERS', default=1))
+# предел long-poll статуса задачи (?wait=), сек., и срок хранения файлов.
+# Ожидание занимает синхронный воркер целиком, поэтому предел — пара
+# секунд, намного меньше timeout воркера gunicorn
+EXPORT_JOB_MAX_WAIT = int(os.getenv('EXPORT_JOB_MAX_WAIT', default=2))
+EXPORT_JOB_TTL = int(os.getenv('EXPORT_JOB_TTL', default=24 * 60 * 60))
+
+# окно замеров QueryTimingMiddleware на эндпоинт, частота сброса в кеш
+# и время жизни снимка процесса там, сек.
+API_METRICS_WINDOW = int(os.getenv('API_METRICS_WINDOW', default=1000))
+API_METRICS_FLUSH_EVERY = int(
+    os.getenv('API_METRICS_FLUSH_EVERY', default=50))
+API_METRICS_TTL = int(os.getenv('API_METRICS_TTL', default=60 * 60))
+
+# id избранного, корзины и подписок пользователя в общем кеше, сек.
+USER_STATE_CACHE_TIMEOUT = int(
+    os.getenv('USER_STATE_CACHE_TIMEOUT', default=10 * 60))
+
+# загрузка фото рецептов: пределы размера и уменьшенные копии
+RECIPE_IMAGE_MAX_BYTES = int(
+    os.getenv('RECIPE_IMAGE_MAX_BYTES', default=10 * 1024 * 1024))
+RECIPE_IMAGE_MAX_PIXELS = int(
+    os.getenv('RECIPE_IMAGE_MAX_PIXELS', default=40_000_000))
+RECIPE_IMAGE_FORMAT = os.getenv('RECIPE_IMAGE_FORMAT', default='WEBP')
+RECIPE_IMAGE_WORKERS = int(os.getenv('RECIPE_IMAGE_WORKERS', default=2))
+
+# Cache-Control ответов с ETag: справочники (теги, ингредиенты) и карточка
+# рецепта для анонимов; такие ответы nginx держит в микрокеше (nginx.conf)
+REFERENCE_CACHE_MAX_AGE = int(
+    os.getenv('REFERENCE_CACHE_MAX_AGE', default=60))
+RECIPE_CACHE_MAX_AGE = int(os.getenv('RECIPE_CACHE_MAX_AGE', default=5))
+
+# период полураспада вклада событий в рейтинги рецептов (recipes.scores), сек.
+RECIPE_POPULAR_HALF_LIFE = int(
+    os.getenv('RECIPE_POPULAR_HALF_LIFE', default=30 * 24 * 60 * 60))
+RECIPE_TRENDING_HALF_LIFE = int(
+    os.getenv('RECIPE_TRENDING_HALF_LIFE', default=24 * 60 * 60))
+
+# async-вьюхи чтения (api.async_views); включает их backend/asgi.py
+ASYNC_READ_VIEWS = os.getenv(
+    'ASYNC_READ_VIEWS', default='False').lower() == 'true'
+ASYNC_READ_WORKERS = int(os.getenv('ASYNC_READ_WORKERS', default=8))
+
 DJOSER = {
     'LOGIN_FIELD': 'email',
     'HIDE_USERS': False,
@@ -0,0 +1,10 @@
+import os
+
+# SERVER_MODE=asgi — uvicorn-воркеры и backend.asgi с async-вьюхами
+# чтения; по умолчанию синхронные воркеры и backend.wsgi
+if os.getenv('SERVER_MODE', 'wsgi') == 'asgi':
+    wsgi_app = 'backend.asgi:application'
+    worker_class = 'uvicorn.workers.UvicornWorker'
+else:
+    wsgi_app = 'backend.wsgi:application'
+bind = '0:8000'
@@ -2,7 +2,9 @@
 from django.contrib import admin
 from django.utils.text import Truncator
 
-from .models import Cart, Favorite, Ingredient, ReciIngredi, Recipe, Tag
+from .models import (Cart, ExportJob, Favorite, Ingredient, ReciIngredi,
+                     Recipe, Tag)
+from .search import update_search_index
 
 
 class ReciIngrediInline(admin.TabularInline):
@@ -30,13 +32,21 @@ class RecipeAdmin(admin.ModelAdmin):
     def tags(self, obj):
         return Tag.recipes.object.filter(recipe=obj.pk)
 
+    @admin.display(description='В избранном',
+                   ordering='favorites_count')
     def total_faved(self, obj):
-        return obj.faved_by.count()
+        return obj.favorites_count
 
     def short_text(self, obj):
         return Truncator(obj.text).chars(120)
     short_text.short_description = 'Текст'
 
+    def save_related(self, request, form, formsets, change):
+        """ Ингредиенты из инлайна пишутся после рецепта: поиск
+        обновляется, когда состав уже сохранён. """
+        super().save_related(request, form, formsets, change)
+        update_search_index((form.instance.pk,))
+
 
 @admin.register(Tag)
 class TagAdmin(admin.ModelAdmin):
@@ -59,3 +69,10 @@ class CartAdmin(admin.ModelAdmin):
     list_display = ('id', 'user', 'recipe')
     search_fields = ('user', 'recipe',)
     list_filter = ('user',)
+
+
+@admin.register(ExportJob)
+class ExportJobAdmin(admin.ModelAdmin):
+    list_display = ('id', 'user', 'status', 'created_at', 'finished_at')
+    list_filter = ('status',)
+    readonly_fields = ('digest', 'created_at', 'started_at', 'finished_at')
@@ -0,0 +1,117 @@
+from collections import defaultdict
+
+from django.db.models import Case, F, Q, Sum, Value, When
+
+from recipes.models import Cart, ReciIngredi, ShoppingListItem
+
+# единица → (базовая единица, множитель); остальные не переводятся
+UNIT_CONVERSIONS = {
+    'кг': ('г', 1000),
+    'л': ('мл', 1000),
+}
+
+
+def normalize(amount, unit):
+    """ Количество в базовой единице: 2 кг → 2000 г. """
+    base_unit, factor = UNIT_CONVERSIONS.get(unit, (unit, 1))
+    return amount * factor, base_unit
+
+
+def lines_totals(lines):
+    """ {(название, базовая единица): количество} по строкам
+    (название, единица, количество). """
+    totals = defaultdict(int)
+    for name, unit, amount in lines:
+        amount, unit = normalize(amount, unit)
+        totals[name, unit] += amount
+    return totals
+
+
+def recipe_totals(recipe_ids):
+    """ {(название, базовая единица): количество} по рецептам. """
+    return lines_totals(
+        ReciIngredi.objects.filter(recipe_id__in=recipe_ids).values_list(
+            'ingredient__name', 'ingredient__measurement_unit', 'amount'))
+
+
+def apply_delta(user_ids, delta):
+    """ Сдвигает сводки пользователей на delta за три запроса:
+    недостающие строки вставляются нулями (ON CONFLICT DO NOTHING),
+    затем один UPDATE amount = amount + CASE ..., затем удаляются
+    опустевшие строки. Без чтения-изменения-записи, поэтому
+    одновременные изменения корзины не теряются. """
+    delta = {key: value for key, value in delta.items() if value}
+    if not delta or not user_ids:
+        return
+    ShoppingListItem.objects.bulk_create(
+        (ShoppingListItem(user_id=user_id, name=name,
+                          measurement_unit=unit, amount=0)
+         for user_id in user_ids
+         for (name, unit), value in delta.items() if value > 0),
+        ignore_conflicts=True)
+    ShoppingListItem.objects.filter(
+        Q(*(Q(name=name, measurement_unit=unit) for name, unit in delta),
+          _connector=Q.OR),
+        user_id__in=user_ids,
+    ).update(amount=F('amount') + Case(
+        *(When(name=name, measurement_unit=unit, then=Value(value))
+          for (name, unit), value in delta.items()),
+        default=Value(0)))
+    if any(value < 0 for value in delta.values()):
+        ShoppingListItem.objects.filter(
+            user_id__in=user_ids, amount__lte=0).delete()
+
+
+def cart_changed(user_id, recipe_ids, sign):
+    """ Рецепты добавлены в корзину (sign=1) или убраны из неё (-1). """
+    apply_delta((user_id,), {
+        key: sign * value
+        for key, value in recipe_totals(recipe_ids).items()})
+
+
+def carting_users(recipe_id):
+    return list(Cart.objects.filter(
+        recipe_id=recipe_id).values_list('user_id', flat=True))
+
+
+def recipe_ingredients_changed(users, before, after):
+    """ Ингредиенты рецепта в корзинах users изменились: сводки
+    сдвигаются на разницу между составами after и before. """
+    if not users:
+        return
+    apply_delta(users, {
+        key: after.get(key, 0) - before.get(key, 0)
+        for key in after.keys() | before.keys()})
+
+
+def recipe_deleted(recipe_id):
+    """ Вызывается до удаления рецепта, пока строки Cart ещё на месте. """
+    apply_delta(carting_users(recipe_id), {
+        key: -value for key, value in recipe_totals((recipe_id,)).items()})
+
+
+def rebuild_cart_summaries(user_ids=None):
+    """ Пересчитывает сводки целиком из Cart (после массовых загрузок,
+    правок в админке, переименования ингредиентов). """
+    # одним filter(): отдельные вызовы по обратной связи дали бы два JOIN
+    if user_ids is None:
+        lines = ReciIngredi.objects.filter(recipe__cart__isnull=False)
+        items = ShoppingListItem.objects.all()
+    else:
+        lines = ReciIngredi.objects.filter(recipe__cart__user__in=user_ids)
+        items = ShoppingListItem.objects.filter(user__in=user_ids)
+    lines = lines.values_list(
+        'recipe__cart__user', 'ingredient__name',
+        'ingredient__measurement_unit',
+    ).annotate(total=Sum('amount')).order_by()
+    totals = defaultdict(int)
+    for user_id, name, unit, amount in lines:
+        amount, unit = normalize(amount, unit)
+        totals[user_id, name, unit] += amount
+    items.delete()
+    ShoppingListItem.objects.bulk_create(
+        (ShoppingListItem(user_id=user_id, name=name,
+                          measurement_unit=unit, amount=amount)
+         for (user_id, name, unit), amount in totals.items()),
+        batch_size=5000)
+    return len(totals)
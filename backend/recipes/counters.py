@@ -0,0 +1,35 @@
+from django.db.models import Count, F, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+from recipes.models import Cart, Favorite, Recipe
+
+# денормализованный счётчик рецепта для каждой модели-флага
+FLAG_COUNTERS = {
+    Favorite: 'favorites_count',
+    Cart: 'carts_count',
+}
+
+
+def flag_count(model):
+    """ Подзапрос: сколько строк model ссылается на рецепт. """
+    return Coalesce(Subquery(
+        model.objects.filter(recipe=OuterRef('pk')).order_by()
+        .values('recipe').annotate(total=Count('pk')).values('total')
+    ), 0)
+
+
+def change_flag_counter(model, recipe_ids, delta):
+    """ Атомарно сдвигает счётчик в БД, без чтения-изменения-записи. """
+    counter = FLAG_COUNTERS[model]
+    Recipe.objects.filter(pk__in=recipe_ids).update(
+        **{counter: F(counter) + delta})
+
+
+def recount_flag_counters(models=FLAG_COUNTERS, recipe_ids=None):
+    """ Пересчитывает счётчики одним UPDATE (для всех рецептов
+    или только для recipe_ids). """
+    recipes = Recipe.objects.all()
+    if recipe_ids is not None:
+        recipes = recipes.filter(pk__in=recipe_ids)
+    return recipes.update(
+        **{FLAG_COUNTERS[model]: flag_count(model) for model in models})
@@ -0,0 +1,97 @@
+import logging
+import os
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.db import DatabaseError, connection, transaction
+from PIL import Image, ImageOps, features
+
+from recipes.models import Recipe
+
+logger = logging.getLogger(__name__)
+
+# поле модели → (максимальные ширина и высота, обрезать ли до размера)
+RENDITIONS = {
+    'image_card': ((600, 400), False),
+    'image_thumb': ((160, 160), True),
+}
+QUALITY = 80
+
+_executor = None
+
+
+def rendition_format():
+    """ WebP, если Pillow собран с ним, иначе JPEG. """
+    if settings.RECIPE_IMAGE_FORMAT.upper() == 'WEBP' and features.check(
+            'webp'):
+        return 'WEBP'
+    return 'JPEG'
+
+
+def render(image, size, crop, image_format):
+    """ Уменьшенная копия PIL-изображения в виде байтов. """
+    if crop:
+        image = ImageOps.fit(image, size, Image.LANCZOS)
+    else:
+        image = image.copy()
+        # reducing_gap: сначала грубое уменьшение в разы, потом LANCZOS
+        image.thumbnail(size, Image.LANCZOS, reducing_gap=3.0)
+    if image_format == 'JPEG' and image.mode != 'RGB':
+        image = image.convert('RGB')
+    elif image.mode not in ('RGB', 'RGBA'):
+        image = image.convert('RGBA')
+    buffer = BytesIO()
+    image.save(buffer, image_format, quality=QUALITY, method=4)
+    return buffer.getvalue()
+
+
+def build_renditions(recipe):
+    """ Делает все копии фото рецепта и сохраняет их в хранилище. """
+    image_format = rendition_format()
+    extension = 'webp' if image_format == 'WEBP' else 'jpg'
+    stem = os.path.splitext(os.path.basename(recipe.image.name))[0]
+    with recipe.image.open('rb') as source:
+        image = Image.open(source)
+        largest = max(size for size, crop in RENDITIONS.values())
+        # JPEG декодируется сразу в уменьшенном масштабе — в разы быстрее
+        image.draft('RGB', (largest[0] * 2, largest[1] * 2))
+        image = ImageOps.exif_transpose(image)
+        for field, (size, crop) in RENDITIONS.items():
+            content = ContentFile(render(image, size, crop, image_format))
+            rendition = getattr(recipe, field)
+            rendition.save(f'{stem}_{field[6:]}.{extension}', content,
+                           save=False)
+    # только эти колонки: post_save сбросит кеш ленты, а новая
+    # updated_at — ETag карточки рецепта
+    recipe.save(update_fields=(*RENDITIONS, 'updated_at'))
+
+
+def build_renditions_for(recipe_id):
+    """ Задача для пула: рецепт перечитывается, фото могло смениться.
+    Возвращает False, если копии сделать не удалось. """
+    try:
+        recipe = Recipe.objects.filter(pk=recipe_id).first()
+        if recipe is not None and recipe.image:
+            build_renditions(recipe)
+        return True
+    except (OSError, DatabaseError):
+        logger.exception('Не удалось сделать копии фото рецепта %s',
+                         recipe_id)
+        return False
+    finally:
+        # у каждого потока пула своё соединение с БД
+        connection.close()
+
+
+def schedule_renditions(recipe):
+    """ После коммита отдаёт копии фото в фоновый пул потоков: Pillow
+    отпускает GIL при декодировании и сжатии, запрос не ждёт. """
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(
+            max_workers=settings.RECIPE_IMAGE_WORKERS,
+            thread_name_prefix='recipe-images')
+    transaction.on_commit(
+        lambda: _executor.submit(build_renditions_for, recipe.pk))
@@ -0,0 +1,36 @@
+# isort: skip_file
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from recipes.images import build_renditions_for
+from recipes.models import Recipe
+
+
+class Command(BaseCommand):
+    help = ('Builds card and thumbnail renditions of recipe images '
+            '(by default only for recipes that have none yet)')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--all', action='store_true',
+            help='Rebuild renditions for every recipe')
+        parser.add_argument(
+            '--workers', type=int, default=settings.RECIPE_IMAGE_WORKERS,
+            help='Number of worker threads')
+
+    def handle(self, *args, **options):
+        recipes = Recipe.objects.exclude(image='')
+        if not options['all']:
+            recipes = recipes.filter(image_thumb='')
+        recipe_ids = list(recipes.values_list('pk', flat=True))
+        with ThreadPoolExecutor(max_workers=options['workers']) as executor:
+            results = list(executor.map(build_renditions_for, recipe_ids))
+        failed = [pk for pk, ok in zip(recipe_ids, results) if not ok]
+        if failed:
+            self.stderr.write(
+                f'Не удалось обработать рецепты: {failed}')
+        self.stdout.write(self.style.SUCCESS(
+            f'Обработано рецептов: {len(recipe_ids) - len(failed)}, '
+            f'с ошибками: {len(failed)}.'))
@@ -0,0 +1,184 @@
+# isort: skip_file
+import random
+import time
+from contextlib import contextmanager
+from datetime import timedelta
+from functools import partial
+
+from django.contrib.auth.hashers import make_password
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.utils import timezone
+
+from api.cache import invalidate_recipe_feed, touch_tables
+from api.ingredient_index import invalidate_ingredient_index
+from recipes.models import (Cart, Favorite, Ingredient, ReciIngredi, Recipe,
+                            RecipeScore, ShoppingListItem, Tag)
+from recipes.cart_summary import rebuild_cart_summaries
+from recipes.counters import recount_flag_counters
+from recipes.scores import rebuild_scores
+from recipes.search import update_search_index
+from users.models import Follow, User
+
+DEFAULT_TAGS = (
+    ('завтрак', '#E26C2D', 'breakfast'),
+    ('обед', '#49B64E', 'lunch'),
+    ('ужин', '#8775D2', 'dinner'),
+)
+# первые слова названий, чтобы поиск по названию был избирательным
+DISHES = ('Суп', 'Салат', 'Рагу', 'Пирог', 'Запеканка', 'Каша', 'Омлет',
+          'Паста', 'Плов', 'Котлеты', 'Жаркое', 'Рулет')
+
+
+@contextmanager
+def explicit_pub_date():
+    """ auto_now_add перетирает pub_date в bulk_create, а для ленты
+    нужны разные даты публикации. """
+    field = Recipe._meta.get_field('pub_date')
+    field.auto_now_add = False
+    try:
+        yield
+    finally:
+        field.auto_now_add = True
+
+
+class Command(BaseCommand):
+    help = ('Generates a synthetic dataset (users, recipes, ingredients, '
+            'favorites, carts, follows) with bulk inserts for benchmarks')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=100)
+        parser.add_argument('--recipes-per-user', type=int, default=10)
+        parser.add_argument('--ingredients-per-recipe', type=int, default=8)
+        parser.add_argument(
+            '--favorite-density', type=float, default=0.05,
+            help='Share of all recipes each user has in favorites')
+        parser.add_argument(
+            '--cart-density', type=float, default=0.01,
+            help='Share of all recipes each user has in the shopping cart')
+        parser.add_argument(
+            '--follow-density', type=float, default=0.05,
+            help='Share of other users each user follows')
+        parser.add_argument('--batch-size', type=int, default=5000)
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument(
+            '--prefix', type=str, default='synth',
+            help='Username prefix; must not be used already')
+
+    def handle(self, *args, **options):
+        self.random = random.Random(options['seed'])
+        self.batch_size = options['batch_size']
+        prefix = options['prefix']
+        if User.objects.filter(username__startswith=f'{prefix}_').exists():
+            raise CommandError(
+                f'Пользователи с префиксом {prefix}_ уже есть, '
+                'укажите другой --prefix.')
+        started = time.perf_counter()
+        with transaction.atomic():
+            users = self.create_users(prefix, options['users'])
+            recipes = self.create_recipes(
+                users, options['recipes_per_user'],
+                options['ingredients_per_recipe'])
+            self.create_flags(Favorite, users, recipes,
+                              options['favorite_density'])
+            self.create_flags(Cart, users, recipes, options['cart_density'])
+            # bulk_create обходит сигналы, счётчики флагов считаются заново
+            self.stdout.write('  flag counters: {}'.format(
+                recount_flag_counters(recipe_ids=recipes)))
+            self.report(ShoppingListItem, rebuild_cart_summaries(users))
+            self.create_follows(users, options['follow_density'])
+            self.report(RecipeScore, rebuild_scores())
+            # bulk_create не шлёт сигналы, кеши сбрасываются вручную
+            transaction.on_commit(invalidate_recipe_feed)
+            transaction.on_commit(invalidate_ingredient_index)
+            transaction.on_commit(
+                partial(touch_tables, 'users', 'tags', 'ingredients'))
+        self.stdout.write(self.style.SUCCESS(
+            f'Готово за {time.perf_counter() - started:.1f} с.'))
+
+    def report(self, model, count):
+        self.stdout.write(f'  {model.__name__}: {count}')
+
+    def bulk(self, model, objects):
+        model.objects.bulk_create(objects, batch_size=self.batch_size)
+        self.report(model, len(objects))
+
+    def create_users(self, prefix, count):
+        password = make_password(None)
+        self.bulk(User, [
+            User(username=f'{prefix}_{number}',
+                 email=f'{prefix}_{number}@example.com',
+                 first_name='Имя', last_name=f'Фамилия {number}',
+                 password=password)
+            for number in range(count)])
+        # SQLite не возвращает pk из bulk_create
+        return list(User.objects.filter(
+            username__startswith=f'{prefix}_').values_list('id', flat=True))
+
+    def ingredient_ids(self, needed):
+        ids = list(Ingredient.objects.values_list('id', flat=True))
+        if len(ids) < needed:
+            Ingredient.objects.bulk_create(
+                Ingredient(name=f'синтетический ингредиент {number}',
+                           measurement_unit='г')
+                for number in range(needed - len(ids)))
+            ids = list(Ingredient.objects.values_list('id', flat=True))
+        return ids
+
+    def tag_ids(self):
+        if not Tag.objects.exists():
+            Tag.objects.bulk_create(
+                Tag(name=name, color=color, slug=slug)
+                for name, color, slug in DEFAULT_TAGS)
+        return list(Tag.objects.values_list('id', flat=True))
+
+    def create_recipes(self, users, per_user, ingredients_per_recipe):
+        now = timezone.now()
+        with explicit_pub_date():
+            self.bulk(Recipe, [
+                Recipe(author_id=author,
+                       name=f'{self.random.choice(DISHES)} {number}',
+                       text='Синтетический рецепт для нагрузочных тестов.',
+                       image='recipes/synthetic.png',
+                       cooking_time=self.random.randint(5, 180),
+                       pub_date=now - timedelta(
+                           minutes=self.random.randint(0, 525600)))
+                for author in users
+                for number in range(per_user)])
+        recipes = list(Recipe.objects.filter(
+            author__in=users).values_list('id', flat=True))
+        ingredients = self.ingredient_ids(ingredients_per_recipe)
+        tags = self.tag_ids()
+        self.bulk(ReciIngredi, [
+            ReciIngredi(recipe_id=recipe, ingredient_id=ingredient,
+                        amount=self.random.randint(1, 500))
+            for recipe in recipes
+            for ingredient in self.random.sample(
+                ingredients, ingredients_per_recipe)])
+        through = Recipe.tags.through
+        self.bulk(through, [
+            through(recipe_id=recipe, tag_id=tag)
+            for recipe in recipes
+            for tag in self.random.sample(
+                tags, self.random.randint(1, len(tags)))])
+        # поисковый индекс строится по уже записанным ингредиентам
+        update_search_index(recipes)
+        self.stdout.write(f'  search index: {len(recipes)}')
+        return recipes
+
+    def sample(self, population, density):
+        count = min(len(population), round(len(population) * density))
+        return self.random.sample(population, count)
+
+    def create_flags(self, model, users, recipes, density):
+        self.bulk(model, [
+            model(user_id=user, recipe_id=recipe)
+            for user in users
+            for recipe in self.sample(recipes, density)])
+
+    def create_follows(self, users, density):
+        self.bulk(Follow, [
+            Follow(user_id=user, following_id=author)
+            for user in users
+            for author in self.sample(users, density)
+            if author != user])
@@ -1,36 +1,177 @@
 # isort: skip_file
+import csv
+import io
 import json
+import os
+import time
+from functools import partial
+from itertools import islice
 
-from django.conf import settings
-from django.core.management.base import BaseCommand
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
 
+from api.cache import touch_tables
+from api.ingredient_index import invalidate_ingredient_index
 from recipes.models import Ingredient
 
-DIR = settings.BASE_DIR
+FIELDS = ('name', 'measurement_unit')
+CHUNK_SIZE = 64 * 1024
+
+
+def iter_json_array(file):
+    """ Потоковый разбор JSON-массива объектов: в памяти держится
+    только текущий кусок файла, а не весь список. """
+    decoder = json.JSONDecoder()
+    buffer = ''
+    number = 0
+    started = False
+    eof = False
+    while True:
+        buffer = buffer.lstrip()
+        if not started and buffer:
+            if buffer[0] != '[':
+                raise CommandError('Ожидался JSON-массив объектов.')
+            buffer = buffer[1:]
+            started = True
+            continue
+        if buffer.startswith(','):
+            buffer = buffer[1:]
+            continue
+        if buffer.startswith(']'):
+            return
+        try:
+            row, end = decoder.raw_decode(buffer)
+        except json.JSONDecodeError:
+            if eof:
+                raise CommandError('Файл JSON оборван или повреждён.')
+            chunk = file.read(CHUNK_SIZE)
+            eof = not chunk
+            buffer += chunk
+            continue
+        number += 1
+        if not isinstance(row, dict) or not set(FIELDS) <= row.keys():
+            raise CommandError(
+                f'Элемент {number}: ожидались поля {", ".join(FIELDS)}.')
+        yield row['name'], row['measurement_unit']
+        buffer = buffer[end:]
+
+
+def iter_csv(file):
+    reader = csv.reader(file)
+    for row in reader:
+        if not row or tuple(row) == FIELDS:
+            continue
+        if len(row) < len(FIELDS):
+            raise CommandError(
+                f'Строка {reader.line_num}: ожидались столбцы '
+                f'{", ".join(FIELDS)}.')
+        yield row[0], row[1]
+
+
+READERS = {
+    '.json': iter_json_array,
+    '.csv': iter_csv,
+}
+
+
+def batches(iterable, size):
+    iterator = iter(iterable)
+    batch = list(islice(iterator, size))
+    while batch:
+        yield batch
+        batch = list(islice(iterator, size))
 
 
 class Command(BaseCommand):
-    help = 'Loads ingredients data to database from json files'
+    help = 'Loads ingredients data to database from json or csv files'
 
     def add_arguments(self, parser):
         parser.add_argument(
             '--file',
             type=str,
-            help='Path to json file'
+            required=True,
+            help='Path to json or csv file'
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=1000,
+            help='Rows per INSERT / COPY batch'
+        )
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help='Parse and insert inside a transaction, then roll back'
         )
 
     def handle(self, *args, **options):
-        with open(options['file'], 'r', encoding="utf-8-sig") as file:
-            data = json.load(file)
-            for row in data:
-                Ingredient.objects.get_or_create(**row)
-
-        # for csv_name in CSV_MODEL:
-        #     with open(
-        #         DIR + f'/static/data/{csv_name}.csv',
-        #         'r',
-        #         encoding="utf-8-sig"
-        #     ) as file:
-        #         reader = csv.DictReader(file, delimiter=",")
-        #         for row in reader:
-        #             CSV_MODEL[csv_name].objects.get_or_create(**row)
+        extension = os.path.splitext(options['file'])[1].lower()
+        if extension not in READERS:
+            raise CommandError('Поддерживаются только файлы .json и .csv.')
+        started = time.perf_counter()
+        with open(options['file'], 'r', encoding='utf-8-sig') as file:
+            with transaction.atomic():
+                parsed, inserted = self.load(
+                    READERS[extension](file), options['batch_size'])
+                if options['dry_run']:
+                    transaction.set_rollback(True)
+                else:
+                    transaction.on_commit(invalidate_ingredient_index)
+                    transaction.on_commit(
+                        partial(touch_tables, 'ingredients'))
+        elapsed = time.perf_counter() - started
+        self.stdout.write(self.style.SUCCESS(
+            f'{"[dry-run] " if options["dry_run"] else ""}'
+            f'Прочитано {parsed}, добавлено {inserted} ингредиентов '
+            f'за {elapsed:.2f} с ({parsed / max(elapsed, 1e-6):.0f} строк/с).'
+        ))
+
+    def load(self, rows, batch_size):
+        """ Отбрасывает уже существующие пары (name, measurement_unit)
+        по ограничению unique_ingredi_check и пишет остальное пачками. """
+        seen = set(Ingredient.objects.values_list(*FIELDS))
+        parsed = inserted = 0
+        started = time.perf_counter()
+        write = (self.copy_batch if connection.vendor == 'postgresql'
+                 else self.insert_batch)
+        for batch in batches(rows, batch_size):
+            parsed += len(batch)
+            new_rows = []
+            for row in batch:
+                if row not in seen:
+                    seen.add(row)
+                    new_rows.append(row)
+            if new_rows:
+                write(new_rows)
+                inserted += len(new_rows)
+            elapsed = time.perf_counter() - started
+            self.stdout.write(
+                f'  {parsed} строк, {parsed / max(elapsed, 1e-6):.0f} строк/с')
+        return parsed, inserted
+
+    def insert_batch(self, rows):
+        Ingredient.objects.bulk_create(
+            (Ingredient(name=name, measurement_unit=unit)
+             for name, unit in rows),
+            ignore_conflicts=True)
+
+    def copy_batch(self, rows):
+        """ PostgreSQL: COPY во временную таблицу и INSERT ... ON CONFLICT
+        DO NOTHING — на случай конкурентной вставки тех же строк. """
+        table = Ingredient._meta.db_table
+        buffer = io.StringIO()
+        csv.writer(buffer).writerows(rows)
+        buffer.seek(0)
+        with connection.cursor() as cursor:
+            cursor.execute(
+                'CREATE TEMP TABLE IF NOT EXISTS ingredient_load '
+                '(name varchar(256), measurement_unit varchar(50)) '
+                'ON COMMIT DROP')
+            cursor.execute('TRUNCATE ingredient_load')
+            cursor.cursor.copy_expert(
+                'COPY ingredient_load (name, measurement_unit) '
+                'FROM STDIN WITH (FORMAT csv)', buffer)
+            cursor.execute(
+                f'INSERT INTO {table} (name, measurement_unit) '
+                'SELECT name, measurement_unit FROM ingredient_load '
+                'ON CONFLICT (name, measurement_unit) DO NOTHING')
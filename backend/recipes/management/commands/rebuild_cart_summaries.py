@@ -0,0 +1,21 @@
+# isort: skip_file
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from recipes.cart_summary import rebuild_cart_summaries
+
+
+class Command(BaseCommand):
+    help = ('Rebuilds the per-user shopping list summaries from the Cart '
+            'table (needed after bulk loads or admin edits)')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--users', type=int, nargs='+',
+            help='Only these user ids (default: everyone)')
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            rows = rebuild_cart_summaries(options['users'])
+        self.stdout.write(self.style.SUCCESS(
+            f'Сводки списков покупок пересобраны, строк: {rows}.'))
@@ -0,0 +1,30 @@
+# isort: skip_file
+import time
+
+from django.core.management.base import BaseCommand
+
+from api.cache import invalidate_recipe_feed
+from recipes.scores import rebuild_scores
+
+
+class Command(BaseCommand):
+    help = ('Recomputes the popular and trending recipe scores from the '
+            'Favorite, Cart and Follow tables (run it periodically)')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--every', type=float,
+            help='Keep running and rebuild every N seconds')
+
+    def handle(self, *args, **options):
+        while True:
+            started = time.perf_counter()
+            count = rebuild_scores()
+            # страницы ленты для анонимов кешируются с прежним порядком
+            invalidate_recipe_feed()
+            self.stdout.write(self.style.SUCCESS(
+                f'Пересчитано рейтингов: {count} за '
+                f'{time.perf_counter() - started:.1f} с.'))
+            if not options['every']:
+                break
+            time.sleep(options['every'])
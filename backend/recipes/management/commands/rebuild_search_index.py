@@ -0,0 +1,18 @@
+# isort: skip_file
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from recipes.models import Recipe
+from recipes.search import update_search_index
+
+
+class Command(BaseCommand):
+    help = ('Rebuilds full-text search data for all recipes '
+            '(needed after bulk loads or ingredient renames)')
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            update_search_index()
+        self.stdout.write(self.style.SUCCESS(
+            f'Поисковый индекс пересобран, рецептов: '
+            f'{Recipe.objects.count()}.'))
@@ -0,0 +1,26 @@
+# isort: skip_file
+from django.core.management.base import BaseCommand
+from django.db.models import F, Q
+
+from recipes.counters import (FLAG_COUNTERS, flag_count,
+                              recount_flag_counters)
+from recipes.models import Recipe
+
+
+class Command(BaseCommand):
+    help = ('Recomputes Recipe.favorites_count and Recipe.carts_count '
+            'from the Favorite and Cart tables in one UPDATE')
+
+    def handle(self, *args, **options):
+        # сначала считаем расхождения — для отчёта
+        drifted = Recipe.objects.annotate(
+            **{f'actual_{field}': flag_count(model)
+               for model, field in FLAG_COUNTERS.items()}
+        ).filter(
+            Q(*(~Q(**{field: F(f'actual_{field}')})
+                for field in FLAG_COUNTERS.values()), _connector=Q.OR)
+        ).count()
+        updated = recount_flag_counters()
+        self.stdout.write(self.style.SUCCESS(
+            f'Пересчитано рецептов: {updated}, '
+            f'исправлено расхождений: {drifted}.'))
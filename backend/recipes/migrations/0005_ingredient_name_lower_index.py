@@ -0,0 +1,30 @@
+from django.db import migrations
+
+INDEX_NAME = 'recipes_ingredient_name_lower_idx'
+
+
+def create_index(apps, schema_editor):
+    """ Функциональный индекс для LIKE 'префикс%' по lower(name).
+    text_pattern_ops нужен, чтобы индекс работал при любой локали БД. """
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    schema_editor.execute(
+        f'CREATE INDEX IF NOT EXISTS {INDEX_NAME} '
+        'ON recipes_ingredient (lower(name) text_pattern_ops)')
+
+
+def drop_index(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    schema_editor.execute(f'DROP INDEX IF EXISTS {INDEX_NAME}')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0004_auto_20221108_1718'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_index, drop_index),
+    ]
@@ -0,0 +1,18 @@
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+    """ Индекс (tag_id, recipe_id) для фильтра по тегам: уникальный
+    индекс автоматической through-таблицы начинается с recipe_id. """
+
+    dependencies = [
+        ('recipes', '0007_recipe_pub_date_id_index'),
+    ]
+
+    operations = [
+        migrations.RunSQL(
+            'CREATE INDEX recipes_recipe_tags_tag_recipe_idx '
+            'ON recipes_recipe_tags (tag_id, recipe_id)',
+            'DROP INDEX recipes_recipe_tags_tag_recipe_idx',
+        ),
+    ]
@@ -0,0 +1,61 @@
+# Generated by Django 3.2.16 on 2026-10-18 20:36
+
+import django.contrib.postgres.search
+from django.db import migrations
+
+INDEX_NAME = 'recipe_search_vector_idx'
+FTS_TABLE = 'recipes_recipe_fts'
+INGREDIENT_NAMES = (
+    'SELECT {aggregate} FROM recipes_recipe_ingredient ri '
+    'JOIN recipes_ingredient i ON i.id = ri.ingredient_id '
+    'WHERE ri.recipe_id = r.id')
+
+
+def create_search(apps, schema_editor):
+    """ PostgreSQL: GIN-индекс по search_vector и его заполнение.
+    SQLite: виртуальная таблица FTS5 с теми же данными. """
+    vendor = schema_editor.connection.vendor
+    if vendor == 'postgresql':
+        names = INGREDIENT_NAMES.format(aggregate="string_agg(i.name, ' ')")
+        schema_editor.execute(
+            'UPDATE recipes_recipe r SET search_vector = '
+            "setweight(to_tsvector('russian', r.name), 'A') || "
+            f"setweight(to_tsvector('russian', coalesce(({names}), '')), "
+            "'B') || setweight(to_tsvector('russian', r.text), 'C')")
+        schema_editor.execute(
+            f'CREATE INDEX IF NOT EXISTS {INDEX_NAME} '
+            'ON recipes_recipe USING GIN (search_vector)')
+    elif vendor == 'sqlite':
+        names = INGREDIENT_NAMES.format(
+            aggregate="group_concat(i.name, ' ')")
+        schema_editor.execute(
+            f'CREATE VIRTUAL TABLE IF NOT EXISTS {FTS_TABLE} USING fts5('
+            "name, text, ingredients, tokenize='unicode61 remove_diacritics 2')")
+        schema_editor.execute(
+            f'INSERT INTO {FTS_TABLE} (rowid, name, text, ingredients) '
+            f"SELECT r.id, r.name, r.text, coalesce(({names}), '') "
+            'FROM recipes_recipe r')
+
+
+def drop_search(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    if vendor == 'postgresql':
+        schema_editor.execute(f'DROP INDEX IF EXISTS {INDEX_NAME}')
+    elif vendor == 'sqlite':
+        schema_editor.execute(f'DROP TABLE IF EXISTS {FTS_TABLE}')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0009_recipe_image_renditions'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='recipe',
+            name='search_vector',
+            field=django.contrib.postgres.search.SearchVectorField(editable=False, null=True),
+        ),
+        migrations.RunPython(create_search, drop_search),
+    ]
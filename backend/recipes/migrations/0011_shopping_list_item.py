@@ -0,0 +1,57 @@
+# Generated by Django 3.2.16 on 2026-10-18 20:43
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+from collections import defaultdict
+from django.db.models import Sum
+
+UNIT_CONVERSIONS = {'кг': ('г', 1000), 'л': ('мл', 1000)}
+
+
+def build_summaries(apps, schema_editor):
+    ReciIngredi = apps.get_model('recipes', 'ReciIngredi')
+    ShoppingListItem = apps.get_model('recipes', 'ShoppingListItem')
+    lines = ReciIngredi.objects.filter(
+        recipe__cart__isnull=False).values_list(
+        'recipe__cart__user', 'ingredient__name',
+        'ingredient__measurement_unit',
+    ).annotate(total=Sum('amount')).order_by()
+    totals = defaultdict(int)
+    for user_id, name, unit, amount in lines:
+        unit, factor = UNIT_CONVERSIONS.get(unit, (unit, 1))
+        totals[user_id, name, unit] += amount * factor
+    ShoppingListItem.objects.bulk_create(
+        (ShoppingListItem(user_id=user_id, name=name,
+                          measurement_unit=unit, amount=amount)
+         for (user_id, name, unit), amount in totals.items()),
+        batch_size=5000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('recipes', '0010_recipe_search'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ShoppingListItem',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=256, verbose_name='Ингредиент')),
+                ('measurement_unit', models.CharField(max_length=50, verbose_name='Единица измерения')),
+                ('amount', models.IntegerField(verbose_name='Количество')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='shopping_list', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'ordering': ('name', 'measurement_unit'),
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='shoppinglistitem',
+            constraint=models.UniqueConstraint(fields=('user', 'name', 'measurement_unit'), name='unique_shopping_list_item'),
+        ),
+        migrations.RunPython(build_summaries, migrations.RunPython.noop),
+    ]
@@ -1,4 +1,7 @@
 # isort: skip_file
+import uuid
+
+from django.contrib.postgres.search import SearchVectorField
 from django.core.validators import MaxValueValidator, MinValueValidator
 from django.db import models
 
@@ -45,6 +48,13 @@ class Recipe(models.Model):
         on_delete=models.CASCADE)
     name = models.CharField('Название', max_length=512)
     image = models.ImageField('Фотография', upload_to='recipes/', blank=False)
+    # уменьшенные копии image, их делает recipes.images в фоне
+    image_card = models.ImageField(
+        'Фото для карточки', upload_to='recipes/renditions/',
+        blank=True, editable=False)
+    image_thumb = models.ImageField(
+        'Миниатюра', upload_to='recipes/renditions/',
+        blank=True, editable=False)
     text = models.TextField(
         'Описание', max_length=6000,
         help_text='Дайте общее описание рецепта, а затем перечислите '
@@ -61,6 +71,8 @@ class Recipe(models.Model):
                     MaxValueValidator(3000, message='Не больше 2 дней!')),
         verbose_name='Время приготовления (мин.)')
     pub_date = models.DateTimeField('Дата публикации', auto_now_add=True)
+    # меняется при каждом save(); из неё ETag и Last-Modified карточки
+    updated_at = models.DateTimeField('Дата изменения', auto_now=True)
 
     faved_by = models.ManyToManyField(
         User, through='Favorite', related_name='favorited',
@@ -68,11 +80,27 @@ class Recipe(models.Model):
     in_cart_for = models.ManyToManyField(
         User, through='Cart', related_name='in_cart',
         verbose_name='В списке покупок у')
+    # денормализованные счётчики, меняются в api.utils.flag_add_delete
+    # и пересчитываются командой recount_recipe_flags
+    favorites_count = models.PositiveIntegerField(
+        'В избранном, раз', default=0, editable=False)
+    carts_count = models.PositiveIntegerField(
+        'В списках покупок, раз', default=0, editable=False)
+    # tsvector для полнотекстового поиска в PostgreSQL,
+    # заполняется recipes.search.update_search_index
+    search_vector = SearchVectorField(null=True, editable=False)
 
     class Meta:
         ordering = ('-pub_date',)
         constraints = (models.UniqueConstraint(fields=('author', 'name'),
                                                name='unique_recipe_check'),)
+        indexes = (
+            models.Index(fields=('-favorites_count', '-pub_date'),
+                         name='recipe_favorites_count_idx'),
+            # ключ курсорной пагинации ленты
+            models.Index(fields=('-pub_date', '-id'),
+                         name='recipe_pub_date_id_idx'),
+        )
 
     def __str__(self):
         return self.name
@@ -101,6 +129,8 @@ class Favorite(models.Model):
     """ Through-модель для добавления в избранное. """
     user = models.ForeignKey(User, on_delete=models.CASCADE)
     recipe = models.ForeignKey(Recipe, on_delete=models.CASCADE)
+    # время события — для затухания рейтинга (recipes.scores)
+    created_at = models.DateTimeField('Добавлено', auto_now_add=True)
 
     class Meta:
         constraints = (models.UniqueConstraint(fields=('user', 'recipe'),
@@ -114,6 +144,7 @@ class Cart(models.Model):
     """ Through-модель для списка покупок. """
     user = models.ForeignKey(User, on_delete=models.CASCADE)
     recipe = models.ForeignKey(Recipe, on_delete=models.CASCADE)
+    created_at = models.DateTimeField('Добавлено', auto_now_add=True)
 
     class Meta:
         constraints = (models.UniqueConstraint(fields=('user', 'recipe'),
@@ -121,3 +152,90 @@ class Cart(models.Model):
 
     def __str__(self):
         return f'{self.user} добавил {self.recipe} в список покупок.'
+
+
+class RecipeScore(models.Model):
+    """ Готовый рейтинг рецепта для лент ?ordering=popular и trending:
+    взвешенная сумма добавлений в избранное и корзину, подписок на автора
+    и самой публикации, каждое слагаемое затухает со временем.
+    Пересчитывается recipes.scores. """
+    recipe = models.OneToOneField(
+        Recipe, on_delete=models.CASCADE, primary_key=True,
+        related_name='score')
+    popular = models.FloatField('Популярность', default=0)
+    trending = models.FloatField('В тренде', default=0)
+    computed_at = models.DateTimeField('Пересчитан', auto_now=True)
+
+    class Meta:
+        indexes = (
+            # порядок ленты целиком из индекса, при равенстве — новые
+            models.Index(fields=('-popular', '-recipe'),
+                         name='recipe_score_popular_idx'),
+            models.Index(fields=('-trending', '-recipe'),
+                         name='recipe_score_trending_idx'),
+        )
+
+    def __str__(self):
+        return f'{self.recipe}: {self.popular:.2f} / {self.trending:.2f}'
+
+
+class ShoppingListItem(models.Model):
+    """ Сводка списка покупок: сколько ингредиента нужно пользователю
+    по всем рецептам в корзине. Поддерживается recipes.cart_summary. """
+    user = models.ForeignKey(
+        User, on_delete=models.CASCADE, related_name='shopping_list')
+    name = models.CharField('Ингредиент', max_length=256)
+    # единица после приведения: кг → г, л → мл
+    measurement_unit = models.CharField('Единица измерения', max_length=50)
+    amount = models.IntegerField('Количество')
+
+    class Meta:
+        ordering = ('name', 'measurement_unit')
+        constraints = (models.UniqueConstraint(
+            fields=('user', 'name', 'measurement_unit'),
+            name='unique_shopping_list_item'),)
+
+    def __str__(self):
+        return f'{self.name}: {self.amount} {self.measurement_unit}'
+
+
+class ExportJob(models.Model):
+    """ Фоновая выгрузка списка покупок в PDF (api.export_jobs).
+    Таблица и есть очередь: задачу берёт пул процессов веб-воркера
+    или команда run_export_jobs, готовый файл лежит в MEDIA_ROOT. """
+    PENDING = 'pending'
+    RUNNING = 'running'
+    DONE = 'done'
+    FAILED = 'failed'
+    STATUSES = (
+        (PENDING, 'В очереди'),
+        (RUNNING, 'Выполняется'),
+        (DONE, 'Готово'),
+        (FAILED, 'Ошибка'),
+    )
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4,
+                          editable=False)
+    user = models.ForeignKey(
+        User, on_delete=models.CASCADE, related_name='export_jobs')
+    status = models.CharField(
+        'Статус', max_length=10, choices=STATUSES, default=PENDING)
+    # хеш содержимого списка: повторный запрос того же списка
+    # получает уже поставленную задачу
+    digest = models.CharField(max_length=64)
+    file = models.FileField('Файл', upload_to='exports/', blank=True)
+    error = models.TextField('Ошибка', blank=True)
+    created_at = models.DateTimeField('Создана', auto_now_add=True)
+    started_at = models.DateTimeField('Начата', null=True, blank=True)
+    finished_at = models.DateTimeField('Завершена', null=True, blank=True)
+
+    class Meta:
+        ordering = ('-created_at',)
+        indexes = (
+            models.Index(fields=('user', 'digest'),
+                         name='export_job_user_digest'),
+            models.Index(fields=('status', 'created_at'),
+                         name='export_job_status_created'),
+        )
+
+    def __str__(self):
+        return f'{self.user}: {self.get_status_display()}'
@@ -0,0 +1,86 @@
+from collections import defaultdict
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+from recipes.models import Cart, Favorite, Recipe, RecipeScore
+from users.models import Follow
+
+# вес события в рейтинге: публикация рецепта, добавление в избранное
+# и в корзину, подписка на автора (засчитывается всем его рецептам)
+PUBLISH_WEIGHT = 1.0
+FLAG_WEIGHTS = {
+    Favorite: 3.0,
+    Cart: 2.0,
+}
+FOLLOW_WEIGHT = 1.0
+BATCH_SIZE = 2000
+
+
+class DecayedSums:
+    """ Суммы весов событий по ключу, каждое событие затухает вдвое
+    за период полураспада: популярность — медленно, тренд — быстро. """
+
+    def __init__(self, now):
+        self.now = now
+        self.half_lives = (settings.RECIPE_POPULAR_HALF_LIFE,
+                           settings.RECIPE_TRENDING_HALF_LIFE)
+        self.sums = defaultdict(lambda: [0.0, 0.0])
+
+    def add(self, key, weight, moment):
+        age = max(0.0, (self.now - moment).total_seconds())
+        sums = self.sums[key]
+        for index, half_life in enumerate(self.half_lives):
+            sums[index] += weight * 0.5 ** (age / half_life)
+
+    def get(self, key):
+        return self.sums.get(key, (0.0, 0.0))
+
+
+def compute_scores(now=None):
+    """ {id рецепта: (popular, trending)} по таблицам Favorite, Cart
+    и Follow. Один проход по каждой таблице; подписки сначала
+    суммируются по автору, потом раздаются его рецептам. """
+    now = now or timezone.now()
+    recipes = DecayedSums(now)
+    recipe_authors = {}
+    for pk, author_id, pub_date in Recipe.objects.values_list(
+            'pk', 'author_id', 'pub_date').iterator():
+        recipes.add(pk, PUBLISH_WEIGHT, pub_date)
+        recipe_authors[pk] = author_id
+    for model, weight in FLAG_WEIGHTS.items():
+        for recipe_id, created_at in model.objects.values_list(
+                'recipe_id', 'created_at').iterator():
+            recipes.add(recipe_id, weight, created_at)
+    authors = DecayedSums(now)
+    for author_id, created_at in Follow.objects.values_list(
+            'following_id', 'created_at').iterator():
+        authors.add(author_id, FOLLOW_WEIGHT, created_at)
+    return {
+        pk: tuple(own + follows for own, follows in zip(
+            recipes.get(pk), authors.get(author_id)))
+        for pk, author_id in recipe_authors.items()}
+
+
+def rebuild_scores(now=None):
+    """ Переписывает RecipeScore целиком одной транзакцией: читатели
+    до коммита видят прежние рейтинги. Возвращает число рецептов. """
+    scores = compute_scores(now)
+    with transaction.atomic():
+        RecipeScore.objects.all().delete()
+        # рецепт, созданный во время пересчёта, уже получил свою строку
+        RecipeScore.objects.bulk_create(
+            (RecipeScore(recipe_id=pk, popular=popular, trending=trending)
+             for pk, (popular, trending) in scores.items()),
+            batch_size=BATCH_SIZE, ignore_conflicts=True)
+    return len(scores)
+
+
+def create_recipe_score(recipe):
+    """ Строка рейтинга нового рецепта: пока только вес публикации,
+    остальное добавит следующий rebuild_scores. """
+    RecipeScore.objects.bulk_create(
+        (RecipeScore(recipe=recipe, popular=PUBLISH_WEIGHT,
+                     trending=PUBLISH_WEIGHT),),
+        ignore_conflicts=True)
@@ -0,0 +1,117 @@
+import re
+
+from django.contrib.postgres.search import SearchQuery, SearchRank
+from django.db import connection
+from django.db.models import F, FloatField, Value
+from django.db.models.expressions import RawSQL
+from django.db.models.functions import Cast
+
+from recipes.models import Ingredient, ReciIngredi, Recipe
+
+# полнотекстовый поиск рецептов по названию, ингредиентам и описанию.
+# PostgreSQL: колонка Recipe.search_vector с GIN-индексом и русским
+# стеммингом. SQLite (разработка и тесты): виртуальная таблица FTS5.
+SEARCH_CONFIG = 'russian'
+# поля рецепта в индексе; их изменение ловит сигнал в api.signals
+SEARCH_FIELDS = ('name', 'text')
+FTS_TABLE = 'recipes_recipe_fts'
+# веса FTS5 по колонкам (name, text, ingredients), как A/C/B в tsvector
+FTS_WEIGHTS = (10.0, 1.0, 4.0)
+# окончания, которые отрезаются вместо стемминга в FTS5 (длинные первыми)
+FTS_ENDINGS = (
+    'ями', 'ами', 'ыми', 'ими', 'ого', 'его', 'ому', 'ему', 'ой', 'ей',
+    'ий', 'ый', 'ая', 'яя', 'ое', 'ее', 'ые', 'ие', 'ую', 'юю', 'ов', 'ев',
+    'ам', 'ям', 'ах', 'ях', 'ом', 'ем', 'а', 'я', 'о', 'е', 'ы', 'и', 'у',
+    'ю', 'ь', 'й')
+FTS_MIN_STEM = 4
+UPDATE_CHUNK = 10000
+
+INGREDIENT_NAMES = (
+    f'SELECT {{aggregate}} FROM {ReciIngredi._meta.db_table} ri '
+    f'JOIN {Ingredient._meta.db_table} i ON i.id = ri.ingredient_id '
+    'WHERE ri.recipe_id = r.id')
+
+
+def _where(column, ids):
+    if ids is None:
+        return ''
+    return f' WHERE {column} IN ({", ".join(["%s"] * len(ids))})'
+
+
+def _update_postgresql(cursor, ids):
+    names = INGREDIENT_NAMES.format(aggregate="string_agg(i.name, ' ')")
+    cursor.execute(
+        f'UPDATE {Recipe._meta.db_table} r SET search_vector = '
+        f"setweight(to_tsvector('{SEARCH_CONFIG}', r.name), 'A') || "
+        f"setweight(to_tsvector('{SEARCH_CONFIG}', "
+        f"coalesce(({names}), '')), 'B') || "
+        f"setweight(to_tsvector('{SEARCH_CONFIG}', r.text), 'C')"
+        f'{_where("r.id", ids)}', ids)
+
+
+def _update_sqlite(cursor, ids):
+    names = INGREDIENT_NAMES.format(aggregate="group_concat(i.name, ' ')")
+    cursor.execute(f'DELETE FROM {FTS_TABLE}{_where("rowid", ids)}', ids)
+    cursor.execute(
+        f'INSERT INTO {FTS_TABLE} (rowid, name, text, ingredients) '
+        f"SELECT r.id, r.name, r.text, coalesce(({names}), '') "
+        f'FROM {Recipe._meta.db_table} r{_where("r.id", ids)}', ids)
+
+
+def update_search_index(recipe_ids=None):
+    """ Пересобирает поисковые данные рецептов recipe_ids (или всех).
+    Название и описание подхватывает post_save рецепта (api.signals);
+    после записи ингредиентов функцию вызывают явно: сигнал рецепта
+    срабатывает раньше, а bulk_create сигналов не шлёт. """
+    update = (_update_postgresql if connection.vendor == 'postgresql'
+              else _update_sqlite)
+    with connection.cursor() as cursor:
+        if recipe_ids is None:
+            update(cursor, None)
+            return
+        recipe_ids = list(recipe_ids)
+        for start in range(0, len(recipe_ids), UPDATE_CHUNK):
+            update(cursor, recipe_ids[start:start + UPDATE_CHUNK])
+
+
+def fts5_query(text):
+    """ Запрос FTS5 из произвольного текста: все слова обязательны,
+    у слов отрезается окончание и ищется префикс — грубая замена
+    русскому стеммеру, которого в FTS5 нет. """
+    terms = []
+    for word in re.findall(r'\w+', text.lower()):
+        for ending in FTS_ENDINGS:
+            if (word.endswith(ending)
+                    and len(word) - len(ending) >= FTS_MIN_STEM):
+                word = word[:-len(ending)]
+                break
+        terms.append(f'"{word}"*')
+    return ' '.join(terms)
+
+
+def search_recipes(queryset, text):
+    """ Рецепты, подходящие под запрос, с релевантностью search_rank
+    (чем больше, тем выше в выдаче). """
+    if connection.vendor == 'postgresql':
+        query = SearchQuery(text, config=SEARCH_CONFIG,
+                            search_type='websearch')
+        # ts_rank возвращает real; в double позиция курсора
+        # (api.pagination) совпадает с ранком строки без округления
+        return queryset.filter(search_vector=query).annotate(
+            search_rank=Cast(SearchRank(F('search_vector'), query),
+                             FloatField()))
+    match = fts5_query(text)
+    if not match:
+        return queryset.annotate(
+            search_rank=Value(0.0, output_field=FloatField())).none()
+    weights = ', '.join(str(weight) for weight in FTS_WEIGHTS)
+    # JOIN с виртуальной таблицей выражается в ORM только через extra();
+    # ранк — аннотацией, а не extra(select=...), чтобы по нему можно
+    # было фильтровать (позиция курсора)
+    return queryset.extra(
+        tables=(FTS_TABLE,),
+        where=(f'{FTS_TABLE}.rowid = {Recipe._meta.db_table}.id',
+               f'{FTS_TABLE} MATCH %s'),
+        params=(match,)).annotate(
+        search_rank=RawSQL(f'-bm25({FTS_TABLE}, {weights})', (),
+                           output_field=FloatField()))
@@ -0,0 +1,20 @@
+# Generated by Django 3.2.16 on 2026-10-18 23:30
+
+from django.db import migrations, models
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0002_alter_user_password'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='follow',
+            name='created_at',
+            field=models.DateTimeField(auto_now_add=True, default=django.utils.timezone.now, verbose_name='Подписка с'),
+            preserve_default=False,
+        ),
+    ]
@@ -58,6 +58,8 @@ class Follow(models.Model):
         User, on_delete=models.CASCADE, related_name='subscriptions')
     following = models.ForeignKey(
         User, on_delete=models.CASCADE, related_name='has_follower')
+    # время подписки — для затухания рейтинга рецептов (recipes.scores)
+    created_at = models.DateTimeField('Подписка с', auto_now_add=True)
 
     def __str__(self):
         return f'подписка на {self.following}'
@@ -3,7 +3,8 @@ from djoser.serializers import UserCreateSerializer
 from rest_framework import serializers
 # from rest_framework.validators import UniqueValidator
 
-from users.models import Follow, User
+from api.user_state import get_user_state
+from users.models import User
 # from users.validators import MeNameNotInUsername
 
 
@@ -17,9 +18,8 @@ class UserReadSerializer(serializers.ModelSerializer):
                   'last_name', 'is_subscribed')
 
     def get_is_subscribed(self, obj):
-        user = self.context.get('request', False).user
-        return (user.pk
-                and Follow.objects.filter(user=user, following=obj).exists())
+        return obj.pk in get_user_state(
+            self.context.get('request')).following
 
 
 class UserCreateSerializer(UserCreateSerializer):
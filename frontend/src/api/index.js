@@ -396,7 +396,34 @@ class Api {
           'authorization': `Token ${token}`
         }
       }
-    ).then(this.checkFileDownloadResponse)
+    ).then(res => {
+      // длинный список рендерится фоновой задачей: ждём её и качаем файл
+      if (res.status === 202) {
+        return res.json().then(job => this.waitExportJob(res.headers.get('location'), job))
+      }
+      return this.checkFileDownloadResponse(res)
+    })
+  }
+
+  waitExportJob (location, job) {
+    if (job.status === 'done') {
+      return fetch(job.file).then(this.checkFileDownloadResponse)
+    }
+    if (job.status === 'failed') {
+      return Promise.reject(job)
+    }
+    const token = localStorage.getItem('token')
+    return fetch(
+      `${location}?wait=2`,
+      {
+        method: 'GET',
+        headers: {
+          ...this._headers,
+          'authorization': `Token ${token}`
+        }
+      }
+    ).then(this.checkResponse)
+      .then(next => this.waitExportJob(location, next))
   }
 }
 